@@ -1,7 +1,12 @@
 import cv2
-import numpy as np
 import os
-import pandas as pd
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from PipelineCore.Areas import MASK_SUFFIXES, record_area, save_area_overlay, areas_table, load_geometry, geometry_areas
+from PipelineCore.MaskStore import MASK_STORE_SUFFIX, MaskStore
+from PipelineCore.PhaseExtractor import GEOMETRY_SUFFIX
+from PipelineCore.ResultsStore import ResultsStore
 
 """
 Description:
@@ -11,7 +16,8 @@ pre-generated binary masks. For each mask:
 
 1. The exact number of pixels (area) is counted directly from the binary mask.
 2. The physical area in micrometers² is computed using a known pixel-to-micron scaling factor.
-3. Overlay images are generated by drawing the detected region on the original heatmap.
+3. Optionally (overlays = "preview" or "full"), overlay images are generated by
+   drawing the detected region on the original heatmap.
 4. A structured CSV file is produced containing:
     - Area in pixels²
     - Area in micrometers²
@@ -29,99 +35,120 @@ input_folders = {
     "blue": os.path.join(base_path, "Blue", "blue_Contours-SLM-P1", "ellipse_masks")
 }
 image_folder = os.path.join(base_path, "SLM-P1-CrackZone-NEW")
+
+# Folder of <specimen>.masks files (PipelineCore/MaskStore.py, written by
+# AllPhasesContours.py with mask_format = "store"). When set, the areas are read
+# from the store index instead of decoding the PNG masks in input_folders.
+mask_store_folder = None
+
+# Folder of <specimen>.geometry.json files (the "geometry" folder written by
+# AllPhasesContours.py). When set, the areas are computed from the ellipse /
+# polygon geometry alone - no masks or images are read and no overlays are
+# drawn. exact_geometry_areas = True renders each phase and counts its pixels
+# instead of the pixel-equivalent estimate (validation).
+geometry_folder = None
+exact_geometry_areas = False
+
+# Folder of the results store (PipelineCore/ResultsStore.py, needs pyarrow).
+# When set, every specimen's areas are appended to the store under
+# category/run as soon as they are known, and the CSV below is exported from
+# the store - it then also holds the specimens of earlier runs of the same run name.
+results_store_folder = None
+category = "SLM"
+run = "P1"
+results_store = ResultsStore(results_store_folder) if results_store_folder is not None else None
+
+# Overlays: "none" (default) skips them - and the heatmap decode they need -
+# "preview" writes a <=1024 px <sample>_<color>_overlay.preview.jpg, "full" the
+# full-resolution <sample>_<color>_overlay.png. The phase overlays can also be
+# drawn later from the geometry files (python -m PipelineCore.BatchRunner overlays).
+overlays = "none"
 overlay_base_folder = os.path.join(base_path, "Overlays")
-os.makedirs(overlay_base_folder, exist_ok=True)
-
-# === Mask File Suffixes ===
-MASK_SUFFIXES = {
-    "dark_red": "_heatmap_highlighted_darkred_mask.png",
-    "red": "_heatmap_highlighted_red_mask.png",
-    "yellow": "_heatmap_highlighted_envelope_mask.png",
-    "cyan": "_heatmap_highlighted_crackzone_mask.png",
-    "blue": "_heatmap_highlighted_ellipse_mask.png"
-}
 
 # === Create Overlay Subfolders ===
 overlay_folders = {}
-for color in input_folders:
-    folder = os.path.join(overlay_base_folder, f"{color}_overlays")
-    os.makedirs(folder, exist_ok=True)
-    overlay_folders[color] = folder
-
-# === Constants ===
-PIXEL_SIZE_MICRONS = 1.34375
-MICRON_AREA_FACTOR = PIXEL_SIZE_MICRONS ** 2
-SCALE_VALUE = round(MICRON_AREA_FACTOR, 8)
+if overlays != "none":
+    for color in input_folders:
+        folder = os.path.join(overlay_base_folder, f"{color}_overlays")
+        os.makedirs(folder, exist_ok=True)
+        overlay_folders[color] = folder
 
+# Pixel size and micrometer² conversion: see PipelineCore/Areas.py
 results = {}
 
 # === Process Each Mask ===
-for color, folder in input_folders.items():
-    for fname in os.listdir(folder):
-        if not fname.endswith(".png"):
+if geometry_folder is not None:
+    for fname in sorted(os.listdir(geometry_folder)):
+        if not fname.endswith(GEOMETRY_SUFFIX):
             continue
-        mask_path = os.path.join(folder, fname)
-        mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
-        if mask is None:
+        geometry = load_geometry(os.path.join(geometry_folder, fname))
+        sample = fname[:-len(GEOMETRY_SUFFIX)].replace("_heatmap_highlighted", "")
+        for color, area_pixels in geometry_areas(geometry, exact_geometry_areas).items():
+            record_area(results, sample, color, area_pixels)
+        if results_store is not None and sample in results:
+            results_store.append({sample: results[sample]["pixels"]}, category, run, "geometry")
+elif mask_store_folder is None:
+    for color, folder in input_folders.items():
+        for fname in os.listdir(folder):
+            if not fname.endswith(".png"):
+                continue
+            mask_path = os.path.join(folder, fname)
+            mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+            if mask is None:
+                continue
+
+            base_name = fname.replace(MASK_SUFFIXES[color], "")
+            image_name = base_name + "_heatmap_highlighted.png"
+            image_path = os.path.join(image_folder, image_name)
+
+            if not os.path.exists(image_path):
+                print(f"⚠ Image not found for {image_name}")
+                continue
+
+            # ✅ Accurate pixel area from binary mask:
+            sample = base_name
+            record_area(results, sample, color, cv2.countNonZero(mask))
+
+            # Save overlay
+            if overlays != "none":
+                img = cv2.imread(image_path)
+                save_area_overlay(img, mask, overlay_folders[color], sample, color, overlays)
+
+    # The masks come one phase folder at a time, so specimens are only complete here
+    if results_store is not None:
+        results_store.append({sample: data["pixels"] for sample, data in results.items()}, category, run, "masks")
+else:
+    # Areas come from the store index; masks are only unpacked for the overlays
+    for fname in sorted(os.listdir(mask_store_folder)):
+        if not fname.endswith(MASK_STORE_SUFFIX):
             continue
+        store = MaskStore(os.path.join(mask_store_folder, fname))
 
-        base_name = fname.replace(MASK_SUFFIXES[color], "")
-        image_name = base_name + "_heatmap_highlighted.png"
+        sample = fname[:-len(MASK_STORE_SUFFIX)].replace("_heatmap_highlighted", "")
+        image_name = sample + "_heatmap_highlighted.png"
         image_path = os.path.join(image_folder, image_name)
 
         if not os.path.exists(image_path):
             print(f"⚠ Image not found for {image_name}")
             continue
 
-        img = cv2.imread(image_path)
-
-        # ✅ Accurate pixel area from binary mask:
-        area_pixels = cv2.countNonZero(mask)
-        area_microns = area_pixels * MICRON_AREA_FACTOR
-
-        sample = base_name
-        if sample not in results:
-            results[sample] = {
-                "specimen": sample,
-                "pixels": {},
-                "micrometers": {},
-                "scale": {}
-            }
-
-        results[sample]["pixels"][color] = area_pixels
-        results[sample]["micrometers"][color] = area_microns
-        results[sample]["scale"][color] = SCALE_VALUE
-
-        # Save overlay
-        overlay = img.copy()
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        if contours:
-            largest = max(contours, key=cv2.contourArea)
-            cv2.drawContours(overlay, [largest], -1, (0, 0, 0), thickness=10)
-        out_path = os.path.join(overlay_folders[color], f"{sample}_{color}_overlay.png")
-        cv2.imwrite(out_path, overlay)
+        img = cv2.imread(image_path) if overlays != "none" else None
+
+        for color, area_pixels in store.areas().items():
+            record_area(results, sample, color, area_pixels)
+
+            if overlays != "none":
+                save_area_overlay(img, store.mask(color), overlay_folders[color], sample, color, overlays)
+
+        if results_store is not None and sample in results:
+            results_store.append({sample: results[sample]["pixels"]}, category, run, "mask_store")
 
 # === Convert to DataFrame ===
-records = []
-for sample, data in results.items():
-    row = [sample]
-    for c in ["dark_red", "red", "yellow", "cyan", "blue"]:
-        row.append(data["pixels"].get(c, 0))
-    for c in ["dark_red", "red", "yellow", "cyan", "blue"]:
-        row.append(data["micrometers"].get(c, 0))
-    for c in ["dark_red", "red", "yellow", "cyan", "blue"]:
-        row.append(data["scale"].get(c, 0))
-    records.append(row)
-
-multi_columns = [
-    ("", "specimen"),
-    ("Pixles", "dark_red"), ("Pixles", "red"), ("Pixles", "yellow"), ("Pixles", "cyan"), ("Pixles", "blue"),
-    ("micrometer^2", "dark_red"), ("micrometer^2", "red"), ("micrometer^2", "yellow"), ("micrometer^2", "cyan"), ("micrometer^2", "blue"),
-    ("scale factor", "dark_red"), ("scale factor", "red"), ("scale factor", "yellow"), ("scale factor", "cyan"), ("scale factor", "blue")
-]
-
-df = pd.DataFrame(records, columns=pd.MultiIndex.from_tuples(multi_columns))
 output_csv = os.path.join(base_path, "Internal_Contour_Areas_FromMasks_Structured.csv")
-df.to_csv(output_csv, index=False)
+if results_store is not None:
+    results_store.export_csv(output_csv, category=category, run=run)
+else:
+    df = areas_table(results)
+    df.to_csv(output_csv, index=False)
 
-print("\n🎯 Done! Exact pixel-based CSV + overlays saved to 'Overlays' and CSV.")
+print("\n🎯 Done! Exact pixel-based CSV" + (" + overlays saved to 'Overlays' and CSV." if overlays != "none" else " saved."))
@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PipelineCore.Descriptors import write_descriptor_table
+from PipelineCore.PhaseExtractor import PHASES, PHASE_PARAMS, phases_file
+
+"""
+Description:
+Single-pass replacement for running DarkRedContour.py, RedContour, YellowContour.py,
+CyanContour.py and BlueContours.py one after the other. Each highlighted heatmap is
+decoded and converted to HSV once, the pink crack-zone ellipse is fitted once, and
+the masks (and, if asked for, overlays) of all five phases are written in one go, using the same
+file names as the individual scripts (one sub-folder per phase).
+
+To run it over a process pool:
+    python -m PipelineCore.BatchRunner phases <input_folder> <output_folder>
+"""
+
+# === Paths ===
+base_path = "C:\\Users\\shifa\\final project\\Enternal_Contours"
+input_folder = os.path.join(base_path, "SLM-P3-CrackZone-NEW")
+output_folder = os.path.join(base_path, "AllPhases_Contours-SLM-P3")
+
+# === Parameters
+# Defaults live in PipelineCore/PhaseExtractor.py. Use DARK_RED_ELLIPSE_PARAMS
+# for "dark_red" to get the DrakRedContour-2.py variant.
+phase_params = {phase: dict(PHASE_PARAMS[phase]) for phase in PHASES}
+
+# "png": one mask PNG per phase (layout of the individual scripts)
+# "store": all five masks in one masks/<name>.masks file (see PipelineCore/MaskStore.py)
+mask_format = "png"
+
+# Overlays: "none" (the geometry/ files are enough to draw them later with
+# python -m PipelineCore.BatchRunner overlays ...), "preview" (<=1024 px JPEG)
+# or "full" (the full-resolution PNGs of the individual scripts)
+overlays = "none"
+
+# The yellow contour points are in geometry/; write_contour_csv = True also writes
+# the per-image yellow/contours_csv/<name>_contour.csv files
+write_contour_csv = False
+
+# === Process All Images ===
+for filename in os.listdir(input_folder):
+    if not filename.lower().endswith(".png"):
+        continue
+
+    print(phases_file(filename, input_folder, output_folder, PHASES, phase_params, mask_format, overlays,
+                      write_contour_csv))
+
+# === Shape Descriptors (one row per specimen x phase, from the geometry files) ===
+descriptors_path, rows = write_descriptor_table(os.path.join(output_folder, "geometry"))
+print(f"📊 Descriptor table: {descriptors_path} ({rows} rows)")
+
+print("🎯 All phase contours and masks generated successfully!")
@@ -1,6 +1,21 @@
-import cv2
-import numpy as np
 import os
+import sys
+import cv2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PipelineCore.Montage import load_thumbnail, montage
+from PipelineCore.PhaseExtractor import PREVIEW_SUFFIX
+
+"""
+Description:
+Summary montage per sample: the original image, the segmented inner shape,
+the highlighted heatmap and the five phase overlays at 512x512 with a title
+above each, 4 per row, under the sample name. The 512x512 thumbnails are
+cached in a `.thumbnails` folder next to each image (see
+PipelineCore/Montage.py), so re-building the montages of a campaign only
+decodes small images. Phase scripts run with overlays = "preview" write a
+`.preview.jpg` instead of the overlay PNG; it is used when the PNG is missing.
+"""
 
 # === Base Paths ===
 base_path = r"C:\Users\shifa\final project"
@@ -21,10 +36,16 @@ output_folder = os.path.join(base_path, "internal contours results_SLM-P3")
 os.makedirs(output_folder, exist_ok=True)
 
 # === Text Parameters ===
-font = cv2.FONT_HERSHEY_SIMPLEX
-font_scale = 1.0
-thickness = 2
-text_color = (0, 0, 0)  # Black
+title_style = {"height": 40, "org": (20, 30), "font_scale": 1.0, "thickness": 2}
+sample_style = {"height": 70, "org": (30, 50), "font_scale": 1.5, "thickness": 3}
+
+
+
+def overlay_or_preview(path):
+    """The overlay PNG, or its preview JPEG when only the preview was written."""
+    preview = os.path.splitext(path)[0] + PREVIEW_SUFFIX
+    return preview if not os.path.exists(path) and os.path.exists(preview) else path
+
 
 # === Process ===
 for filename in os.listdir(original_folder):
@@ -34,7 +55,7 @@ for filename in os.listdir(original_folder):
     name_base = filename[:-4]  # Strip '.png'
 
     # Special check for dark red (dash vs underscore fallback)
-    dark_red_path = os.path.join(contour_folders["Dark Red Contour"], f"{name_base}_heatmap_highlighted_darkred_overlay.png")
+    dark_red_path = overlay_or_preview(os.path.join(contour_folders["Dark Red Contour"], f"{name_base}_heatmap_highlighted_darkred_overlay.png"))
     if not os.path.exists(dark_red_path):
         alt_name_base = name_base.replace('-', '_')
         dark_red_path = os.path.join(contour_folders["Dark Red Contour"], f"{alt_name_base}_heatmap_highlighted_overlay_clipped.png")
@@ -45,10 +66,10 @@ for filename in os.listdir(original_folder):
         "Segmented Inner Shape": os.path.join(inner_folder, f"{name_base}_segmented_inner.png"),
         "Heatmap + Crack Zone": os.path.join(heatmap_folder, f"{name_base}_heatmap_highlighted.png"),
         "Dark Red Contour": dark_red_path,
-        "Red Contour": os.path.join(contour_folders["Red Contour"], f"{name_base}_heatmap_highlighted_red_overlay.png"),
-        "Yellow Contour": os.path.join(contour_folders["Yellow Contour"], f"{name_base}_heatmap_highlighted_envelope_overlay.png"),
-        "Cyan Contour": os.path.join(contour_folders["Cyan Contour"], f"{name_base}_heatmap_highlighted_crackzone_contour_overlay.png"),
-        "Blue Contour": os.path.join(contour_folders["Blue Contour"], f"{name_base}_heatmap_highlighted_ellipse_overlay.png"),
+        "Red Contour": overlay_or_preview(os.path.join(contour_folders["Red Contour"], f"{name_base}_heatmap_highlighted_red_overlay.png")),
+        "Yellow Contour": overlay_or_preview(os.path.join(contour_folders["Yellow Contour"], f"{name_base}_heatmap_highlighted_envelope_overlay.png")),
+        "Cyan Contour": overlay_or_preview(os.path.join(contour_folders["Cyan Contour"], f"{name_base}_heatmap_highlighted_crackzone_contour_overlay.png")),
+        "Blue Contour": overlay_or_preview(os.path.join(contour_folders["Blue Contour"], f"{name_base}_heatmap_highlighted_ellipse_overlay.png")),
     }
 
     images = []
@@ -56,52 +77,16 @@ for filename in os.listdir(original_folder):
 
     for label, path in file_mappings.items():
         if os.path.exists(path):
-            img = cv2.imread(path)
-            img = cv2.resize(img, (512, 512))
-            images.append(img)
+            images.append(load_thumbnail(path))
             titles.append(label)
         else:
             print(f"⚠ {label} NOT found: {path}")
 
     # Combine images if any exist
     if images:
-        combined_rows = []
-        row = []
-
-        for i, (img, title) in enumerate(zip(images, titles)):
-            # Create title bar
-            title_bar = np.ones((40, img.shape[1], 3), dtype=np.uint8) * 255
-            cv2.putText(title_bar, title, (20, 30), font, font_scale, text_color, thickness, cv2.LINE_AA)
-            full_img = np.vstack((title_bar, img))
-            row.append(full_img)
-
-            # Group 4 per row (2x4 layout)
-            if (i + 1) % 4 == 0 or (i + 1) == len(images):
-                combined_row = np.hstack(row)
-                combined_rows.append(combined_row)
-                row = []
-
-        # === Pad rows to equal width ===
-        max_width = max(row_img.shape[1] for row_img in combined_rows)
-        padded_rows = []
-        for row_img in combined_rows:
-            height, width, channels = row_img.shape
-            if width < max_width:
-                pad_width = max_width - width
-                padding = np.ones((height, pad_width, 3), dtype=np.uint8) * 255  # White padding
-                padded_row = np.hstack((row_img, padding))
-            else:
-                padded_row = row_img
-            padded_rows.append(padded_row)
-
-        combined_all = np.vstack(padded_rows)
-
-        # Add sample title bar
-        total_width = combined_all.shape[1]
-        sample_title_bar = np.ones((70, total_width, 3), dtype=np.uint8) * 255
-        cv2.putText(sample_title_bar, f"Sample: {name_base}", (30, 50), font, 1.5, text_color, 3, cv2.LINE_AA)
-
-        final_img = np.vstack((sample_title_bar, combined_all))
+        # 2x4 layout, short rows padded with white, sample name on top
+        final_img = montage(images, titles, per_row=4, bar=title_style,
+                            header=f"Sample: {name_base}", header_bar=sample_style)
 
         # Save final image
         save_name = f"{name_base}_combined.png"
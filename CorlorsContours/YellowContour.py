@@ -1,7 +1,10 @@
 import cv2 
-import numpy as np
 import os
-import csv
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PipelineCore.ContourArchive import CONTOUR_ARCHIVE_SUFFIX, ContourArchiveWriter
+from PipelineCore.PhaseExtractor import PHASE_PARAMS, PhaseSkipped, build_context, extract_phase, save_phase, save_contour_csv
 
 # in this code we find the yellow internal contour of the crack zone
 # === Paths ====
@@ -10,20 +13,23 @@ input_folder = os.path.join(base_path, "SLM-P3-CrackZone-NEW")
 output_folder = os.path.join(base_path, "yellow Contours_SLM-P3")
 os.makedirs(output_folder, exist_ok=True)
 csv_folder = os.path.join(output_folder, "contours_csv")
-os.makedirs(csv_folder, exist_ok=True)
 
-# === Color Ranges (HSV)
-combined_ranges = [
-    ([0, 50, 50], [10, 255, 255]),     # Red low
-    ([160, 50, 50], [180, 255, 255]),  # Red high
-    ([11, 80, 80], [22, 255, 255]),    # Orange
-    ([23, 90, 90], [38, 255, 255]),    # Yellow
-    ([85, 50, 80], [105, 255, 255])    # Cyan
-]
+# The contour points of all images go into one archive (PipelineCore/ContourArchive.py),
+# output_folder/yellow.contours; write_contour_csv = True also writes the old
+# per-image contours_csv/<name>_contour.csv files
+contour_archive_path = os.path.join(output_folder, "yellow" + CONTOUR_ARCHIVE_SUFFIX)
+write_contour_csv = False
+if write_contour_csv:
+    os.makedirs(csv_folder, exist_ok=True)
+contours = ContourArchiveWriter()
+
+# === Parameters (color ranges, morphological kernel, MIN_AREA)
+# Defaults live in PipelineCore/PhaseExtractor.py; adjust the copy here as needed.
+yellow_params = dict(PHASE_PARAMS["yellow"])
 
-# === Morphological Kernel and Contour Area Filter
-kernel = np.ones((3, 3), np.uint8)
-MIN_AREA = 150
+# Overlays: "preview" (<=1024 px JPEG, enough for the CombiningColorsResults.py
+# montages), "full" (the full-resolution PNG) or "none"
+overlays = "preview"
 
 # === Process All Images ===
 for filename in os.listdir(input_folder):
@@ -32,60 +38,25 @@ for filename in os.listdir(input_folder):
 
     img_path = os.path.join(input_folder, filename)
     img = cv2.imread(img_path)
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-    # === Step 1: Ellipse mask from pink 
-    ellipse_mask = np.zeros_like(gray)
-    pink_mask = cv2.inRange(hsv, (140, 50, 50), (170, 255, 255))  # HSV range for pink
-    pink_mask = cv2.morphologyEx(pink_mask, cv2.MORPH_CLOSE, kernel)
-    contours_pink, _ = cv2.findContours(pink_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if contours_pink:
-        largest = max(contours_pink, key=cv2.contourArea)
-        if len(largest) >= 5:
-            ellipse = cv2.fitEllipse(largest)
-            cv2.ellipse(ellipse_mask, ellipse, 255, -1)
-        else:
-            print(f"⚠ Not enough points for ellipse in {filename}")
-            continue
-    else:
-        print(f"⚠ No pink ellipse found in {filename}")
-        continue
-
-    # === Step 2: Combine masks from all ranges
-    combined_mask = np.zeros_like(gray)
-    for lower, upper in combined_ranges:
-        combined_mask |= cv2.inRange(hsv, np.array(lower), np.array(upper))
-
-    combined_mask = cv2.bitwise_and(combined_mask, ellipse_mask)
-    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
-    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel)
-
-    # === Step 3: Extract largest contour (true envelope)
-    contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if not contours:
-        print(f"❌ No contours found in {filename}")
-        continue
 
-    largest = max(contours, key=cv2.contourArea)
-    if cv2.contourArea(largest) < MIN_AREA:
-        print(f"⚠ Contour too small in {filename}")
+    # === Pink ellipse -> combined colors inside ellipse -> largest contour (true envelope)
+    try:
+        result = extract_phase(build_context(img, [yellow_params]), "yellow", yellow_params)
+    except PhaseSkipped as reason:
+        print(f"{reason} in {filename}")
         continue
 
-    # === Step 4: Save overlay image with thick black contour
-    overlay = img.copy()
-    cv2.drawContours(overlay, [largest], -1, (0, 0, 0), thickness=10)
-    out_path = os.path.join(output_folder, f"{filename[:-4]}_envelope_overlay.png")
-    cv2.imwrite(out_path, overlay)
+    # === Save overlay image with thick black contour
+    save_phase(img, result, output_folder, filename[:-4], write_overlay=overlays, write_mask=False)
 
-    # === Step 5: Save contour points to CSV
-    csv_path = os.path.join(csv_folder, f"{filename[:-4]}_contour.csv")
-    with open(csv_path, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["x", "y"])
-        for point in largest.squeeze():
-            writer.writerow(point)
+    # === Keep the contour points for the archive (and CSV)
+    contours.add(filename[:-4], "yellow", result["points"])
+    if write_contour_csv:
+        csv_path = os.path.join(csv_folder, f"{filename[:-4]}_contour.csv")
+        save_contour_csv(result, csv_path)
 
     print(f"✅ Saved contour and overlay for {filename}")
 
+count = contours.write(contour_archive_path, {"source": input_folder})
+print(f"📦 {count} contours saved to {contour_archive_path}")
 print("🎯 All envelopes generated and saved.")
@@ -1,14 +1,32 @@
 import cv2
 import numpy as np
 import os
+import sys
 from scipy.spatial import ConvexHull
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PipelineCore.ColorClassifier import HSVLookupClassifier
+from PipelineCore.Morphology import closing, opening
+
 # === Paths ===
 base_path = "C:\\Users\\shifa\\final project\\Enternal_Contours"
 input_folder = os.path.join(base_path, "SLM-Problamtic-HM")
 output_folder = os.path.join(base_path, "SLM-output")
 os.makedirs(output_folder, exist_ok=True)
 
+# === Extended Warm HSV range (red to yellow) ===
+lower_red1 = np.array([0, 70, 50])
+upper_red1 = np.array([10, 255, 255])
+lower_red2 = np.array([160, 70, 50])
+upper_red2 = np.array([180, 255, 255])
+lower_orange = np.array([11, 70, 50])
+upper_orange = np.array([35, 255, 255])
+
+# Warm zone = red OR orange, labelled with a single lookup per image
+classifier = HSVLookupClassifier({
+    "warm": [(lower_red1, upper_red1), (lower_red2, upper_red2), (lower_orange, upper_orange)],
+})
+
 # === Process each .png heatmap ===
 for image_name in os.listdir(input_folder):
     if not image_name.lower().endswith(".png"):
@@ -17,30 +35,15 @@ for image_name in os.listdir(input_folder):
     input_path = os.path.join(input_folder, image_name)
     output_path = os.path.join(output_folder, image_name.replace("_heatmap", "_heatmap_highlighted"))
 
-    # Load image and convert to HSV
+    # Load image
     img = cv2.imread(input_path)
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-
-    # === Extended Warm HSV range (red to yellow) ===
-    lower_red1 = np.array([0, 70, 50])
-    upper_red1 = np.array([10, 255, 255])
-    lower_red2 = np.array([160, 70, 50])
-    upper_red2 = np.array([180, 255, 255])
-    lower_orange = np.array([11, 70, 50])
-    upper_orange = np.array([35, 255, 255])
-
-    # Create warm zone masks
-    mask_red = cv2.bitwise_or(
-        cv2.inRange(hsv, lower_red1, upper_red1),
-        cv2.inRange(hsv, lower_red2, upper_red2)
-    )
-    mask_orange = cv2.inRange(hsv, lower_orange, upper_orange)
-    heat_mask = cv2.bitwise_or(mask_red, mask_orange)
+
+    # Create warm zone mask
+    heat_mask = classifier.mask(classifier.classify(img), "warm")
 
     # === Morphological smoothing ===
-    kernel = np.ones((9, 9), np.uint8)
-    heat_mask = cv2.morphologyEx(heat_mask, cv2.MORPH_CLOSE, kernel)
-    heat_mask = cv2.morphologyEx(heat_mask, cv2.MORPH_OPEN, kernel)
+    heat_mask = closing(heat_mask, 9)
+    heat_mask = opening(heat_mask, 9)
 
     # === Find and draw largest contour ===
     contours, _ = cv2.findContours(heat_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
@@ -0,0 +1,85 @@
+import os
+import json
+import struct
+import numpy as np
+
+"""
+Description:
+Single-file container of named numpy blocks with a JSON index at the end.
+
+    [MAGIC][block 0][block 1]...[JSON index][index length: uint64][MAGIC]
+
+Blocks are stored raw and 64-byte aligned, so a reader can memory-map any one
+of them without reading the rest of the file; the index holds every block's
+offset, dtype and shape plus free-form metadata (per block and for the whole
+archive), so summaries can be read without touching the data at all.
+Archives are written to a temporary file and renamed into place.
+"""
+
+MAGIC = b"FPARCH01"
+ALIGNMENT = 64
+
+
+def write_archive(path, blocks, meta=None):
+    """
+    Writes an archive.
+
+    Args:
+        path (str): Output file.
+        blocks (dict): name -> (ndarray or None, metadata dict). None stores
+            only the metadata (e.g. an empty mask).
+        meta (dict): Archive-level metadata.
+    """
+    index = {"meta": meta or {}, "blocks": {}}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        for name, (array, block_meta) in blocks.items():
+            entry = {"meta": block_meta or {}}
+            if array is not None and array.size:
+                f.write(b"\0" * (-f.tell() % ALIGNMENT))
+                array = np.ascontiguousarray(array)
+                entry.update(offset=f.tell(), dtype=array.dtype.str, shape=list(array.shape))
+                f.write(array.tobytes())
+            index["blocks"][name] = entry
+
+        footer = json.dumps(index).encode("utf-8")
+        f.write(footer)
+        f.write(struct.pack("<Q", len(footer)))
+        f.write(MAGIC)
+    os.replace(tmp_path, path)
+
+
+class ArchiveReader:
+    """
+    Reads an archive's index on open; block data is memory-mapped on demand.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an archive")
+            f.seek(-(8 + len(MAGIC)), os.SEEK_END)
+            footer_length = struct.unpack("<Q", f.read(8))[0]
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is truncated")
+            f.seek(-(8 + len(MAGIC) + footer_length), os.SEEK_END)
+            index = json.loads(f.read(footer_length).decode("utf-8"))
+        self.meta = index["meta"]
+        self.blocks = index["blocks"]
+
+    @property
+    def names(self):
+        return list(self.blocks)
+
+    def block_meta(self, name):
+        return self.blocks[name]["meta"]
+
+    def array(self, name):
+        """Read-only memory map of a block, or None if it stores no data."""
+        entry = self.blocks[name]
+        if "offset" not in entry:
+            return None
+        return np.memmap(self.path, dtype=np.dtype(entry["dtype"]), mode="r",
+                         offset=entry["offset"], shape=tuple(entry["shape"]))
@@ -0,0 +1,227 @@
+import os
+import json
+import math
+import cv2
+import numpy as np
+import pandas as pd
+
+from PipelineCore.PhaseExtractor import PREVIEW_QUALITY, PREVIEW_SUFFIX, render_mask, render_preview
+
+"""
+Description:
+Phase area bookkeeping shared by Area-Colors.py and the stage graph: pixel
+areas of the phase masks, their conversion to micrometers² and the
+structured (MultiIndex) per-specimen CSV table.
+
+Areas can also be computed from the phase geometry written by the phase stage
+(`<name>.geometry.json`, see PhaseExtractor.save_geometry) without any image
+data. A filled raster counts every pixel the boundary touches, so the
+geometric area (shoelace for polygons, pi*w*h/4 for ellipses) is converted to
+a pixel-equivalent count by adding half the boundary length in pixel steps
+(max(|dx|, |dy|) per edge) plus one, as for lattice polygons (Pick's theorem).
+This matches cv2.countNonZero of the rendered masks to ~0.01% for the polygon
+phases and ~0.1% for the ellipse phases; exact=True renders and counts instead.
+"""
+
+# === Constants ===
+PIXEL_SIZE_MICRONS = 1.34375
+MICRON_AREA_FACTOR = PIXEL_SIZE_MICRONS ** 2
+SCALE_VALUE = round(MICRON_AREA_FACTOR, 8)
+
+AREA_PHASES = ("dark_red", "red", "yellow", "cyan", "blue")
+
+# === Mask File Suffixes ===
+MASK_SUFFIXES = {
+    "dark_red": "_heatmap_highlighted_darkred_mask.png",
+    "red": "_heatmap_highlighted_red_mask.png",
+    "yellow": "_heatmap_highlighted_envelope_mask.png",
+    "cyan": "_heatmap_highlighted_crackzone_mask.png",
+    "blue": "_heatmap_highlighted_ellipse_mask.png"
+}
+
+
+def record_area(results, sample, color, area_pixels):
+    """Adds the pixel area of one phase of one specimen to `results`."""
+    if sample not in results:
+        results[sample] = {
+            "specimen": sample,
+            "pixels": {},
+            "micrometers": {},
+            "scale": {}
+        }
+
+    results[sample]["pixels"][color] = area_pixels
+    results[sample]["micrometers"][color] = area_pixels * MICRON_AREA_FACTOR
+    results[sample]["scale"][color] = SCALE_VALUE
+
+
+def phase_areas(phase_results, shape):
+    """
+    Pixel area of every extracted phase, counted on the same filled masks the
+    phase scripts write.
+
+    Args:
+        phase_results (dict): phase -> geometry from extract_all_phases.
+        shape (tuple): Image (height, width).
+    """
+    return {phase: cv2.countNonZero(render_mask(result, shape)) for phase, result in phase_results.items()}
+
+
+# === Geometry Areas ===
+ELLIPSE_SAMPLES = 720
+
+
+def load_geometry(path):
+    """
+    Reads a `<name>.geometry.json` file.
+
+    Returns:
+        dict: "specimen", "shape" and "phases" (phase -> geometry in the form
+        returned by the phase extractors, ready for render_mask).
+    """
+    with open(path) as f:
+        geometry = json.load(f)
+    for phase, record in geometry["phases"].items():
+        result = {"kind": record["kind"], "thickness": record["thickness"], "phase": phase}
+        if record["kind"] == "ellipse":
+            (cx, cy), (w, h), angle = record["ellipse"]
+            result["ellipse"] = ((cx, cy), (w, h), angle)
+        else:
+            result["points"] = np.array(record["points"], np.int32).reshape(-1, 1, 2)
+        geometry["phases"][phase] = result
+    return geometry
+
+
+def _boundary_steps(x, y):
+    """Length of a closed boundary in pixel steps (max(|dx|, |dy|) per edge)."""
+    return np.maximum(np.abs(np.diff(x, append=x[:1])), np.abs(np.diff(y, append=y[:1]))).sum()
+
+
+def _shoelace(x, y):
+    return abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))) / 2
+
+
+def _clip_to_frame(x, y, shape):
+    """Sutherland-Hodgman clip of a closed polygon to the pixel centres of the frame."""
+    h, w = shape
+    for axis, limit, keep_below in ((0, 0, False), (0, w - 1, True), (1, 0, False), (1, h - 1, True)):
+        points = np.stack([x, y], axis=1).astype(np.float64)
+        coord = points[:, axis]
+        inside = coord <= limit if keep_below else coord >= limit
+        if inside.all():
+            continue
+        if not inside.any():
+            return np.empty(0), np.empty(0)
+        following = np.roll(points, -1, axis=0)
+        crossing = inside != np.roll(inside, -1)
+        # Edges that do not cross get nan/inf here and are never selected
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = (limit - coord) / (following[:, axis] - coord)
+            crossings = points + t[:, None] * (following - points)
+        # Each vertex contributes itself if inside, then its edge's crossing point
+        x, y = np.stack([points, crossings], axis=1)[np.stack([inside, crossing], axis=1)].T
+    return x, y
+
+
+def geometry_area(result, shape=None):
+    """
+    Area of a phase geometry.
+
+    Args:
+        result (dict): Phase geometry (ellipse or polygon).
+        shape (tuple): Image (height, width); the parts of the geometry
+            outside the frame are clipped off, as when rendering the mask.
+
+    Returns:
+        tuple: (geometric area, pixel-equivalent area), both in pixels.
+    """
+    if result["kind"] == "ellipse":
+        # Axis names distinct from the frame's: the frame size must not replace them
+        (cx, cy), (axis_w, axis_h), angle = result["ellipse"]
+        t = np.linspace(0, 2 * math.pi, ELLIPSE_SAMPLES, endpoint=False)
+        cos_a, sin_a = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        ex, ey = axis_w / 2 * np.cos(t), axis_h / 2 * np.sin(t)
+        x, y = cx + ex * cos_a - ey * sin_a, cy + ex * sin_a + ey * cos_a
+    else:
+        points = result["points"].reshape(-1, 2).astype(np.int64)
+        x, y = points[:, 0], points[:, 1]
+
+    if shape is not None:
+        frame_h, frame_w = shape[:2]
+        if x.min() < 0 or y.min() < 0 or x.max() > frame_w - 1 or y.max() > frame_h - 1:
+            x, y = _clip_to_frame(x, y, (frame_h, frame_w))
+            if len(x) < 3:
+                return 0.0, 0.0
+            area = _shoelace(x, y)
+            return area, area + _boundary_steps(x, y) / 2 + 1
+
+    if result["kind"] == "ellipse":
+        area = math.pi * axis_w * axis_h / 4
+    else:
+        area = _shoelace(x, y)
+    return area, area + _boundary_steps(x, y) / 2 + 1
+
+
+def geometry_areas(geometry, exact=False):
+    """
+    Pixel area of every phase of a geometry file (see load_geometry).
+
+    Args:
+        geometry (dict): Output of load_geometry.
+        exact (bool): Render each phase and count its pixels (the values of
+            phase_areas) instead of the pixel-equivalent estimate.
+    """
+    if exact:
+        return phase_areas(geometry["phases"], tuple(geometry["shape"]))
+    shape = tuple(geometry["shape"])
+    return {phase: round(geometry_area(result, shape)[1]) for phase, result in geometry["phases"].items()}
+
+
+def largest_contour_overlay(img, mask, thickness=10):
+    """Copy of `img` with the largest external contour of `mask` drawn in black."""
+    overlay = img.copy()
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        largest = max(contours, key=cv2.contourArea)
+        cv2.drawContours(overlay, [largest], -1, (0, 0, 0), thickness=thickness)
+    return overlay
+
+
+def save_area_overlay(img, mask, folder, sample, color, tier="full", thickness=10):
+    """
+    Writes Area-Colors.py's overlay of one phase: `<sample>_<color>_overlay.png`
+    ("full", largest_contour_overlay) or a small `.preview.jpg` ("preview",
+    the contour drawn on the shrunk image, see PhaseExtractor.render_preview).
+    """
+    if tier == "full":
+        cv2.imwrite(os.path.join(folder, f"{sample}_{color}_overlay.png"), largest_contour_overlay(img, mask, thickness))
+        return
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    points = max(contours, key=cv2.contourArea) if contours else np.zeros((0, 1, 2), np.int32)
+    preview = render_preview(img, {"kind": "contour", "points": points, "thickness": thickness})
+    cv2.imwrite(os.path.join(folder, f"{sample}_{color}_overlay{PREVIEW_SUFFIX}"), preview,
+                [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_QUALITY])
+
+
+def areas_table(results):
+    """
+    Structured table with one row per specimen: pixel areas, micrometer²
+    areas and scale factors of the five phases (0 where a phase is missing).
+    """
+    records = []
+    for sample, data in results.items():
+        row = [sample]
+        for c in AREA_PHASES:
+            row.append(data["pixels"].get(c, 0))
+        for c in AREA_PHASES:
+            row.append(data["micrometers"].get(c, 0))
+        for c in AREA_PHASES:
+            row.append(data["scale"].get(c, 0))
+        records.append(row)
+
+    multi_columns = [("", "specimen")]
+    multi_columns += [("Pixles", c) for c in AREA_PHASES]
+    multi_columns += [("micrometer^2", c) for c in AREA_PHASES]
+    multi_columns += [("scale factor", c) for c in AREA_PHASES]
+
+    return pd.DataFrame(records, columns=pd.MultiIndex.from_tuples(multi_columns))
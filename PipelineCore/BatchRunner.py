@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+
+from PipelineCore import Instrument
+
+"""
+Description:
+Runs a per-file pipeline stage over a directory with a process pool.
+
+The stage scripts loop over os.listdir() on a single core. Here every file is
+handed to a worker process instead, with:
+
+    - at most `max_in_flight` files submitted at a time (one decoded 4096^2
+      frame each), so memory stays bounded however large the directory is;
+    - cv2.setNumThreads(cv2_threads) in every worker, so N workers do not each
+      start a full OpenCV thread pool;
+    - per-file isolation: an exception is recorded with its traceback and the
+      batch goes on; a worker that dies (e.g. out of memory) only takes its
+      own file down - the pool is restarted, and the files that were in
+      flight with it are retried one at a time on a single worker, so only
+      the file that crashes on its own is reported as failed;
+    - with --trace, one JSON-lines record per file (wall/CPU time, peak memory,
+      bytes, megapixels/s; see Instrument.py) and a summary at the end.
+
+After a phases (or pipeline) batch, the shape descriptor table of every
+specimen in the output folder is written to `descriptors.csv` (Descriptors.py),
+and the contour points of all polygon phases to `contours.contours`
+(ContourArchive.py); --contour-csv also writes the per-specimen yellow
+contour CSV files of the scripts.
+With --results-store, the pipeline stage also appends every specimen's phase
+areas to a results store (ResultsStore.py) as soon as the specimen is done.
+
+Stages (per-file functions, importable so they can be pickled):
+    ingest     PipelineCore.Ingest.ingest_file          (notebook conversion + cropping cells)
+    heatmaps   PipelineCore.Heatmap.heatmap_file        (notebook process_heatmaps)
+    tiled-heatmaps  PipelineCore.Heatmap.tiled_heatmap_file  (raw TIFFs too large to decode whole)
+    crackzone  PipelineCore.CrackZone.crack_zone_file   (ExtractCrackArea.py)
+    phases     PipelineCore.PhaseExtractor.phases_file  (AllPhasesContours.py)
+    overlays   PipelineCore.Overlays.overlays_file      (phase overlays from the geometry, on request)
+    pipeline   PipelineCore.StageGraph.specimen_file    (whole in-memory chain per raw image)
+
+Usage (from the repository root):
+    python -m PipelineCore.BatchRunner ingest <raw> <images>
+    python -m PipelineCore.BatchRunner heatmaps <images> <heatmaps> --masks <masks>
+    python -m PipelineCore.BatchRunner tiled-heatmaps <raw> <heatmaps> --tile-size 2048
+    python -m PipelineCore.BatchRunner crackzone <heatmaps> <highlighted> --workers 8
+    python -m PipelineCore.BatchRunner phases <highlighted> <phases> --report report.json --trace trace.jsonl
+    python -m PipelineCore.BatchRunner overlays <highlighted> <overlays> --geometry <phases>/geometry --overlays preview
+    python -m PipelineCore.BatchRunner pipeline <raw> <results> --write heatmap,phases,areas --cache <cache>
+    python -m PipelineCore.BatchRunner pipeline <raw> <results> --results-store <store> --category SLM --run P1
+"""
+
+
+class FileSkipped(Exception):
+    """Raised by a per-file stage when a file has nothing to process; the message says why."""
+
+
+def _init_worker(cv2_threads):
+    cv2.setNumThreads(cv2_threads)
+
+
+def _run_one(task, filename, task_kwargs):
+    """Runs one file inside a worker. Never raises, so a bad file cannot abort the batch."""
+    start = time.perf_counter()
+    with Instrument.span(task.__name__.removesuffix("_file"), specimen=filename) as record:
+        try:
+            message = task(filename, **task_kwargs)
+            status = "done"
+        except FileSkipped as reason:
+            status, message = "skipped", str(reason)
+        except Exception:
+            status, message = "failed", traceback.format_exc()
+        record["status"] = status
+    return {"file": filename, "status": status, "message": message,
+            "seconds": round(time.perf_counter() - start, 3)}
+
+
+def _print_outcome(outcome):
+    if outcome["status"] == "done":
+        print(f"✔ {outcome['file']} ({outcome['seconds']} s): {outcome['message']}")
+    elif outcome["status"] == "skipped":
+        print(outcome["message"])
+    else:
+        print(f"❌ {outcome['file']} failed: {outcome['message'].strip().splitlines()[-1]}")
+
+
+def list_inputs(folder, extensions=(".png",)):
+    """Sorted file names in `folder` with one of the given (lower-case) extensions."""
+    return sorted(f for f in os.listdir(folder) if f.lower().endswith(extensions))
+
+
+def _run_pool(task, filenames, task_kwargs, workers, max_in_flight, cv2_threads):
+    """
+    Runs the files on a process pool, restarting the pool when a worker dies.
+
+    Yields:
+        tuple: (filename, outcome); outcome is None for the files that were in
+        flight when the pool broke (any of them may have killed the worker).
+    """
+    queue = list(reversed(filenames))
+    while queue:
+        crashed = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cv2_threads,)) as pool:
+            pending = {}
+            while queue or pending:
+                while queue and len(pending) < max_in_flight and not crashed:
+                    filename = queue.pop()
+                    pending[pool.submit(_run_one, task, filename, task_kwargs)] = filename
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    filename = pending.pop(future)
+                    try:
+                        outcome = future.result()
+                    except BrokenProcessPool:
+                        crashed.append(filename)
+                        continue
+                    yield filename, outcome
+        for filename in crashed:
+            yield filename, None
+
+
+def run_batch(task, filenames, task_kwargs=None, workers=None, max_in_flight=None, cv2_threads=1, verbose=True):
+    """
+    Runs `task(filename, **task_kwargs)` for every file on a process pool.
+
+    Args:
+        task (callable): Module-level per-file stage function; returns a
+            message, raises FileSkipped to skip a file.
+        filenames (list): Files to process.
+        task_kwargs (dict): Keyword arguments passed to every call.
+        workers (int): Worker processes; defaults to the CPU count.
+        max_in_flight (int): Most files submitted at once; defaults to `workers`.
+        cv2_threads (int): OpenCV threads per worker.
+        verbose (bool): Print one line per file as it finishes.
+
+    Returns:
+        dict: "done", "skipped" and "failed" lists of per-file outcomes
+        (file, status, message, seconds) and the total "seconds".
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max(max_in_flight or workers, 1)
+    task_kwargs = task_kwargs or {}
+
+    report = {"done": [], "skipped": [], "failed": []}
+    start = time.perf_counter()
+
+    def record(outcome):
+        report[outcome["status"]].append(outcome)
+        if verbose:
+            _print_outcome(outcome)
+
+    crashed = []
+    for filename, outcome in _run_pool(task, filenames, task_kwargs, workers, max_in_flight, cv2_threads):
+        if outcome is None:
+            crashed.append(filename)
+        else:
+            record(outcome)
+
+    # A dead worker breaks the pool for every file in flight: retry those one
+    # at a time on a single worker, so only a file that kills it on its own fails
+    for filename, outcome in _run_pool(task, crashed, task_kwargs, 1, 1, cv2_threads):
+        record(outcome or {"file": filename, "status": "failed", "seconds": None,
+                           "message": "Worker process died while processing this file"})
+
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    return report
+
+
+# === Command Line ===
+def _stage_task(args):
+    """Per-file function, its keyword arguments and the input extensions of a stage."""
+    if args.stage == "ingest":
+        from PipelineCore.Ingest import RAW_EXTENSIONS, ingest_file
+        return ingest_file, {"input_dir": args.input, "output_dir": args.output}, RAW_EXTENSIONS
+    if args.stage == "heatmaps":
+        from PipelineCore.Heatmap import heatmap_file
+        if not args.masks:
+            raise SystemExit("The heatmaps stage needs --masks")
+        kwargs = {"input_dir": args.input, "mask_dir": args.masks, "output_dir": args.output, "mode": args.mode}
+        return heatmap_file, kwargs, (".png",)
+    if args.stage == "tiled-heatmaps":
+        from PipelineCore.Heatmap import tiled_heatmap_file
+        kwargs = {"input_dir": args.input, "output_dir": args.output, "mode": args.mode, "tile_size": args.tile_size}
+        return tiled_heatmap_file, kwargs, (".tif", ".tiff")
+    if args.stage == "crackzone":
+        from PipelineCore.CrackZone import crack_zone_file
+        kwargs = {"heatmap_folder": args.input, "output_folder": args.output}
+        return crack_zone_file, kwargs, (".png", ".jpg", ".jpeg")
+    if args.stage == "phases":
+        from PipelineCore.PhaseExtractor import phases_file
+        kwargs = {"input_folder": args.input, "output_folder": args.output, "mask_format": args.mask_format,
+                  "overlays": args.overlays or "none", "contour_csv": args.contour_csv}
+        return phases_file, kwargs, (".png",)
+    if args.stage == "overlays":
+        from PipelineCore.Overlays import overlays_file
+        if not args.geometry:
+            raise SystemExit("The overlays stage needs --geometry")
+        if args.overlays == "none":
+            raise SystemExit("The overlays stage draws the preview or full tier")
+        kwargs = {"input_folder": args.input, "output_folder": args.output, "geometry_folder": args.geometry,
+                  "tier": args.overlays or "preview"}
+        return overlays_file, kwargs, (".png",)
+    from PipelineCore.Preprocess import IMAGE_EXTENSIONS
+    from PipelineCore.StageGraph import specimen_file
+    kwargs = {"input_dir": args.input, "output_dir": args.output, "write_stages": args.write.split(","),
+              "cache_dir": args.cache, "cache_bytes": int(args.cache_size * 1024 ** 3), "force": args.force,
+              "overlays": args.overlays or "none", "contour_csv": args.contour_csv}
+    if args.results_store:
+        # Fails here, before any file is processed, when pyarrow is missing
+        from PipelineCore.ResultsStore import ResultsStore
+        ResultsStore(args.results_store)
+        kwargs.update({"results_store": os.path.abspath(args.results_store), "category": args.category,
+                       "run": args.run or os.path.basename(os.path.normpath(args.input))})
+    return specimen_file, kwargs, IMAGE_EXTENSIONS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a pipeline stage over a directory with a process pool.")
+    parser.add_argument("stage", choices=["ingest", "heatmaps", "tiled-heatmaps", "crackzone", "phases", "overlays",
+                                          "pipeline"])
+    parser.add_argument("input", help="Input directory")
+    parser.add_argument("output", help="Output directory")
+    parser.add_argument("--masks", help="Mask directory (heatmaps stage)")
+    parser.add_argument("--mode", choices=["compat", "full", "pyramid"], default="compat",
+                        help="Heatmap mode (heatmaps stage)")
+    parser.add_argument("--tile-size", type=int, default=2048, help="Tile side in pixels (tiled-heatmaps stage)")
+    parser.add_argument("--mask-format", choices=["png", "store"], default="png",
+                        help="Phase masks as PNGs or one .masks file per specimen (phases stage)")
+    parser.add_argument("--overlays", choices=["none", "preview", "full"],
+                        help="Overlay tier: phases/pipeline default none (render later with the overlays stage), "
+                             "overlays stage default preview")
+    parser.add_argument("--geometry", help="Geometry folder of a phases run (overlays stage)")
+    parser.add_argument("--contour-csv", action="store_true",
+                        help="Also write one yellow contour CSV per specimen (phases/pipeline stages)")
+    parser.add_argument("--write", default="crack_zone,phases,areas",
+                        help="Comma-separated stages to write (pipeline stage)")
+    parser.add_argument("--cache", help="Stage output cache directory (pipeline stage)")
+    parser.add_argument("--cache-size", type=float, default=20, help="Cache size bound in GB")
+    parser.add_argument("--results-store", help="Append the phase areas to this results store (pipeline stage)")
+    parser.add_argument("--category", default="SLM", help="Alloy category in the results store")
+    parser.add_argument("--run", help="Run name in the results store (default: input folder name)")
+    parser.add_argument("--force", action="store_true", help="Recompute every stage, ignoring the cache (re-ingest every file)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Files submitted at once (default: workers)")
+    parser.add_argument("--cv2-threads", type=int, default=1, help="OpenCV threads per worker")
+    parser.add_argument("--report", help="Write the per-file report to this JSON file")
+    parser.add_argument("--trace", help="Append per-file timing records to this JSON-lines file")
+    parser.add_argument("--trace-fine", action="store_true", help="Also trace sub-steps (HSV, morphology, PNG encode, ...)")
+    args = parser.parse_args(argv)
+
+    task, task_kwargs, extensions = _stage_task(args)
+    if args.trace:
+        Instrument.enable(args.trace, args.trace_fine)
+    os.makedirs(args.output, exist_ok=True)
+    filenames = list_inputs(args.input, extensions)
+    if args.stage == "ingest":
+        from PipelineCore.Ingest import pending_inputs
+        filenames = pending_inputs(filenames, args.input, args.output, args.force)
+
+    report = run_batch(task, filenames, task_kwargs, args.workers, args.max_in_flight, args.cv2_threads)
+
+    print(f"✅ Done: {len(report['done'])} processed, {len(report['skipped'])} skipped, "
+          f"{len(report['failed'])} failed in {report['seconds']} s")
+    for outcome in report["failed"]:
+        print(f"\n❌ {outcome['file']}\n{outcome['message']}")
+    Instrument.finish()
+
+    # The phase stages leave one geometry file per specimen; the descriptor
+    # table of the whole batch is built from those (no image is read)
+    geometry_folder = None
+    if args.stage == "phases":
+        geometry_folder = os.path.join(args.output, "geometry")
+    elif args.stage == "pipeline" and "phases" in args.write.split(","):
+        geometry_folder = os.path.join(args.output, "phases", "geometry")
+    if geometry_folder and os.path.isdir(geometry_folder):
+        from PipelineCore.Descriptors import write_descriptor_table
+        path, rows = write_descriptor_table(geometry_folder)
+        print(f"📊 Descriptor table: {path} ({rows} specimen x phase rows)")
+        from PipelineCore.ContourArchive import contours_from_geometry
+        path = os.path.join(os.path.dirname(os.path.abspath(geometry_folder)), "contours.contours")
+        print(f"📦 Contour archive: {path} ({contours_from_geometry(geometry_folder, path)} contours)")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    # Run through the package module so workers and stages share one FileSkipped class
+    from PipelineCore.BatchRunner import main as package_main
+    sys.exit(package_main())
@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+"""
+Description:
+Benchmark suite: times every pipeline stage on deterministic synthetic
+specimens (PipelineCore/Synthetic.py) at several resolutions and compares
+the numbers with a stored baseline.
+
+Stages (what each script or notebook cell does per image):
+    heatmap            get_heatmap (compat mode) on an image and its specimen contour
+    crack_zone         find_crack_zone + highlight_crack_zone (ExtractCrackArea.py)
+    crack_zone_noisy   the same on the heatmap with NOISY_FRAGMENTS warm specks
+                       per megapixel (scatter_fragments)
+    DarkRedContour ... one per CorlorsContours script: read the highlighted
+                       heatmap, extract the phase, write overlay and mask
+    AllPhasesContours  phases_file, all five phases in one pass (no overlays,
+                       the script's default)
+    Area-Colors        pixel areas and the CSV from the phase masks (no
+                       overlays, the script's default)
+
+Every stage/resolution pair runs in a fresh process, so its peak RSS
+(VmHWM: imports, inputs and the stage itself) is not inflated by the
+stages before it. The best of `repeat` runs is reported, with megapixels
+per second and a digest of the stage output (pixels of the images it
+returns or writes, bytes of other files). A stage that fails at a size
+(e.g. a phase the extractor skips on a small frame, since the phase
+parameters are in pixels) is recorded with its error.
+
+A result file can be used as the baseline of a later run: a stage is flagged
+when it is slower or needs more memory than the baseline by more than the
+tolerance (and by more than `min_delta` seconds, so millisecond stages do
+not flag on timer noise), or when its output digest changed.
+
+Usage (from the repository root):
+    python -m PipelineCore.Benchmark --sizes 1024,2048,4096 --output baseline.json
+    python -m PipelineCore.Benchmark --sizes 1024,2048,4096 --baseline baseline.json --tolerance 0.2
+"""
+
+DEFAULT_SIZES = (1024, 2048, 4096)
+PHASE_SCRIPTS = {
+    "DarkRedContour": "dark_red",
+    "DrakRedContour-2": "dark_red",
+    "RedContour": "red",
+    "YellowContour": "yellow",
+    "CyanContour": "cyan",
+    "BlueContours": "blue",
+}
+STAGES = ("heatmap", "crack_zone", "crack_zone_noisy", *PHASE_SCRIPTS, "AllPhasesContours", "Area-Colors")
+NOISY_FRAGMENTS = 700  # Warm specks per megapixel for crack_zone_noisy
+
+
+# === Inputs ===
+def prepare_inputs(data_dir, size, seed=0):
+    """
+    Writes the synthetic inputs of one resolution: the specimen, its mask,
+    the heatmap, the highlighted heatmap and the phase masks in the
+    Area-Colors.py folder layout.
+
+    Returns:
+        str: Specimen name.
+    """
+    from PipelineCore.Areas import MASK_SUFFIXES
+    from PipelineCore.Masking import specimen_mask
+    from PipelineCore.PhaseExtractor import extract_all_phases, render_mask
+    from PipelineCore.Synthetic import write_synthetic_set
+
+    name = write_synthetic_set(data_dir, size, 1, seed)[0]
+    img = cv2.imread(os.path.join(data_dir, f"{name}.png"))
+    cv2.imwrite(os.path.join(data_dir, f"{name}_mask.png"), specimen_mask(img))
+
+    highlighted_path = os.path.join(data_dir, f"{name}_heatmap_highlighted.png")
+    if not os.path.exists(highlighted_path):
+        raise ValueError(f"No crack zone in the synthetic heatmap of {name}")
+    highlighted = cv2.imread(highlighted_path)
+    results, _ = extract_all_phases(highlighted)
+    for phase, result in results.items():
+        os.makedirs(os.path.join(data_dir, "masks", phase), exist_ok=True)
+        cv2.imwrite(os.path.join(data_dir, "masks", phase, f"{name}{MASK_SUFFIXES[phase]}"),
+                    render_mask(result, highlighted.shape[:2]))
+    return name
+
+
+# === Stages ===
+# Each stage is a (prepare, run) pair: prepare(data_dir, name) loads what the
+# stage starts from (not timed); run(state, output_dir) is timed and returns
+# its in-memory output, or None when the output is the files it wrote.
+def _prepare_heatmap(data_dir, name):
+    from PipelineCore.Masking import get_contour
+    img = cv2.imread(os.path.join(data_dir, f"{name}.png"))
+    mask = cv2.imread(os.path.join(data_dir, f"{name}_mask.png"), cv2.IMREAD_GRAYSCALE)
+    return img, get_contour(mask)
+
+
+def _run_heatmap(state, output_dir):
+    from PipelineCore.Heatmap import get_heatmap
+    return get_heatmap(*state)
+
+
+def _prepare_crack_zone(data_dir, name):
+    return cv2.imread(os.path.join(data_dir, f"{name}_heatmap.png"))
+
+
+def _prepare_crack_zone_noisy(data_dir, name):
+    from PipelineCore.Synthetic import scatter_fragments
+    heatmap = _prepare_crack_zone(data_dir, name)
+    return scatter_fragments(heatmap, int(NOISY_FRAGMENTS * heatmap.shape[0] * heatmap.shape[1] / 1e6))
+
+
+def _run_crack_zone(heatmap, output_dir):
+    from PipelineCore.CrackZone import find_crack_zone, highlight_crack_zone
+    contour = find_crack_zone(heatmap)
+    return None if contour is None else highlight_crack_zone(heatmap, contour)
+
+
+def _prepare_highlighted(data_dir, name):
+    return data_dir, f"{name}_heatmap_highlighted.png"
+
+
+def _phase_script(script):
+    def run(state, output_dir):
+        from PipelineCore.PhaseExtractor import DARK_RED_ELLIPSE_PARAMS, PHASE_PARAMS, build_context, extract_phase, save_phase
+        data_dir, filename = state
+        phase = PHASE_SCRIPTS[script]
+        params = dict(DARK_RED_ELLIPSE_PARAMS if script == "DrakRedContour-2" else PHASE_PARAMS[phase])
+        img = cv2.imread(os.path.join(data_dir, filename))
+        result = extract_phase(build_context(img, [params]), phase, params)
+        save_phase(img, result, output_dir, filename[:-4])
+    return run
+
+
+def _run_all_phases(state, output_dir):
+    from PipelineCore.PhaseExtractor import phases_file
+    data_dir, filename = state
+    phases_file(filename, data_dir, output_dir, overlays="none")
+
+
+def _run_areas(state, output_dir):
+    from PipelineCore.Areas import MASK_SUFFIXES, areas_table, record_area
+    data_dir, filename = state
+    results = {}
+    for color, suffix in MASK_SUFFIXES.items():
+        folder = os.path.join(data_dir, "masks", color)
+        for fname in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+            mask = cv2.imread(os.path.join(folder, fname), cv2.IMREAD_GRAYSCALE)
+            sample = fname.replace(suffix, "")
+            record_area(results, sample, color, cv2.countNonZero(mask))
+    areas_table(results).to_csv(os.path.join(output_dir, "areas.csv"), index=False)
+
+
+def _stage(stage):
+    if stage == "heatmap":
+        return _prepare_heatmap, _run_heatmap
+    if stage == "crack_zone":
+        return _prepare_crack_zone, _run_crack_zone
+    if stage == "crack_zone_noisy":
+        return _prepare_crack_zone_noisy, _run_crack_zone
+    if stage in PHASE_SCRIPTS:
+        return _prepare_highlighted, _phase_script(stage)
+    if stage == "AllPhasesContours":
+        return _prepare_highlighted, _run_all_phases
+    if stage == "Area-Colors":
+        return _prepare_highlighted, _run_areas
+    raise ValueError(f"Unknown stage {stage!r}; expected one of {', '.join(STAGES)}")
+
+
+# === Measurement ===
+def output_digest(output, output_dir):
+    """
+    sha1 of a stage output: the array it returned, or every file it wrote
+    (decoded pixels for images, so PNG encoder settings do not matter).
+    """
+    digest = hashlib.sha1()
+    if output is not None:
+        digest.update(str(output.shape).encode())
+        digest.update(np.ascontiguousarray(output).tobytes())
+        return digest.hexdigest()
+    for root, _, files in sorted(os.walk(output_dir)):
+        for fname in sorted(files):
+            path = os.path.join(root, fname)
+            digest.update(os.path.relpath(path, output_dir).encode())
+            pixels = cv2.imread(path, cv2.IMREAD_UNCHANGED) if fname.lower().endswith(".png") else None
+            if pixels is not None:
+                digest.update(pixels.tobytes())
+            else:
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _peak_rss_mb():
+    """
+    Peak resident memory of this process. VmHWM on Linux: ru_maxrss also
+    counts the parent's memory at the fork that started this process.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+def measure_stage(stage, data_dir, name, size, repeat=3, cv2_threads=None):
+    """
+    Times one stage on the prepared inputs of one resolution. Meant to run
+    in a fresh process (see run_benchmarks), so the peak RSS is its own.
+
+    Returns:
+        dict: stage, size, best and mean seconds, megapixels per second,
+        peak RSS in MB and the output digest.
+    """
+    if cv2_threads is not None:
+        cv2.setNumThreads(cv2_threads)
+    prepare, run = _stage(stage)
+    state = prepare(data_dir, name)
+
+    times = []
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{stage}_")
+    try:
+        for _ in range(max(repeat, 1)):
+            output_dir = os.path.join(work_dir, "output")
+            shutil.rmtree(output_dir, ignore_errors=True)
+            os.makedirs(output_dir)
+            start = time.perf_counter()
+            output = run(state, output_dir)
+            times.append(time.perf_counter() - start)
+        digest = output_digest(output, output_dir)
+    except Exception as error:
+        # e.g. a phase the extractor skips at this resolution
+        return {"stage": stage, "size": size, "error": f"{type(error).__name__}: {error}"}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    best = min(times)
+    return {
+        "stage": stage, "size": size, "seconds": round(best, 4), "mean_seconds": round(sum(times) / len(times), 4),
+        "megapixels_per_second": round(size * size / 1e6 / best, 3) if best else None,
+        "peak_rss_mb": _peak_rss_mb(), "digest": digest,
+    }
+
+
+def environment():
+    """Versions and machine the numbers were measured on."""
+    return {"python": platform.python_version(), "opencv": cv2.__version__, "numpy": np.__version__,
+            "machine": platform.machine(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, stages=STAGES, repeat=3, data_dir=None, seed=0, cv2_threads=None, verbose=True):
+    """
+    Runs every stage at every size, each in a fresh process.
+
+    Args:
+        sizes (tuple): Frame sides in pixels.
+        stages (tuple): Stage names (see STAGES).
+        repeat (int): Timed runs per stage; the best one is reported.
+        data_dir (str): Where to write the synthetic inputs (kept); a
+            temporary folder by default.
+        seed (int): Synthetic specimen seed.
+        cv2_threads (int): OpenCV threads in the stage processes (default:
+            OpenCV's choice).
+
+    Returns:
+        dict: "environment" and one "results" entry per stage and size.
+    """
+    keep = data_dir is not None
+    data_dir = data_dir or tempfile.mkdtemp(prefix="bench_data_")
+    context = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for size in sizes:
+            size_dir = os.path.join(data_dir, str(size))
+            name = prepare_inputs(size_dir, size, seed)
+            for stage in stages:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(measure_stage, stage, size_dir, name, size, repeat, cv2_threads).result()
+                results.append(result)
+                if verbose and "error" in result:
+                    print(f"⚠ {stage:<18} {size:>5}²  {result['error']}")
+                elif verbose:
+                    print(f"⏱ {stage:<18} {size:>5}²  {result['seconds']:>8.3f} s  "
+                          f"{result['megapixels_per_second']:>8.2f} MP/s  {result['peak_rss_mb']:>8.1f} MB")
+    finally:
+        if not keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return {"environment": environment(), "results": results}
+
+
+def compare(report, baseline, tolerance=0.2, memory_tolerance=0.2, min_delta=0.05):
+    """
+    Flags regressions against a baseline report.
+
+    Args:
+        report (dict): run_benchmarks output.
+        baseline (dict): An earlier run_benchmarks output.
+        tolerance (float): Allowed relative slow-down.
+        memory_tolerance (float): Allowed relative growth of the peak RSS.
+        min_delta (float): Slow-downs of fewer seconds are not flagged.
+
+    Returns:
+        list: One message per regression (empty if there are none).
+    """
+    previous = {(r["stage"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        key = (result["stage"], result["size"])
+        if key not in previous:
+            continue
+        base = previous[key]
+        label = f"{result['stage']} @ {result['size']}²"
+        if "error" in result or "error" in base:
+            if result.get("error") != base.get("error"):
+                regressions.append(f"{label}: {result.get('error', 'ran')} (baseline: {base.get('error', 'ran')})")
+            continue
+        if result["digest"] != base["digest"]:
+            regressions.append(f"{label}: output changed")
+        if result["seconds"] > base["seconds"] * (1 + tolerance) and result["seconds"] - base["seconds"] > min_delta:
+            regressions.append(f"{label}: {result['seconds']} s vs {base['seconds']} s "
+                               f"({result['seconds'] / base['seconds'] - 1:+.0%})")
+        if result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + memory_tolerance):
+            regressions.append(f"{label}: peak RSS {result['peak_rss_mb']} MB vs {base['peak_rss_mb']} MB")
+    return regressions
+
+
+# === Command Line ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the pipeline stages on synthetic specimens.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated frame sides")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated stages")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (best is reported)")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic specimen seed")
+    parser.add_argument("--data", help="Keep the synthetic inputs in this directory")
+    parser.add_argument("--cv2-threads", type=int, default=None, help="OpenCV threads per stage process")
+    parser.add_argument("--output", help="Write the results to this JSON file (usable as a baseline)")
+    parser.add_argument("--baseline", help="Compare with this earlier results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slow-down")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2, help="Allowed relative peak RSS growth")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="Slow-downs of fewer seconds are not flagged")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks([int(s) for s in args.sizes.split(",")], args.stages.split(","), args.repeat,
+                            args.data, args.seed, args.cv2_threads)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("environment") != report["environment"]:
+        print("⚠ Baseline was measured in a different environment; timings may not be comparable")
+    regressions = compare(report, baseline, args.tolerance, args.memory_tolerance, args.min_delta)
+    for message in regressions:
+        print(f"❌ {message}")
+    if not regressions:
+        print("✅ No regressions against the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
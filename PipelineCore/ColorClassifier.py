@@ -0,0 +1,102 @@
+import sys
+import cv2
+import numpy as np
+
+"""
+Description:
+Lookup-table color classifier for the HSV ranges used by every extraction script.
+
+The scripts build masks with one cv2.inRange pass per HSV range on top of a full
+BGR->HSV conversion. Because the conversion is a per-pixel function of the BGR
+color, the membership of a color in every configured class can be computed once
+for all 2^24 BGR colors. HSVLookupClassifier stores that as a BGR -> bitmask
+table (one bit per class) and labels an image with a single gather; masks are
+then a bit test. The table is built with the very same cv2.cvtColor/cv2.inRange
+calls, so the masks are bit-identical to the inRange chains they replace.
+
+Usage:
+    classifier = HSVLookupClassifier({"red": red_ranges, "orange": orange_ranges})
+    labels = classifier.classify(image)
+    red_mask = classifier.mask(labels, "red")
+"""
+
+MAX_CLASSES = 16
+
+# Tables are keyed by their class definitions and shared by every classifier
+# built with the same ranges in this process.
+_lut_cache = {}
+
+
+def ranges_key(ranges):
+    """Hashable, canonical form of a list of (lower, upper) HSV ranges."""
+    return tuple((tuple(int(v) for v in lower), tuple(int(v) for v in upper)) for lower, upper in ranges)
+
+
+def _all_bgr_colors():
+    """Every 24-bit color as a 4096 x 4096 BGR image, laid out by pack index."""
+    index = np.arange(1 << 24, dtype=np.uint32)
+    colors = np.empty((1 << 24, 3), np.uint8)
+    colors[:, 0] = index & 255
+    colors[:, 1] = (index >> 8) & 255
+    colors[:, 2] = index >> 16
+    return colors.reshape(4096, 4096, 3)
+
+
+def _build_lut(class_ranges, dtype):
+    hsv = cv2.cvtColor(_all_bgr_colors(), cv2.COLOR_BGR2HSV)
+    lut = np.zeros(1 << 24, dtype)
+    for bit, ranges in enumerate(class_ranges):
+        member = np.zeros(hsv.shape[:2], np.uint8)
+        for lower, upper in ranges:
+            member |= cv2.inRange(hsv, np.array(lower), np.array(upper))
+        np.bitwise_or(lut, dtype(1 << bit), out=lut, where=member.reshape(-1) > 0)
+    return lut
+
+
+def pack_bgr(img):
+    """
+    Packs each BGR pixel into one uint32 index (B + G*256 + R*65536) of the
+    lookup table.
+    """
+    bgra = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+    if sys.byteorder == "little":
+        packed = bgra.view(np.uint32)[..., 0]
+        np.bitwise_and(packed, 0xFFFFFF, out=packed)
+        return packed
+    return (bgra[..., 0].astype(np.uint32) | (bgra[..., 1].astype(np.uint32) << 8)
+            | (bgra[..., 2].astype(np.uint32) << 16))
+
+
+class HSVLookupClassifier:
+    """
+    Labels every pixel with its membership in a set of named HSV classes.
+
+    Args:
+        classes (dict): class name -> list of (lower, upper) HSV ranges; a
+            pixel belongs to a class if it falls in any of its ranges.
+    """
+
+    def __init__(self, classes):
+        if len(classes) > MAX_CLASSES:
+            raise ValueError(f"At most {MAX_CLASSES} classes are supported, got {len(classes)}")
+        self.names = list(classes)
+        self.bits = {name: 1 << i for i, name in enumerate(self.names)}
+        self.dtype = np.uint8 if len(self.names) <= 8 else np.uint16
+
+        key = tuple(ranges_key(classes[name]) for name in self.names)
+        if key not in _lut_cache:
+            _lut_cache[key] = _build_lut(key, self.dtype)
+        self.lut = _lut_cache[key]
+
+    def classify(self, img):
+        """Bitmask label image (bit i set = pixel in class i) of a BGR image."""
+        return self.lut[pack_bgr(img)]
+
+    def mask(self, labels, name):
+        """Binary mask (0/255) of one class, identical to OR-ing its cv2.inRange masks."""
+        return cv2.compare(np.bitwise_and(labels, self.dtype(self.bits[name])), 0, cv2.CMP_GT)
+
+    def masks(self, img):
+        """All class masks of a BGR image from a single labelling pass."""
+        labels = self.classify(img)
+        return {name: self.mask(labels, name) for name in self.names}
@@ -0,0 +1,177 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+from PipelineCore.Archive import ArchiveReader, write_archive
+
+"""
+Description:
+Contour points of a whole batch in one `.contours` file (an Archive.py
+container) instead of one `<name>_contour.csv` per specimen.
+
+The vertices of every specimen x phase are concatenated into a single int32
+(N, 2) block, and the archive index maps specimen -> phase -> [start, count]
+into it. Loading a campaign is one memory map of one block; each contour is
+a view of it, so reading the index is all it takes to list what is there
+and reading a contour touches only its own pages.
+
+Contours are added while the batch runs (ContourArchiveWriter, used by
+YellowContour.py) or collected from the phase geometry files afterwards
+(contours_from_geometry, used by BatchRunner.py after a phases batch). The
+per-specimen x,y CSV files of the phase scripts are still available:
+PhaseExtractor.save_contour_csv writes one, export_csv() all of an archive.
+
+    python -m PipelineCore.ContourArchive from-geometry <geometry_dir> <batch.contours>
+    python -m PipelineCore.ContourArchive export-csv <batch.contours> <csv_dir> --phase yellow
+"""
+
+CONTOUR_ARCHIVE_SUFFIX = ".contours"
+CSV_SUFFIX = "_contour.csv"
+
+
+def write_contours(path, contours, meta=None):
+    """
+    Writes a contour archive.
+
+    Args:
+        path (str): Output `.contours` file.
+        contours (dict): specimen -> {phase: (N, 2) or (N, 1, 2) points}.
+        meta (dict): Extra archive metadata (e.g. the source folder).
+
+    Returns:
+        int: Number of contours written.
+    """
+    index, arrays, start = {}, [], 0
+    for specimen, phases in contours.items():
+        for phase, points in phases.items():
+            points = np.asarray(points, np.int32).reshape(-1, 2)
+            index.setdefault(specimen, {})[phase] = [start, len(points)]
+            arrays.append(points)
+            start += len(points)
+    points = np.concatenate(arrays) if arrays else None
+    write_archive(path, {"points": (points, None)}, {"index": index, "points": start, **(meta or {})})
+    return len(arrays)
+
+
+class ContourArchiveWriter:
+    """Collects the contours of a batch as they are extracted; write() saves them."""
+
+    def __init__(self):
+        self.contours = {}
+
+    def add(self, specimen, phase, points):
+        self.contours.setdefault(specimen, {})[phase] = np.asarray(points, np.int32).reshape(-1, 2)
+
+    def write(self, path, meta=None):
+        return write_contours(path, self.contours, meta)
+
+
+class ContourArchive:
+    """
+    Reads a `.contours` file. Opening it reads the index only; the points
+    are memory-mapped.
+    """
+
+    def __init__(self, path):
+        self.archive = ArchiveReader(path)
+        self.index = self.archive.meta["index"]
+        self.points = self.archive.array("points")
+        if self.points is None:
+            self.points = np.empty((0, 2), np.int32)
+
+    @property
+    def meta(self):
+        return self.archive.meta
+
+    @property
+    def specimens(self):
+        return list(self.index)
+
+    def phases(self, specimen):
+        return list(self.index[specimen])
+
+    def contour(self, specimen, phase):
+        """(N, 2) int32 points of one contour (a read-only view of the archive)."""
+        start, count = self.index[specimen][phase]
+        return self.points[start:start + count]
+
+    def load(self, phase=None):
+        """
+        Every contour (of one phase if given), read with a single copy of
+        the points block.
+
+        Returns:
+            dict: specimen -> {phase: (N, 2) int32 points}.
+        """
+        points = np.array(self.points)
+        contours = {}
+        for specimen, phases in self.index.items():
+            for name, (start, count) in phases.items():
+                if phase is None or name == phase:
+                    contours.setdefault(specimen, {})[name] = points[start:start + count]
+        return contours
+
+
+# === Converters ===
+def contours_from_geometry(geometry_folder, path, phases=None):
+    """
+    Archives the polygon phases (dark red hull, red, yellow, cyan) of every
+    `<name>.geometry.json` of a phase stage output; ellipse phases have no
+    points and are left out.
+
+    Args:
+        geometry_folder (str): Folder of geometry files (see PhaseExtractor.save_geometry).
+        path (str): Output `.contours` file.
+        phases (tuple): Only these phases (all polygon phases by default).
+
+    Returns:
+        int: Number of contours written.
+    """
+    from PipelineCore.Descriptors import load_geometries
+
+    contours = {}
+    for geometry in load_geometries(geometry_folder):
+        for phase, result in geometry["phases"].items():
+            if result["kind"] != "ellipse" and (phases is None or phase in phases):
+                contours.setdefault(geometry["specimen"], {})[phase] = result["points"]
+    return write_contours(path, contours, {"source": os.path.abspath(geometry_folder)})
+
+
+def export_csv(path, csv_folder, phase="yellow", suffix=CSV_SUFFIX):
+    """
+    Writes the contours of one phase as the per-specimen x,y CSV files of the
+    phase scripts (`<specimen>_contour.csv`).
+
+    Returns:
+        int: Number of files written.
+    """
+    from PipelineCore.PhaseExtractor import save_contour_csv
+
+    os.makedirs(csv_folder, exist_ok=True)
+    contours = ContourArchive(path).load(phase)
+    for specimen, phases in contours.items():
+        save_contour_csv({"points": phases[phase]}, os.path.join(csv_folder, specimen + suffix))
+    return len(contours)
+
+
+# === Command Line ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or export a batch contour archive.")
+    parser.add_argument("command", choices=["from-geometry", "export-csv"])
+    parser.add_argument("input", help="Geometry folder (from-geometry) or .contours file (export-csv)")
+    parser.add_argument("output", help=".contours file (from-geometry) or CSV folder (export-csv)")
+    parser.add_argument("--phase", default="yellow", help="Phase to export (export-csv)")
+    args = parser.parse_args(argv)
+
+    if args.command == "from-geometry":
+        count = contours_from_geometry(args.input, args.output)
+        print(f"✅ {count} contours archived in {args.output}")
+    else:
+        count = export_csv(args.input, args.output, args.phase)
+        print(f"✅ {count} {args.phase} contour CSV files written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
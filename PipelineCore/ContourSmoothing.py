@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+from scipy.interpolate import splprep, splev
+from scipy.ndimage import gaussian_filter1d
+from scipy.spatial import cKDTree
+
+"""
+Description:
+Smoothing of the cyan crack front (CyanContour.py), two engines:
+
+    - "spline" (the original): every vertex of the largest contour goes into
+      a periodic smoothing spline (splprep, s=0.001, per=True), resampled to
+      num_points. With s near zero the fit nearly interpolates thousands of
+      vertices; its cost grows with the contour and FITPACK can spend its
+      full iteration budget on jagged fronts.
+    - "decimated": the contour is first reduced with Douglas-Peucker
+      (cv2.approxPolyDP), which keeps every original vertex within
+      `max_deviation` pixels of the reduced polygon, then resampled by arc
+      length to num_points and smoothed with a circular Gaussian of
+      `sigma` samples. After the decimation the cost is fixed by
+      num_points, whatever the contour.
+
+Both return num_points int32 points (the last one repeats the first, as
+splev on linspace(0, 1) does). compare_smoothing() / the command line report
+the symmetric Hausdorff distance between the two outputs and their times:
+
+    python -m PipelineCore.ContourSmoothing <highlighted_dir> --max-deviation 1.0 --report smoothing.json
+"""
+
+SMOOTHING_ENGINES = ("spline", "decimated")
+DEFAULT_MAX_DEVIATION = 1.0  # pixels
+DEFAULT_SIGMA = 1.0          # samples of the resampled front
+
+
+def spline_contour(points, num_points=600, smoothness=0.001):
+    """The original periodic spline fit through every vertex, resampled to num_points."""
+    x, y = points[:, 0], points[:, 1]
+    tck, _ = splprep([x, y], s=smoothness, per=True)
+    x_fine, y_fine = splev(np.linspace(0, 1, num_points), tck)
+    return np.stack((x_fine, y_fine), axis=1).astype(np.int32)
+
+
+def decimate_contour(points, max_deviation=DEFAULT_MAX_DEVIATION):
+    """
+    Douglas-Peucker reduction of a closed contour: every original vertex lies
+    within max_deviation pixels of the returned polygon.
+
+    Returns:
+        ndarray: (k, 2) float64 vertices starting at the contour's first
+        vertex (as the spline does), k >= 3 when the input has 3 or more.
+    """
+    points = np.asarray(points, np.float64).reshape(-1, 2)
+    reduced = cv2.approxPolyDP(points.astype(np.float32).reshape(-1, 1, 2), max_deviation, True).reshape(-1, 2)
+    if len(reduced) < 3 <= len(points):
+        return points
+    # approxPolyDP starts a closed curve where it likes; keep the original start
+    # (an extra vertex on the curve cannot add deviation)
+    start = int(np.argmin(np.hypot(*(reduced - points[0]).T)))
+    reduced = np.roll(reduced.astype(np.float64), -start, axis=0)
+    if not np.array_equal(reduced[0], points[0]):
+        reduced = np.vstack([points[:1], reduced])
+    return reduced
+
+
+def resample_closed(points, count):
+    """
+    `count` points equally spaced by arc length along the closed polygon,
+    starting at its first vertex; the last point repeats the first.
+    """
+    closed = np.vstack([points, points[:1]])
+    lengths = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(closed, axis=0).T))])
+    targets = np.linspace(0, lengths[-1], count)
+    return np.stack([np.interp(targets, lengths, closed[:, 0]), np.interp(targets, lengths, closed[:, 1])], axis=1)
+
+
+def smooth_contour(points, num_points=600, max_deviation=DEFAULT_MAX_DEVIATION, sigma=DEFAULT_SIGMA):
+    """
+    Decimated engine: Douglas-Peucker reduction, arc-length resampling and a
+    circular Gaussian of `sigma` samples.
+
+    Returns:
+        ndarray: (num_points, 2) int32 points, the last equal to the first.
+    """
+    front = resample_closed(decimate_contour(points, max_deviation), num_points)
+    if sigma > 0:
+        # Smooth the num_points - 1 distinct samples as one period
+        front[:-1] = gaussian_filter1d(front[:-1], sigma, axis=0, mode="wrap")
+        front[-1] = front[0]
+    return front.astype(np.int32)
+
+
+def hausdorff_distance(a, b):
+    """Symmetric Hausdorff distance between two point sets (pixels)."""
+    a, b = np.asarray(a, np.float64).reshape(-1, 2), np.asarray(b, np.float64).reshape(-1, 2)
+    return float(max(cKDTree(b).query(a)[0].max(), cKDTree(a).query(b)[0].max()))
+
+
+def compare_smoothing(points, num_points=600, smoothness=0.001, max_deviation=DEFAULT_MAX_DEVIATION,
+                      sigma=DEFAULT_SIGMA):
+    """
+    Runs both engines on one contour.
+
+    Returns:
+        dict: contour and decimated vertex counts, the seconds of each engine,
+        the Hausdorff distance between their outputs and of each output from
+        the contour itself (pixels; the contour is sampled every half pixel).
+        The spline entries are None when splprep rejects the contour.
+    """
+    start = time.perf_counter()
+    try:
+        reference = spline_contour(points, num_points, smoothness)
+    except ValueError:
+        reference = None
+    spline_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    smoothed = smooth_contour(points, num_points, max_deviation, sigma)
+    decimated_seconds = time.perf_counter() - start
+
+    closed = np.vstack([points, points[:1]]).astype(np.float64)
+    front = resample_closed(points.astype(np.float64), max(int(2 * np.hypot(*np.diff(closed, axis=0).T).sum()), 3))
+    return {
+        "vertices": len(points), "decimated_vertices": len(decimate_contour(points, max_deviation)),
+        "spline_seconds": round(spline_seconds, 5), "decimated_seconds": round(decimated_seconds, 5),
+        "hausdorff_px": round(hausdorff_distance(reference, smoothed), 3) if reference is not None else None,
+        "spline_to_front_px": round(hausdorff_distance(reference, front), 3) if reference is not None else None,
+        "decimated_to_front_px": round(hausdorff_distance(smoothed, front), 3),
+    }
+
+
+# === Command Line ===
+def main(argv=None):
+    from PipelineCore.PhaseExtractor import PHASE_PARAMS, PhaseSkipped, build_context, cyan_front
+
+    parser = argparse.ArgumentParser(description="Compare the cyan front smoothing engines on highlighted heatmaps.")
+    parser.add_argument("input", help="Folder of *_heatmap_highlighted.png images")
+    parser.add_argument("--max-deviation", type=float, default=DEFAULT_MAX_DEVIATION, help="Decimation bound in pixels")
+    parser.add_argument("--sigma", type=float, default=DEFAULT_SIGMA, help="Gaussian width in resampled points")
+    parser.add_argument("--report", help="Write the per-specimen results to this JSON file")
+    args = parser.parse_args(argv)
+
+    params = dict(PHASE_PARAMS["cyan"])
+    results = {}
+    for filename in sorted(os.listdir(args.input)):
+        if not filename.lower().endswith(".png"):
+            continue
+        img = cv2.imread(os.path.join(args.input, filename))
+        try:
+            points = cyan_front(build_context(img, [params]), params)
+        except PhaseSkipped as reason:
+            print(f"{reason} in {filename}")
+            continue
+        result = compare_smoothing(points, params["num_points"], params["smoothness"], args.max_deviation, args.sigma)
+        results[filename] = result
+        if result["hausdorff_px"] is None:
+            print(f"⚠ {filename}: splprep rejected the {result['vertices']}-vertex contour; decimated "
+                  f"{result['decimated_seconds']:.4f} s, {result['decimated_to_front_px']:.2f} px from the front")
+            continue
+        print(f"⏱ {filename}: {result['vertices']} -> {result['decimated_vertices']} vertices, "
+              f"spline {result['spline_seconds']:.3f} s, decimated {result['decimated_seconds']:.4f} s, "
+              f"Hausdorff {result['hausdorff_px']:.2f} px (from the front: spline "
+              f"{result['spline_to_front_px']:.2f}, decimated {result['decimated_to_front_px']:.2f})")
+
+    compared = [r for r in results.values() if r["hausdorff_px"] is not None]
+    if compared:
+        distances = [r["hausdorff_px"] for r in compared]
+        print(f"📊 {len(compared)} fronts: Hausdorff mean {np.mean(distances):.2f} px, max {max(distances):.2f} px; "
+              f"spline {sum(r['spline_seconds'] for r in compared):.2f} s, "
+              f"decimated {sum(r['decimated_seconds'] for r in compared):.2f} s in total")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
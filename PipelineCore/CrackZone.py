@@ -0,0 +1,170 @@
+import os
+import cv2
+import numpy as np
+
+from PipelineCore import Instrument
+from PipelineCore.BatchRunner import FileSkipped
+from PipelineCore.ColorClassifier import HSVLookupClassifier
+from PipelineCore.Morphology import closing, opening
+
+"""
+Description:
+Crack-zone detection on the heatmaps (formerly the body of ExtractCrackArea.py).
+The crack zone is the largest orange region whose centroid lies inside a red
+region; it is marked on the heatmap with the pink circles that the phase
+extractors later fit their ellipse to.
+
+"Inside a red region" means inside or on one of the red mask's external
+contours (the original per-contour pointPolygonTest >= 0). The red contours
+are filled into one raster instead, so each orange centroid is an O(1) pixel
+lookup rather than a polygon test against every red contour; on noisy
+heatmaps with thousands of fragments that loop dominated the stage.
+"""
+
+# === HSV Color Ranges ===
+COLOR_RANGES = {
+    "dark_red": [([0, 200, 100], [10, 255, 180]), ([160, 200, 100], [180, 255, 180])],
+    "red": [([0, 180, 180], [10, 255, 255]), ([160, 180, 180], [180, 255, 255])],
+    "orange": [([10, 100, 100], [25, 255, 255])]
+}
+
+KERNEL_SIZE = 5
+MIN_ORANGE_AREA = 50
+
+_classifier = None
+
+
+def crack_zone_classifier():
+    """
+    One lookup table labels every pixel as red and/or orange in a single pass.
+    Built on first use, once per process.
+    """
+    global _classifier
+    if _classifier is None:
+        _classifier = HSVLookupClassifier({
+            "red": COLOR_RANGES["dark_red"] + COLOR_RANGES["red"],
+            "orange": COLOR_RANGES["orange"],
+        })
+    return _classifier
+
+
+def _inside_contours(contours, shape):
+    """
+    Raster of the pixels inside or on `contours` - what
+    cv2.pointPolygonTest(contour, point, False) >= 0 answers for any of them.
+    """
+    inside = np.zeros(shape, np.uint8)
+    cv2.drawContours(inside, contours, -1, 255, cv2.FILLED)
+    return inside
+
+
+def select_crack_zone(red_mask, orange_mask, min_area=MIN_ORANGE_AREA):
+    """
+    Largest orange region (by contour area) whose centroid lies inside or on
+    an external contour of the red mask.
+
+    Args:
+        red_mask (ndarray): Binary red mask.
+        orange_mask (ndarray): Binary orange mask.
+        min_area (float): Smallest orange contour area considered.
+
+    Returns:
+        ndarray: External contour of the selected orange region, or None.
+    """
+    contours_red, _ = cv2.findContours(red_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours_orange, _ = cv2.findContours(orange_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    inside_red = _inside_contours(contours_red, red_mask.shape)
+
+    largest_contour = None
+    max_area = 0
+
+    for o in contours_orange:
+        area = cv2.contourArea(o)
+        if area < min_area or area <= max_area:
+            continue
+
+        M = cv2.moments(o)
+        if M["m00"] == 0:
+            continue
+        cx = int(M["m10"] / M["m00"])
+        cy = int(M["m01"] / M["m00"])
+
+        if inside_red[cy, cx]:
+            max_area = area
+            largest_contour = o
+
+    return largest_contour
+
+
+def find_crack_zone(image):
+    """
+    Finds the crack zone of a heatmap.
+
+    Args:
+        image (ndarray): BGR heatmap.
+
+    Returns:
+        ndarray: Contour of the largest orange region centred inside a red
+        region, or None.
+    """
+    classifier = crack_zone_classifier()
+    labels = classifier.classify(image)
+
+    # Build red mask
+    red_mask = classifier.mask(labels, "red")
+    red_mask = opening(red_mask, KERNEL_SIZE)
+    red_mask = closing(red_mask, KERNEL_SIZE)
+
+    # Build orange mask
+    orange_mask = classifier.mask(labels, "orange")
+    orange_mask = opening(orange_mask, KERNEL_SIZE)
+    orange_mask = closing(orange_mask, KERNEL_SIZE)
+
+    return select_crack_zone(red_mask, orange_mask)
+
+
+def highlight_crack_zone(image, contour):
+    """
+    Draws the pink crack-zone circles and label around `contour`.
+
+    Returns:
+        ndarray: The blended highlighted heatmap.
+    """
+    overlay = image.copy()
+    (x, y), radius = cv2.minEnclosingCircle(contour)
+    center = (int(x), int(y))
+    radius = int(radius)
+
+    # Draw circles in bold pink
+    cv2.circle(overlay, center, radius + 6, (255, 0, 255), 4)  # outer pink circle
+    cv2.circle(overlay, center, radius, (255, 0, 255), 6)      # inner pink circle
+
+    # Label with pink
+    text = "Internal Orange Zone"
+    text_position = (center[0] - radius, center[1] - radius - 10)
+    cv2.putText(overlay, text, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 255), 6)
+
+    # Blend overlay
+    return cv2.addWeighted(overlay, 0.75, image, 0.25, 0)
+
+
+def crack_zone_file(filename, heatmap_folder, output_folder):
+    """
+    Detects and highlights the crack zone of one heatmap.
+
+    Returns:
+        str: Path of the saved `*_highlighted.png`.
+
+    Raises:
+        FileSkipped: If no crack zone is found.
+    """
+    image = cv2.imread(os.path.join(heatmap_folder, filename))
+    Instrument.note_frame(image)
+    largest_contour = find_crack_zone(image)
+    if largest_contour is None:
+        raise FileSkipped(f"⚠ No crack zone found in {filename}")
+
+    # Save only the highlighted heatmap
+    output_path = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}_highlighted.png")
+    Instrument.imwrite(output_path, highlight_crack_zone(image, largest_contour))
+    return output_path
@@ -0,0 +1,218 @@
+import os
+import math
+import cv2
+import numpy as np
+import pandas as pd
+
+from PipelineCore.Areas import MICRON_AREA_FACTOR, PIXEL_SIZE_MICRONS, geometry_area, load_geometry
+from PipelineCore.PhaseExtractor import GEOMETRY_SUFFIX, PHASES
+
+"""
+Description:
+Shape descriptor table of the phase boundaries, one row per specimen x phase,
+computed from the phase geometry files (`<name>.geometry.json`, written by the
+phase stage) without reading any image.
+
+Polygon phases (dark red hull, red, yellow, cyan spline) get their area,
+centroid and second moments from Green's theorem over the boundary vertices:
+the vertices of every polygon of every specimen are stacked into one array
+and the per-polygon sums are taken with np.add.reduceat, so a campaign of
+thousands of specimens is one vectorised pass. Ellipse phases (blue, the
+DrakRedContour-2 dark red) use the closed forms of their fitted ellipse.
+
+Columns (lengths in pixels unless the name says _um, areas in pixels²):
+    specimen, phase, kind
+    area_px             geometric area (shoelace / pi*w*h/4)
+    pixel_area          pixel-equivalent area, as Area-Colors.py counts it
+                        from the mask (Areas.geometry_area), and area_um2
+    perimeter_px        boundary length (Ramanujan's formula for ellipses)
+    centroid_x/_y       full-frame pixel coordinates
+    major/minor_axis_px axes of the ellipse with the same second moments
+                        (the fitted axes for ellipse phases)
+    orientation_deg     major axis angle in image axes (y down), [0, 180)
+    eccentricity        sqrt(1 - (minor / major)^2)
+    feret_max/_min_px   largest and smallest caliper width of the boundary
+    solidity            area / convex hull area
+    initiation_offset   centroid distance from the dark red (initiation)
+                        centroid of the same specimen, _px and _um
+"""
+
+DESCRIPTORS_FILE = "descriptors.csv"
+INITIATION_PHASE = "dark_red"
+
+COLUMNS = [
+    "specimen", "phase", "kind", "area_px", "pixel_area", "area_um2", "perimeter_px", "perimeter_um",
+    "centroid_x", "centroid_y", "major_axis_px", "minor_axis_px", "orientation_deg", "eccentricity",
+    "feret_max_px", "feret_min_px", "solidity", "initiation_offset_px", "initiation_offset_um",
+]
+
+
+# === Polygon Descriptors (vectorised over all polygons) ===
+def _polygon_moments(polygons):
+    """
+    Area, centroid, central second moments and perimeter of every polygon.
+
+    Args:
+        polygons (list): (N_i, 2) vertex arrays, closed implicitly.
+
+    Returns:
+        dict: Arrays with one value per polygon.
+    """
+    counts = np.array([len(p) for p in polygons])
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    points = np.concatenate(polygons).astype(np.float64)
+    x, y = points[:, 0], points[:, 1]
+
+    # Index of the next vertex, wrapping around inside each polygon
+    following = np.arange(len(points)) + 1
+    following[starts + counts - 1] = starts
+    xn, yn = x[following], y[following]
+    cross = x * yn - xn * y
+
+    def total(values):
+        return np.add.reduceat(values, starts)
+
+    area = total(cross) / 2
+    perimeter = total(np.hypot(xn - x, yn - y))
+    m10 = total((x + xn) * cross) / 6
+    m01 = total((y + yn) * cross) / 6
+    m20 = total((x * x + x * xn + xn * xn) * cross) / 12
+    m02 = total((y * y + y * yn + yn * yn) * cross) / 12
+    m11 = total((x * yn + 2 * x * y + 2 * xn * yn + xn * y) * cross) / 24
+
+    # Vertex order (clockwise or not) only flips the signs
+    sign = np.where(area < 0, -1.0, 1.0)
+    area, m10, m01, m20, m02, m11 = (sign * v for v in (area, m10, m01, m20, m02, m11))
+
+    degenerate = area <= 0
+    safe_area = np.where(degenerate, 1, area)
+    cx = np.where(degenerate, total(x) / counts, m10 / safe_area)
+    cy = np.where(degenerate, total(y) / counts, m01 / safe_area)
+    mu20 = np.where(degenerate, 0, m20 - area * cx * cx)
+    mu02 = np.where(degenerate, 0, m02 - area * cy * cy)
+    mu11 = np.where(degenerate, 0, m11 - area * cx * cy)
+    return {"area": np.maximum(area, 0), "perimeter": perimeter, "cx": cx, "cy": cy,
+            "mu20": mu20, "mu02": mu02, "mu11": mu11}
+
+
+def _equivalent_ellipse(area, mu20, mu02, mu11):
+    """Full axes and major-axis angle of the ellipses with the given second moments."""
+    half_sum = (mu20 + mu02) / 2
+    root = np.sqrt(((mu20 - mu02) / 2) ** 2 + mu11 ** 2)
+    safe_area = np.where(area > 0, area, 1)
+    major = np.where(area > 0, 4 * np.sqrt(np.maximum(half_sum + root, 0) / safe_area), 0)
+    minor = np.where(area > 0, 4 * np.sqrt(np.maximum(half_sum - root, 0) / safe_area), 0)
+    angle = np.degrees(0.5 * np.arctan2(2 * mu11, mu20 - mu02)) % 180
+    return major, minor, angle
+
+
+def _hull_descriptors(points):
+    """(feret max, feret min, hull area) of one vertex set."""
+    hull = cv2.convexHull(np.asarray(points, np.float32)).reshape(-1, 2).astype(np.float64)
+    if len(hull) < 3:
+        extent = np.ptp(hull, axis=0) if len(hull) else np.zeros(2)
+        return float(np.hypot(*extent)), 0.0, 0.0
+    # Calipers on every hull edge: the smallest width is set by one of the
+    # edges, and the vertex farthest from each edge pairs with both of its
+    # ends; those pairs include every antipodal pair, so the largest diameter
+    following = np.roll(hull, -1, axis=0)
+    edges = following - hull
+    normals = np.stack([-edges[:, 1], edges[:, 0]], axis=1) / np.hypot(edges[:, 0], edges[:, 1])[:, None]
+    projections = hull @ normals.T
+    widths = projections.max(axis=0) - projections.min(axis=0)
+    farthest = hull[np.argmax(np.abs(projections - projections[np.arange(len(hull)), np.arange(len(hull))]), axis=0)]
+    feret_max = max(np.hypot(*(farthest - hull).T).max(), np.hypot(*(farthest - following).T).max())
+    hull_area = cv2.contourArea(hull.astype(np.float32))
+    return float(feret_max), float(widths.min()), float(hull_area)
+
+
+# === Ellipse Descriptors ===
+def _ellipse_descriptors(ellipse):
+    (cx, cy), (w, h), angle = ellipse
+    major, minor = max(w, h), min(w, h)
+    a, b = major / 2, minor / 2
+    # Ramanujan's second approximation
+    ratio = ((a - b) / (a + b)) ** 2 if a + b > 0 else 0
+    perimeter = math.pi * (a + b) * (1 + 3 * ratio / (10 + math.sqrt(4 - 3 * ratio)))
+    return {"area": math.pi * a * b, "perimeter": perimeter, "cx": cx, "cy": cy,
+            "major": major, "minor": minor, "angle": (angle if w >= h else angle + 90) % 180,
+            "feret_max": major, "feret_min": minor, "solidity": 1.0}
+
+
+# === Table ===
+def descriptor_table(geometries):
+    """
+    Descriptor table of a set of specimens.
+
+    Args:
+        geometries (list): Geometry dicts as returned by Areas.load_geometry
+            ("specimen", "shape" and phase -> geometry in "phases").
+
+    Returns:
+        DataFrame: One row per specimen x phase found (see COLUMNS).
+    """
+    rows, polygons, polygon_rows = [], [], []
+    for geometry in geometries:
+        specimen = geometry["specimen"].replace("_heatmap_highlighted", "")
+        shape = tuple(geometry["shape"])
+        for phase in sorted(geometry["phases"], key=lambda p: PHASES.index(p) if p in PHASES else len(PHASES)):
+            result = geometry["phases"][phase]
+            row = {"specimen": specimen, "phase": phase, "kind": result["kind"],
+                   "pixel_area": geometry_area(result, shape)[1]}
+            if result["kind"] == "ellipse":
+                row.update(_ellipse_descriptors(result["ellipse"]))
+            else:
+                points = result["points"].reshape(-1, 2)
+                row["feret_max"], row["feret_min"], row["hull_area"] = _hull_descriptors(points)
+                polygons.append(points)
+                polygon_rows.append(len(rows))
+            rows.append(row)
+
+    if polygons:
+        moments = _polygon_moments(polygons)
+        major, minor, angle = _equivalent_ellipse(moments["area"], moments["mu20"], moments["mu02"], moments["mu11"])
+        for i, index in enumerate(polygon_rows):
+            row = rows[index]
+            row.update({key: float(moments[key][i]) for key in ("area", "perimeter", "cx", "cy")})
+            row.update({"major": float(major[i]), "minor": float(minor[i]), "angle": float(angle[i]),
+                        "solidity": row["area"] / row["hull_area"] if row["hull_area"] > 0 else 0.0})
+
+    table = pd.DataFrame(rows, columns=["specimen", "phase", "kind", "area", "pixel_area", "perimeter", "cx", "cy",
+                                        "major", "minor", "angle", "feret_max", "feret_min", "solidity"])
+    table = table.rename(columns={"area": "area_px", "perimeter": "perimeter_px", "cx": "centroid_x",
+                                  "cy": "centroid_y", "major": "major_axis_px", "minor": "minor_axis_px",
+                                  "angle": "orientation_deg", "feret_max": "feret_max_px", "feret_min": "feret_min_px"})
+
+    table["area_um2"] = table["pixel_area"] * MICRON_AREA_FACTOR
+    table["perimeter_um"] = table["perimeter_px"] * PIXEL_SIZE_MICRONS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.where(table["major_axis_px"] > 0, table["minor_axis_px"] / table["major_axis_px"], 1.0)
+    table["eccentricity"] = np.sqrt(np.clip(1 - ratio ** 2, 0, 1))
+
+    # Offset of every phase centroid from the initiation site of its specimen
+    initiation = table[table["phase"] == INITIATION_PHASE].drop_duplicates("specimen").set_index("specimen")
+    initiation = initiation[["centroid_x", "centroid_y"]]
+    origin = initiation.reindex(table["specimen"]).to_numpy()
+    table["initiation_offset_px"] = np.hypot(table["centroid_x"] - origin[:, 0], table["centroid_y"] - origin[:, 1])
+    table["initiation_offset_um"] = table["initiation_offset_px"] * PIXEL_SIZE_MICRONS
+    return table[COLUMNS]
+
+
+def load_geometries(geometry_folder):
+    """Every `<name>.geometry.json` of a folder, in file name order."""
+    return [load_geometry(os.path.join(geometry_folder, fname))
+            for fname in sorted(os.listdir(geometry_folder)) if fname.endswith(GEOMETRY_SUFFIX)]
+
+
+def write_descriptor_table(geometry_folder, output_path=None):
+    """
+    Builds the descriptor table of a phase stage's geometry folder and writes
+    it as CSV, by default as `descriptors.csv` next to the geometry folder.
+
+    Returns:
+        tuple: (path written, number of rows).
+    """
+    table = descriptor_table(load_geometries(geometry_folder))
+    output_path = output_path or os.path.join(os.path.dirname(os.path.abspath(geometry_folder)), DESCRIPTORS_FILE)
+    table.to_csv(output_path, index=False)
+    return output_path, len(table)
@@ -0,0 +1,539 @@
+import os
+import math
+import time
+import cv2
+import numpy as np
+
+from PipelineCore import Instrument
+from PipelineCore.BatchRunner import FileSkipped
+from PipelineCore.Masking import get_contour, stream_specimen_contour
+from PipelineCore.TiledImage import DEFAULT_TILE_SIZE, TiffImage, create_tiff, iter_tiles, padded_bounds, pad
+
+"""
+Description:
+Gradient heatmap engine used by the notebook's heatmap stage.
+
+The heatmap is the mean Sobel magnitude inside a window_size x window_size
+window, normalised by how much of that window lies on the specimen mask.
+The original implementation (kept below as get_heatmap_reference) slid the
+window in a Python double loop and re-summed the mask for every position.
+Here both window sums come from summed-area tables, so the cost is O(pixels)
+whatever the window size:
+
+    - mode="compat": evaluates the window at the top-left pixel of every
+      window_step x window_step block, exactly like the loop, and fills the
+      block with that value.
+    - mode="full":   evaluates the window at every pixel (box filter), giving
+      a full-resolution heatmap without the block quantisation.
+    - mode="pyramid": pools the gradient energy down by
+      pyramid_factor(window_size, window_step) (8 for the 201/10 defaults),
+      evaluates the window means at every pixel of that level and only
+      upsamples the result to full resolution for the output. The window
+      averages that detail away anyway, so the picture stays close to "full"
+      (compare_modes reports the difference) without its full-resolution
+      float buffers, e.g. for 8k frames.
+
+stream_heatmap produces the compat / full heatmap of an image of any size
+from a tiled source (TiledImage.py) with memory bounded by the tile size:
+tiles carry a halo of half the window, and the two whole-image quantities -
+the maximum gradient energy and the histogram for the equalisation - are
+gathered in separate passes, so the output equals get_heatmap's exactly.
+"""
+
+# === Default Window Parameters ===
+WINDOW_SIZE = 201
+WINDOW_STEP = 10
+
+HEATMAP_MODES = ("compat", "full", "pyramid")
+
+# Fewest pixels across the window at the pyramid level
+MIN_PYRAMID_WINDOW = 15
+
+# Support of the 13 x 13 Gaussian plus the 5 x 5 Sobel in gradient_energy
+GRADIENT_HALO = 13 // 2 + 5 // 2
+
+
+def gradient_energy(img, contour):
+    """
+    Computes the normalised Sobel magnitude of the specimen and its mask.
+
+    Args:
+        img (ndarray): BGR SEM image.
+        contour (ndarray): External contour of the specimen.
+
+    Returns:
+        tuple: (sobel_magnitude uint8, mask uint8) with the image shape.
+    """
+    # Create a mask with the contour
+    mask = np.zeros(img.shape[:2], np.uint8)
+    cv2.drawContours(mask, [contour], -1, (255, 255, 255), -1, cv2.LINE_AA)
+
+    # Keep only the pixels fully inside the (anti-aliased) mask
+    out = cv2.bitwise_and(img, img, mask=cv2.compare(mask, 255, cv2.CMP_EQ))
+
+    # The original converted BGR->RGB and then read the result as BGR,
+    # i.e. a grey conversion with swapped channel weights.
+    img_grey = cv2.cvtColor(out, cv2.COLOR_RGB2GRAY)
+    blur = cv2.GaussianBlur(img_grey, (13, 13), 0)
+
+    sobelx = cv2.Sobel(blur, cv2.CV_8U, 1, 0, ksize=5)
+    sobely = cv2.Sobel(blur, cv2.CV_8U, 0, 1, ksize=5)
+
+    # sobelx**2 + sobely**2 wraps around in uint8 exactly as it always has, so
+    # the magnitude only takes 256 values: evaluate the float16 sqrt and the
+    # max-normalisation on those values and apply them through a lookup table.
+    energy = sobelx**2 + sobely**2
+    root = np.sqrt(np.arange(256, dtype=np.uint8))
+    lut = np.uint8(root / root[energy.max()] * 255)
+    sobel_magnitude = cv2.LUT(energy, lut)
+
+    return sobel_magnitude, mask
+
+
+def pyramid_factor(window_size=WINDOW_SIZE, window_step=WINDOW_STEP):
+    """
+    Downsampling factor of the pyramid mode: the largest power of two not
+    above window_step (the compat output has no finer detail) that still
+    leaves MIN_PYRAMID_WINDOW pixels across the window.
+    """
+    factor = 1
+    while factor * 2 <= window_step and window_size / (factor * 2) >= MIN_PYRAMID_WINDOW:
+        factor *= 2
+    return factor
+
+
+def colorize_heatmap(heat_map_sobel, mask):
+    """
+    Equalises a single-channel heatmap and renders it with the JET colormap,
+    painting everything outside the specimen mask black.
+    """
+    heat_map_sobel = cv2.equalizeHist(heat_map_sobel)
+    heat_map_color_sobel = cv2.applyColorMap(heat_map_sobel, cv2.COLORMAP_JET)
+
+    # Replace background color (set areas outside the mask to a specific color)
+    background_color = (0, 0, 0)  # Black (can be adjusted to any color)
+    heat_map_color_sobel[mask == 0] = background_color
+
+    return heat_map_color_sobel
+
+
+def _window_bounds(centers, half, window_size, limit):
+    """Clipped [start, stop) rows/cols of the windows centred on `centers`."""
+    start = np.clip(centers - half, 0, limit)
+    stop = np.clip(centers - half + window_size, 0, limit)
+    return start, stop
+
+
+def _table_sums(table, y0, y1, x0, x1):
+    """Window sums from a summed-area table for every (row, col) pair."""
+    return (table[np.ix_(y1, x1)] - table[np.ix_(y0, x1)]
+            - table[np.ix_(y1, x0)] + table[np.ix_(y0, x0)])
+
+
+def _masked_means(window_sums, mask_sums, centre_on_metal):
+    """
+    Divides the Sobel window sums by the mask coverage the same way the
+    original loop did (float division, then a uint8 cast), zeroing windows
+    with no metal or whose centre is off the specimen.
+    """
+    valid = (mask_sums > 0) & centre_on_metal
+    means = np.zeros(window_sums.shape, dtype=np.float64)
+    means[valid] = window_sums[valid] / (mask_sums[valid] / 255)
+    return means.astype(np.uint8)
+
+
+def block_window_means(sobel_magnitude, mask, window_size=WINDOW_SIZE, window_step=WINDOW_STEP):
+    """
+    Masked window means sampled at the top-left pixel of every
+    window_step x window_step block (one value per block).
+
+    Returns:
+        ndarray: uint8 array of shape (ceil(H / step), ceil(W / step)).
+    """
+    height, width = sobel_magnitude.shape
+    half = int((window_size - 1) / 2)
+
+    sobel_table = cv2.integral(sobel_magnitude, sdepth=cv2.CV_64F)
+    mask_table = cv2.integral(mask, sdepth=cv2.CV_64F)
+
+    ys = np.arange(0, height, window_step)
+    xs = np.arange(0, width, window_step)
+    y0, y1 = _window_bounds(ys, half, window_size, height)
+    x0, x1 = _window_bounds(xs, half, window_size, width)
+
+    window_sums = _table_sums(sobel_table, y0, y1, x0, x1)
+    mask_sums = _table_sums(mask_table, y0, y1, x0, x1)
+    centre_on_metal = mask[np.ix_(ys, xs)] != 0
+
+    return _masked_means(window_sums, mask_sums, centre_on_metal)
+
+
+def full_window_means(sobel_magnitude, mask, window_size=WINDOW_SIZE):
+    """
+    Masked window means evaluated at every pixel.
+
+    Returns:
+        ndarray: uint8 array with the image shape.
+    """
+    half = int((window_size - 1) / 2)
+    box = dict(ksize=(window_size, window_size), anchor=(half, half),
+               normalize=False, borderType=cv2.BORDER_CONSTANT)
+
+    window_sums = cv2.boxFilter(sobel_magnitude, cv2.CV_64F, **box)
+    mask_sums = cv2.boxFilter(mask, cv2.CV_64F, **box)
+
+    return _masked_means(window_sums, mask_sums, mask != 0)
+
+
+def pyramid_window_means(img, contour, window_size=WINDOW_SIZE, window_step=WINDOW_STEP):
+    """
+    Masked window means computed at the pyramid level and upsampled to the
+    image size, plus the full-resolution specimen mask.
+
+    The per-pixel gradient energy is still computed at full resolution (a
+    few uint8 passes): its uint8 wrap-around makes it a non-linear function
+    of the local gradient that a downsampled Sobel cannot reproduce. It is
+    area-averaged down to the pyramid level together with the mask, which
+    preserves window sums, and the float window sums, normalisation and
+    everything after them run on factor^2 fewer pixels.
+    """
+    factor = pyramid_factor(window_size, window_step)
+    sobel_magnitude, mask = gradient_energy(img, contour)
+    height, width = mask.shape
+    size = (math.ceil(width / factor), math.ceil(height / factor))
+
+    small_sobel = cv2.resize(sobel_magnitude, size, interpolation=cv2.INTER_AREA)
+    small_mask = cv2.resize(mask, size, interpolation=cv2.INTER_AREA)
+
+    # Odd window at the small size, so it stays centred
+    small_window = 2 * int(round((window_size / factor - 1) / 2)) + 1
+    means = full_window_means(small_sobel, small_mask, small_window)
+
+    return cv2.resize(means, (width, height), interpolation=cv2.INTER_LINEAR), mask
+
+
+def heatmap_values(img, contour, window_size=WINDOW_SIZE, window_step=WINDOW_STEP, mode="compat"):
+    """
+    Single-channel heatmap before equalisation and colouring (see get_heatmap).
+
+    Returns:
+        tuple: (heat_map_sobel uint8, mask uint8) with the image shape.
+    """
+    if mode not in HEATMAP_MODES:
+        raise ValueError(f"Unknown heatmap mode '{mode}', expected one of {HEATMAP_MODES}")
+
+    if mode == "pyramid":
+        return pyramid_window_means(img, contour, window_size, window_step)
+
+    sobel_magnitude, mask = gradient_energy(img, contour)
+    height, width = mask.shape
+
+    if mode == "compat":
+        blocks = block_window_means(sobel_magnitude, mask, window_size, window_step)
+        heat_map_sobel = np.repeat(np.repeat(blocks, window_step, axis=0), window_step, axis=1)
+        heat_map_sobel = np.ascontiguousarray(heat_map_sobel[:height, :width])
+    else:
+        heat_map_sobel = full_window_means(sobel_magnitude, mask, window_size)
+
+    return heat_map_sobel, mask
+
+
+def get_heatmap(img, contour, window_size=WINDOW_SIZE, window_step=WINDOW_STEP, mode="compat"):
+    """
+    Generates the colour heatmap of local gradient energy inside the specimen.
+
+    Args:
+        img (ndarray): BGR SEM image.
+        contour (ndarray): External contour of the specimen.
+        window_size (int): Side of the averaging window in pixels.
+        window_step (int): Block size of the compat mode output.
+        mode (str): "compat" for the original step-quantised blocks,
+            "full" for a per-pixel heatmap, "pyramid" for the per-pixel
+            heatmap computed at a downsampled level.
+
+    Returns:
+        ndarray: BGR heatmap with a black background.
+    """
+    return colorize_heatmap(*heatmap_values(img, contour, window_size, window_step, mode))
+
+
+def get_heatmap_reference(img, contour, window_size=WINDOW_SIZE, window_step=WINDOW_STEP):
+    """
+    Original notebook implementation, kept verbatim to validate get_heatmap.
+    It is O(pixels x window_size^2 / window_step^2); do not use it in batches.
+    """
+    img_grey = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    # Create a mask with the contour
+    mask = np.zeros(img_grey.shape, np.uint8)
+    cv2.drawContours(mask, [contour], -1, (255, 255, 255), -1, cv2.LINE_AA)
+
+    # Create an output image where the mask is applied
+    out = np.zeros_like(img)
+    out[mask == 255] = img[mask == 255]
+    img_color = cv2.cvtColor(out, cv2.COLOR_BGR2RGB)
+
+    # Process for heatmap generation
+    img_grey = cv2.cvtColor(img_color, cv2.COLOR_BGR2GRAY)
+    blur = cv2.GaussianBlur(img_grey, (13, 13), 0)
+
+    sobelx = cv2.Sobel(blur, cv2.CV_8U, 1, 0, ksize=5)
+    sobely = cv2.Sobel(blur, cv2.CV_8U, 0, 1, ksize=5)
+
+    sobel_magnitude = np.sqrt(sobelx**2 + sobely**2)
+    sobel_magnitude = sobel_magnitude / sobel_magnitude.max() * 255
+    sobel_magnitude = np.uint8(sobel_magnitude)
+
+    heat_map_sobel = np.zeros(sobel_magnitude.shape, dtype=np.uint8)
+
+    # Pad the images
+    sobel_c = np.pad(sobel_magnitude, int((window_size-1)/2), mode='constant', constant_values=0)
+    mask_metal_c = np.pad(mask, int((window_size-1)/2), mode='constant', constant_values=0)
+
+    for y in range(0, sobel_c.shape[0], window_step):
+        for x in range(0, sobel_c.shape[1], window_step):
+            window = sobel_c[y:y+window_size, x:x+window_size]
+            mask_metal_window = mask_metal_c[y:y+window_size, x:x+window_size] / 255
+            if mask_metal_window.sum() == 0 or mask_metal_window[int((window_size - 1) / 2), int((window_size - 1) / 2)] == 0:
+                heat_map_sobel[y:y+window_step, x:x+window_step] = 0
+            else:
+                heat_map_sobel[y:y+window_step, x:x+window_step] = np.sum(window) / mask_metal_window.sum()
+
+    return colorize_heatmap(heat_map_sobel, mask)
+
+
+def compare_with_reference(img, contour, window_size=WINDOW_SIZE, window_step=WINDOW_STEP):
+    """
+    Runs the compat engine and the original loop on the same input.
+
+    Returns:
+        dict: number of differing pixels and the largest channel difference.
+    """
+    fast = get_heatmap(img, contour, window_size, window_step, mode="compat")
+    reference = get_heatmap_reference(img, contour, window_size, window_step)
+    diff = cv2.absdiff(fast, reference)
+    return {
+        "mismatched_pixels": int(np.count_nonzero(diff.any(axis=2))),
+        "max_abs_diff": int(diff.max()),
+    }
+
+
+def compare_modes(img, contour, window_size=WINDOW_SIZE, window_step=WINDOW_STEP, mode="pyramid", reference="full"):
+    """
+    Runs two heatmap modes on the same input and compares the equalised
+    heat values (what the colormap shows) inside the specimen.
+
+    Returns:
+        dict: run time of both modes, mean / 99th percentile / max absolute
+        difference (0-255 scale) and the fraction of specimen pixels that
+        differ by more than 16 levels (one JET colour band).
+    """
+    values, seconds = {}, {}
+    for m in (mode, reference):
+        start = time.perf_counter()
+        heat_map_sobel, mask = heatmap_values(img, contour, window_size, window_step, m)
+        values[m] = cv2.equalizeHist(heat_map_sobel)
+        seconds[m] = round(time.perf_counter() - start, 3)
+
+    inside = mask == 255
+    diff = cv2.absdiff(values[mode], values[reference])[inside].astype(np.float64)
+    return {
+        f"{mode}_seconds": seconds[mode],
+        f"{reference}_seconds": seconds[reference],
+        "mean_abs_diff": round(float(diff.mean()), 2),
+        "p99_abs_diff": float(np.percentile(diff, 99)),
+        "max_abs_diff": int(diff.max()),
+        "over_16_fraction": round(float((diff > 16).mean()), 4),
+    }
+
+
+# === Tiled Heatmap ===
+def _energy_tile(source, mask, tile):
+    """Wrapped uint8 gradient energy of one tile (before the max-normalisation)."""
+    y0, y1, x0, x1 = tile
+    bounds, pads = padded_bounds(source.shape, y0, y1, x0, x1, GRADIENT_HALO)
+    ry0, ry1, rx0, rx1 = bounds
+    img = source.read(*bounds)
+    mask = np.asarray(mask[ry0:ry1, rx0:rx1])
+
+    out = cv2.bitwise_and(img, img, mask=cv2.compare(mask, 255, cv2.CMP_EQ))
+    img_grey = pad(cv2.cvtColor(out, cv2.COLOR_RGB2GRAY), pads, cv2.BORDER_REFLECT_101)
+    blur = cv2.GaussianBlur(img_grey, (13, 13), 0)
+
+    sobelx = cv2.Sobel(blur, cv2.CV_8U, 1, 0, ksize=5)
+    sobely = cv2.Sobel(blur, cv2.CV_8U, 0, 1, ksize=5)
+    energy = sobelx**2 + sobely**2
+
+    h = GRADIENT_HALO
+    return energy[h:h + y1 - y0, h:h + x1 - x0]
+
+
+def _equalize_lut(hist):
+    """The lookup table cv2.equalizeHist builds from an image histogram."""
+    lut = np.zeros(256, np.uint8)
+    first = int(np.flatnonzero(hist)[0])
+    total = int(hist.sum())
+    if hist[first] == total:
+        lut[:] = first
+        return lut
+    scale = np.float32(255) / np.float32(total - hist[first])
+    cumulative = np.cumsum(hist[first + 1:]).astype(np.float32)
+    lut[first + 1:] = np.clip(np.rint(cumulative * scale), 0, 255)
+    return lut
+
+
+def stream_heatmap(source, contour, output_path, window_size=WINDOW_SIZE, window_step=WINDOW_STEP,
+                   mode="compat", tile_size=DEFAULT_TILE_SIZE):
+    """
+    Writes the heatmap of a tiled image to an uncompressed TIFF, holding
+    only one padded tile at a time in memory (the energy and the specimen
+    mask, one byte per pixel each, are kept in temporary files next to the
+    output). Same result as get_heatmap.
+
+    Args:
+        source: Tiled image (TiffImage or ArrayImage).
+        contour (ndarray): External contour of the specimen (full resolution).
+        output_path (str): Output `.tif` file.
+        mode (str): "compat" or "full".
+        tile_size (int): Tile side; rounded down to a multiple of window_step.
+
+    Returns:
+        str: output_path.
+    """
+    if mode not in ("compat", "full"):
+        raise ValueError(f"Heatmap mode '{mode}' cannot be streamed, use 'compat' or 'full'")
+    tile_size = max(tile_size // window_step, 1) * window_step
+    height, width = source.shape[:2]
+    half = int((window_size - 1) / 2)
+    tiles = list(iter_tiles(source.shape, tile_size))
+
+    # The specimen mask is drawn once, full frame, into a file-backed map:
+    # OpenCV's anti-aliased outline depends on where the canvas clips it
+    energy_path = f"{output_path}.{os.getpid()}.energy"
+    mask_path = f"{output_path}.{os.getpid()}.mask"
+    mask = np.memmap(mask_path, np.uint8, "w+", shape=(height, width))
+    energy = np.memmap(energy_path, np.uint8, "w+", shape=(height, width))
+    try:
+        cv2.drawContours(mask, [contour], -1, (255, 255, 255), -1, cv2.LINE_AA)
+
+        # Pass 1: gradient energy, kept on disk next to the output, and its maximum
+        energy_max = 0
+        for y0, y1, x0, x1 in tiles:
+            energy[y0:y1, x0:x1] = _energy_tile(source, mask, (y0, y1, x0, x1))
+            energy_max = max(energy_max, int(energy[y0:y1, x0:x1].max()))
+        root = np.sqrt(np.arange(256, dtype=np.uint8))
+        lut = np.uint8(root / root[energy_max] * 255)
+
+        # Pass 2: window means with a half-window halo, stored in the output's first channel
+        output = create_tiff(output_path, height, width)
+        hist = np.zeros(256, np.int64)
+        for y0, y1, x0, x1 in tiles:
+            (ry0, ry1, rx0, rx1), pads = padded_bounds(energy.shape, y0, y1, x0, x1, half)
+            sobel_magnitude = pad(cv2.LUT(np.asarray(energy[ry0:ry1, rx0:rx1]), lut), pads)
+            tile_mask = pad(np.asarray(mask[ry0:ry1, rx0:rx1]), pads)
+            means = full_window_means(sobel_magnitude, tile_mask, window_size)[half:half + y1 - y0, half:half + x1 - x0]
+            if mode == "compat":
+                blocks = means[::window_step, ::window_step]
+                means = np.repeat(np.repeat(blocks, window_step, axis=0), window_step, axis=1)[:y1 - y0, :x1 - x0]
+            output[y0:y1, x0:x1, 0] = means
+            hist += np.bincount(means.ravel(), minlength=256)
+
+        # Pass 3: equalise with the whole-image histogram, colour, black background
+        equalize = _equalize_lut(hist)
+        for y0, y1, x0, x1 in tiles:
+            heat = cv2.LUT(np.ascontiguousarray(output[y0:y1, x0:x1, 0]), equalize)
+            color = cv2.applyColorMap(heat, cv2.COLORMAP_JET)
+            color[mask[y0:y1, x0:x1] == 0] = (0, 0, 0)
+            output[y0:y1, x0:x1] = color[..., ::-1]
+        output.flush()
+        del output
+    finally:
+        del energy, mask
+        os.remove(energy_path)
+        os.remove(mask_path)
+    return output_path
+
+
+def tiled_heatmap_file(filename, input_dir, output_dir, mode="compat", tile_size=DEFAULT_TILE_SIZE):
+    """
+    Heatmap stage for TIFFs too large to decode whole: the specimen contour
+    comes from a downsampled copy (Masking.stream_specimen_contour) and the
+    heatmap is streamed to `<name>_heatmap.tif`. The frame is cropped to a
+    square as in the notebook.
+
+    Returns:
+        str: Path of the saved heatmap.
+    """
+    source = TiffImage(os.path.join(input_dir, filename))
+    source = TiffImage(source.path, max_height=source.shape[1])
+
+    ext_contour = stream_specimen_contour(source, tile_size=tile_size)
+    if ext_contour is None:
+        raise FileSkipped(f"No valid contour found for {filename}, skipping.")
+
+    heatmap_path = os.path.join(output_dir, f"{os.path.splitext(filename)[0]}_heatmap.tif")
+    return stream_heatmap(source, ext_contour, heatmap_path, mode=mode, tile_size=tile_size)
+
+
+# === Per-File Heatmap Stage ===
+def heatmap_file(filename, input_dir, mask_dir, output_dir, mode="compat"):
+    """
+    Generates and saves the heatmap of one image from its saved mask.
+
+    Args:
+        filename (str): PNG file name inside input_dir.
+        input_dir (str): Directory containing input images.
+        mask_dir (str): Directory containing the `*_mask.png` masks.
+        output_dir (str): Directory to save the `*_heatmap.png` file.
+        mode (str): Heatmap mode, see get_heatmap.
+
+    Returns:
+        str: Path of the saved heatmap.
+
+    Raises:
+        FileSkipped: If the mask or its contour is missing.
+    """
+    image_path = os.path.join(input_dir, filename)
+    mask_path = os.path.join(mask_dir, f"{os.path.splitext(filename)[0]}_mask.png")
+
+    # Ensure mask exists
+    if not os.path.exists(mask_path):
+        raise FileSkipped(f"Mask not found for {filename}, skipping.")
+
+    # Load the image and mask
+    img = cv2.imread(image_path)
+    mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+    Instrument.note_frame(img)
+
+    # Get the contour from the saved mask
+    ext_contour = get_contour(mask)
+    if ext_contour is None:
+        raise FileSkipped(f"No valid contour found for {filename}, skipping.")
+
+    heatmap_img = get_heatmap(img, ext_contour, mode=mode)
+
+    heatmap_path = os.path.join(output_dir, f"{os.path.splitext(filename)[0]}_heatmap.png")
+    Instrument.imwrite(heatmap_path, heatmap_img)
+    return heatmap_path
+
+
+def process_heatmaps(input_dir, mask_dir, output_dir):
+    """
+    Processes all images in a directory to generate heatmaps based on Sobel filtering.
+    Serial version; BatchRunner.py runs the same heatmap_file over a process pool.
+
+    Args:
+        input_dir (str): Directory containing input images.
+        mask_dir (str): Directory containing saved masks.
+        output_dir (str): Directory to save generated heatmaps.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    for filename in os.listdir(input_dir):
+        if filename.endswith('.png'):  # Process only PNG files
+            try:
+                heatmap_path = heatmap_file(filename, input_dir, mask_dir, output_dir)
+            except FileSkipped as reason:
+                print(reason)
+                continue
+            print(f"Heatmap saved: {heatmap_path}")
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import cv2
+
+from PipelineCore import Instrument
+from PipelineCore.BatchRunner import list_inputs, run_batch
+from PipelineCore.Preprocess import load_image, crop_square
+
+"""
+Description:
+Ingest stage: raw SEM `.tif` -> square-cropped `.png`, one decode and one
+encode per image.
+
+The notebook used to convert every TIFF to PNG with PIL and then re-read,
+crop and overwrite each PNG in place: two decodes and two PNG encodes per
+image, and an interrupted run left some files cropped and some not. Here
+each TIFF is decoded once (OpenCV, 8-bit BGR - what the cropping cell read
+back from the PIL PNG), cropped to a square in memory and written to a
+temporary file that is renamed into place, so an output either is complete
+or does not exist.
+
+Every ingested file gets a line in `ingest_manifest.jsonl` in the output
+folder (source size and modification time, output name, shapes). Inputs
+whose manifest entry still matches the source and whose output exists are
+skipped, so re-running after a crash or on a growing folder only ingests
+what is new. ingest_file is a per-file stage for BatchRunner.py:
+
+    python -m PipelineCore.BatchRunner ingest <raw> <ingested> --workers 8
+"""
+
+RAW_EXTENSIONS = (".tif", ".tiff")
+MANIFEST_NAME = "ingest_manifest.jsonl"
+
+
+def output_name(filename):
+    """`<name>.png` for `<name>.tif`, as the notebook's conversion named it."""
+    return os.path.splitext(filename)[0] + ".png"
+
+
+def read_manifest(output_dir):
+    """source file name -> latest manifest entry (empty if there is no manifest)."""
+    entries = {}
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash: that file is ingested again
+                    continue
+                entries[entry["source"]] = entry
+    return entries
+
+
+def _append_manifest(output_dir, entry):
+    """Appends one entry with a single write, so parallel workers do not interleave."""
+    line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+    fd = os.open(os.path.join(output_dir, MANIFEST_NAME), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def _is_current(entry, source_path, output_dir):
+    stat = os.stat(source_path)
+    return (entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+            and os.path.exists(os.path.join(output_dir, entry["output"])))
+
+
+def pending_inputs(filenames, input_dir, output_dir, force=False):
+    """The files of `filenames` that are not ingested yet (all of them when forcing)."""
+    if force:
+        return list(filenames)
+    manifest = read_manifest(output_dir)
+    return [f for f in filenames if not _is_current(manifest.get(f), os.path.join(input_dir, f), output_dir)]
+
+
+def ingest_file(filename, input_dir, output_dir, square=True):
+    """
+    Decodes one raw image, crops it to a square and writes `<name>.png`
+    atomically, then records it in the manifest.
+
+    Args:
+        filename (str): Raw image inside input_dir.
+        input_dir (str): Folder of the raw `.tif` files.
+        output_dir (str): Folder for the `.png` files and the manifest (may
+            be input_dir, as in the notebook).
+        square (bool): Crop to width x width (drops the SEM info bar).
+
+    Returns:
+        str: Summary of the ingested file.
+    """
+    start = time.perf_counter()
+    source_path = os.path.join(input_dir, filename)
+    stat = os.stat(source_path)
+
+    img = load_image(source_path)
+    Instrument.note_frame(img)
+    cropped = crop_square(img) if square else img
+
+    name = output_name(filename)
+    with Instrument.fine_span("png_encode", file=name):
+        ok, encoded = cv2.imencode(".png", cropped)
+    if not ok:
+        raise ValueError(f"Could not encode {name}")
+    # Not a .png name, so an interrupted write is never picked up as an image
+    tmp_path = os.path.join(output_dir, f"{name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(encoded.tobytes())
+    os.replace(tmp_path, os.path.join(output_dir, name))
+
+    _append_manifest(output_dir, {
+        "source": filename, "output": name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+        "source_shape": list(img.shape[:2]), "output_shape": list(cropped.shape[:2]),
+        "seconds": round(time.perf_counter() - start, 3),
+    })
+    return f"{filename} -> {name} {cropped.shape[1]}x{cropped.shape[0]}"
+
+
+def ingest_folder(input_dir, output_dir=None, workers=1, force=False):
+    """
+    Ingests every raw image of a folder that is not ingested yet.
+
+    Args:
+        input_dir (str): Folder of the raw `.tif` files.
+        output_dir (str): Output folder; defaults to input_dir.
+        workers (int): Worker processes (1 runs in this process).
+        force (bool): Ingest every file again.
+
+    Returns:
+        dict: BatchRunner-style report ("done", "skipped", "failed").
+    """
+    output_dir = output_dir or input_dir
+    os.makedirs(output_dir, exist_ok=True)
+    filenames = list_inputs(input_dir, RAW_EXTENSIONS)
+    pending = pending_inputs(filenames, input_dir, output_dir, force)
+    print(f"📥 {len(pending)} to ingest, {len(filenames) - len(pending)} already ingested")
+
+    kwargs = {"input_dir": input_dir, "output_dir": output_dir}
+    if workers > 1:
+        return run_batch(ingest_file, pending, kwargs, workers)
+
+    report = {"done": [], "skipped": [], "failed": []}
+    for filename in pending:
+        try:
+            print(f"Ingested: {ingest_file(filename, **kwargs)}")
+            report["done"].append({"file": filename})
+        except Exception as error:
+            print(f"❌ {filename}: {error}")
+            report["failed"].append({"file": filename, "message": str(error)})
+    return report
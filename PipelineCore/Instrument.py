@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import uuid
+from contextlib import contextmanager
+import cv2
+
+"""
+Description:
+Structured timing records for the pipeline stages, as JSON lines.
+
+Tracing is off unless enable() is called (BatchRunner.py --trace) or the
+FRACTO_TRACE environment variable names a file; then every span appends one
+line to that file:
+
+    {"span": "phases", "specimen": "S1_heatmap_highlighted.png", "run": "...",
+     "wall_s": 2.1, "cpu_s": 2.0, "peak_rss_mb": 412.3, "read_bytes": ...,
+     "written_bytes": ..., "pixels": 16777216, "megapixels_per_second": 8.0, ...}
+
+Stage spans (span) wrap a whole stage of one specimen: each file of a
+BatchRunner batch and each stage of StageGraph.run. CPU time is the
+process's (above the wall time when OpenCV runs threads); bytes are the
+process's read/write syscall totals (/proc/self/io); peak RSS is the high
+water mark during the span (reset at every stage span on Linux, so nested
+stages each get their own peak). Fine spans (fine_span) time sub-steps
+inside the hot code - HSV classification, morphology, connected
+components, the spline fit, PNG encoding - and are recorded only with
+enable(fine=True) / FRACTO_TRACE_FINE=1.
+
+The settings live in environment variables, so BatchRunner's worker
+processes inherit them; records are appended with one write each, so
+workers share the file safely. summarize() aggregates the records of a
+run per span and finish() appends that summary as a last line.
+"""
+
+TRACE_ENV = "FRACTO_TRACE"
+TRACE_FINE_ENV = "FRACTO_TRACE_FINE"
+TRACE_RUN_ENV = "FRACTO_TRACE_RUN"
+
+# Exceptions that mean "nothing to do" rather than a failure
+SKIP_EXCEPTIONS = ("FileSkipped", "PhaseSkipped")
+
+_stack = []
+
+
+class _Null(dict):
+    """Stands in for the record when tracing is off; fields set on it are dropped."""
+
+    def __setitem__(self, key, value):
+        pass
+
+
+_NULL = _Null()
+
+
+def enable(path, fine=False, run=None):
+    """
+    Starts writing span records to `path` (JSON lines, appended), in this
+    process and in the worker processes it starts from now on.
+
+    Args:
+        path (str): Trace file.
+        fine (bool): Also record the fine-grained sub-step spans.
+        run (str): Run id stored in every record; a new one by default.
+
+    Returns:
+        str: The run id.
+    """
+    run = run or f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    os.environ[TRACE_ENV] = os.path.abspath(path)
+    os.environ[TRACE_FINE_ENV] = "1" if fine else ""
+    os.environ[TRACE_RUN_ENV] = run
+    return run
+
+
+def disable():
+    for name in (TRACE_ENV, TRACE_FINE_ENV, TRACE_RUN_ENV):
+        os.environ.pop(name, None)
+
+
+def enabled(fine=False):
+    return bool(os.environ.get(TRACE_ENV)) and (not fine or bool(os.environ.get(TRACE_FINE_ENV)))
+
+
+# === Process Counters ===
+def _io_bytes():
+    """(read, written) bytes of this process's read/write syscalls, or (None, None)."""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _reset_peak_rss():
+    """Resets the Linux high water mark (VmHWM); False where that is not possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    import sys
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def _append(record):
+    line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+    fd = os.open(os.environ[TRACE_ENV], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+# === Spans ===
+@contextmanager
+def _record_span(name, fine, fields):
+    parent = _stack[-1] if _stack else None
+    record = {"span": name, "specimen": parent["specimen"] if parent else None, "run": os.environ.get(TRACE_RUN_ENV),
+              "pid": os.getpid(), "parent": parent["span"] if parent else None, "fine": fine, **fields}
+    if not fine:
+        # The parent's peak so far is kept before the counter is reset for this span
+        if parent is not None:
+            parent["_peak"] = max(parent.get("_peak", 0), _peak_rss_mb())
+        record["_reset"] = _reset_peak_rss()
+
+    read_before, written_before = _io_bytes()
+    cpu_before = time.process_time()
+    record["start"] = time.time()
+    start = time.perf_counter()
+    _stack.append(record)
+    try:
+        yield record
+    except BaseException as error:
+        record.setdefault("status", "skipped" if type(error).__name__ in SKIP_EXCEPTIONS else "failed")
+        record.setdefault("error", f"{type(error).__name__}: {error}")
+        raise
+    finally:
+        _stack.pop()
+        record["wall_s"] = round(time.perf_counter() - start, 6)
+        record["cpu_s"] = round(time.process_time() - cpu_before, 6)
+        read_after, written_after = _io_bytes()
+        if read_before is not None:
+            record["read_bytes"] = read_after - read_before
+            record["written_bytes"] = written_after - written_before
+        if not fine:
+            peak = max(record.pop("_peak", 0), _peak_rss_mb())
+            # Without a reset the counter is the peak of the whole process so far
+            record["peak_rss_mb" if record.pop("_reset") else "process_peak_rss_mb"] = round(peak, 1)
+            if parent is not None:
+                parent["_peak"] = max(parent.get("_peak", 0), peak)
+        if record.get("pixels") and record["wall_s"] > 0:
+            record["megapixels_per_second"] = round(record["pixels"] / 1e6 / record["wall_s"], 3)
+        _append({key: value for key, value in record.items() if not key.startswith("_")})
+
+
+def span(name, specimen=None, pixels=None, **fields):
+    """
+    Stage span: times the block and appends its record when tracing is on.
+
+    Args:
+        name (str): Stage name.
+        specimen (str): Specimen (file) the stage works on; nested spans
+            inherit it.
+        pixels (int): Frame pixels, for the megapixels/s figure (can also
+            be set later with note_frame).
+        **fields: Extra fields for the record.
+
+    Yields:
+        dict: The record; fields set on it (e.g. "status") are written.
+    """
+    if not enabled():
+        return _null_span()
+    fields = {key: value for key, value in fields.items() if value is not None}
+    if specimen is not None:
+        fields["specimen"] = specimen
+    if pixels is not None:
+        fields["pixels"] = int(pixels)
+    return _record_span(name, False, fields)
+
+
+def fine_span(name, **fields):
+    """Sub-step span, recorded only when fine tracing is on."""
+    if not enabled(fine=True):
+        return _null_span()
+    return _record_span(name, True, fields)
+
+
+@contextmanager
+def _null_span():
+    yield _NULL
+
+
+def note_frame(img):
+    """Sets the frame pixels of the open stage spans that do not have them yet."""
+    if _stack:
+        for record in _stack:
+            if not record["fine"] and not record.get("pixels"):
+                record["pixels"] = int(img.shape[0] * img.shape[1])
+
+
+def imwrite(path, img, params=None):
+    """cv2.imwrite inside a "png_encode" (or "jpg_encode", ...) fine span."""
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    with fine_span(f"{extension}_encode", file=os.path.basename(path)):
+        return cv2.imwrite(path, img, params or [])
+
+
+# === Summary ===
+def read_records(path, run=None):
+    """Span records of a trace file (one run only if given); summary lines are skipped."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "span" in record and record["span"] != "summary" and (run is None or record.get("run") == run):
+                records.append(record)
+    return records
+
+
+def summarize(records):
+    """
+    Aggregates span records per span name.
+
+    Returns:
+        dict: span -> count, failed, total/mean/max wall seconds, total CPU
+        seconds, max peak RSS (MB), total bytes read/written and overall
+        megapixels/s (total pixels / total wall time).
+    """
+    summary = {}
+    for record in records:
+        entry = summary.setdefault(record["span"], {
+            "count": 0, "failed": 0, "wall_s": 0.0, "max_wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": None,
+            "read_bytes": 0, "written_bytes": 0, "pixels": 0, "fine": record.get("fine", False)})
+        entry["count"] += 1
+        entry["failed"] += record.get("status") == "failed"
+        entry["wall_s"] += record["wall_s"]
+        entry["max_wall_s"] = max(entry["max_wall_s"], record["wall_s"])
+        entry["cpu_s"] += record["cpu_s"]
+        peak = record.get("peak_rss_mb", record.get("process_peak_rss_mb"))
+        if peak is not None:
+            entry["peak_rss_mb"] = max(entry["peak_rss_mb"] or 0, peak)
+        entry["read_bytes"] += record.get("read_bytes") or 0
+        entry["written_bytes"] += record.get("written_bytes") or 0
+        entry["pixels"] += record.get("pixels") or 0
+
+    for entry in summary.values():
+        entry["mean_wall_s"] = entry["wall_s"] / entry["count"]
+        entry["megapixels_per_second"] = entry["pixels"] / 1e6 / entry["wall_s"] if entry["pixels"] and entry["wall_s"] else None
+        for key in ("wall_s", "max_wall_s", "mean_wall_s", "cpu_s"):
+            entry[key] = round(entry[key], 4)
+        if entry["megapixels_per_second"] is not None:
+            entry["megapixels_per_second"] = round(entry["megapixels_per_second"], 3)
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'span':<22}{'count':>7}{'total s':>10}{'mean s':>9}{'cpu s':>9}{'peak MB':>9}{'MP/s':>8}{'read MB':>9}{'written MB':>11}")
+    for name, entry in sorted(summary.items(), key=lambda item: (item[1]["fine"], -item[1]["wall_s"])):
+        peak = f"{entry['peak_rss_mb']:.0f}" if entry["peak_rss_mb"] is not None else "-"
+        rate = f"{entry['megapixels_per_second']:.2f}" if entry["megapixels_per_second"] is not None else "-"
+        label = ("  " if entry["fine"] else "") + name
+        print(f"{label:<22}{entry['count']:>7}{entry['wall_s']:>10.2f}{entry['mean_wall_s']:>9.3f}{entry['cpu_s']:>9.2f}"
+              f"{peak:>9}{rate:>8}{entry['read_bytes'] / 1e6:>9.1f}{entry['written_bytes'] / 1e6:>11.1f}")
+
+
+def finish(verbose=True):
+    """
+    Summarises the records of the current run, appends the summary as a
+    last line {"span": "summary", "run": ..., "spans": {...}} and prints it.
+
+    Returns:
+        dict: The summary (empty if tracing is off).
+    """
+    if not enabled():
+        return {}
+    run = os.environ.get(TRACE_RUN_ENV)
+    path = os.environ[TRACE_ENV]
+    summary = summarize(read_records(path, run)) if os.path.exists(path) else {}
+    _append({"span": "summary", "run": run, "spans": summary})
+    if verbose:
+        print(f"📊 Trace summary ({path}):")
+        print_summary(summary)
+    return summary
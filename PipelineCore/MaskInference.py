@@ -0,0 +1,308 @@
+import os
+import sys
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+from PipelineCore.BatchRunner import list_inputs
+from PipelineCore.Masking import extract_segmented_inner_shape, refine_specimen_mask
+from PipelineCore.Preprocess import load_image
+from PipelineCore.TiledImage import ArrayImage, iter_tiles, read_padded
+
+"""
+Description:
+Mask stage that runs the notebook's UNet models (external_mask_unet_model.h5,
+internal_smaller_mask_unet_model.h5) over a folder, as an alternative to the
+CLAHE/Canny extract_mask_from_array path. It writes the same `<name>_mask.png`
+(and optionally `<name>_segmented_inner.png`) files, so the heatmap stage
+reads them unchanged.
+
+    - Each model is loaded once per process (load_mask_model) and on the CPU
+      only: CUDA devices are hidden before Keras is imported.
+    - Images are cut into model-sized tiles with an overlap; only the tile
+      cores are kept, so tile borders never reach the mask. Tiles of
+      consecutive images share batches, so every predict call gets a full
+      batch however the image sizes divide into tiles.
+    - Decoding and tiling of the next images, and writing of finished masks,
+      run on a thread pool while the model predicts (OpenCV and TensorFlow
+      release the GIL).
+    - The thresholded mask gets the same largest-contour / centred-circle
+      refinement as specimen_mask, unless refine=False.
+
+Models with a fixed input size get tiles of that size; fully convolutional
+models get `tile_size` tiles. A model trained on whole downsized frames is
+run with fit=True (each image resized to the model input, one tile). Tiles
+are the image as cv2.imread reads it (grey for 1-channel models, BGR
+otherwise) scaled to [0, 1].
+
+Usage (from the repository root):
+    python -m PipelineCore.MaskInference <model.h5> <images> <masks> --segmented-inner <dir> --batch-size 8
+"""
+
+MASK_SUFFIX = "_mask"
+SEGMENTED_INNER_SUFFIX = "_segmented_inner"
+
+_MODELS = {}
+
+
+def load_mask_model(model_path, threads=None):
+    """
+    Loads a Keras model once per process, CPU only.
+
+    Args:
+        model_path (str): `.h5` / `.keras` model file.
+        threads (int): TensorFlow intra-op threads (default: TensorFlow's
+            choice). Only takes effect before the first model is loaded.
+    """
+    if model_path not in _MODELS:
+        os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+        os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+        import tensorflow as tf
+        from keras.models import load_model
+        try:
+            tf.config.set_visible_devices([], "GPU")
+            if threads:
+                tf.config.threading.set_intra_op_parallelism_threads(threads)
+        except RuntimeError:
+            # TensorFlow was already initialised by an earlier model
+            pass
+        _MODELS[model_path] = load_model(model_path, compile=False)
+    return _MODELS[model_path]
+
+
+class MaskPredictor:
+    """
+    Tiles images for a segmentation model and stitches its predictions
+    back into masks. The model is anything with Keras' `input_shape` and
+    `predict_on_batch`.
+    """
+
+    def __init__(self, model, tile_size=512, overlap=64, threshold=0.5, fit=False):
+        """
+        Args:
+            model: Loaded model, or a model path (see load_mask_model).
+            tile_size (int): Tile side for models without a fixed input size.
+            overlap (int): Pixels shared by neighbouring tiles; half of it on
+                each side of a tile is context that is not kept.
+            threshold (float): Probability above which a pixel is masked.
+            fit (bool): Resize each whole image to the model input instead
+                of tiling it.
+        """
+        self.model = load_mask_model(model) if isinstance(model, str) else model
+        _, height, width, channels = self.model.input_shape
+        self.tile_shape = (height or tile_size, width or tile_size)
+        self.channels = channels or 3
+        self.halo = overlap // 2
+        self.threshold = threshold
+        self.fit = fit
+        if not fit and min(self.tile_shape) <= 2 * self.halo:
+            raise ValueError(f"Overlap {overlap} leaves no tile core in {self.tile_shape} tiles")
+
+    def _input(self, img):
+        if self.channels == 1:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+            return img[..., None].astype(np.float32) / 255
+        return img.astype(np.float32) / 255
+
+    def prepare(self, img):
+        """
+        Cuts an image into model inputs.
+
+        Returns:
+            tuple: (list of (tile_h, tile_w, channels) float32 tiles, layout
+            for stitch).
+        """
+        tile_h, tile_w = self.tile_shape
+        if self.fit:
+            small = cv2.resize(img, (tile_w, tile_h), interpolation=cv2.INTER_AREA)
+            return [self._input(small)], {"shape": img.shape[:2], "tiles": None}
+
+        # Square tile cores; the rest of each tile is the halo around them
+        core = min(tile_h, tile_w) - 2 * self.halo
+        source = ArrayImage(img)
+        tiles, bounds = [], []
+        for y0, y1, x0, x1 in iter_tiles(img.shape, core):
+            tile = read_padded(source, y0, y0 + core, x0, x0 + core, self.halo)
+            if tile.shape[:2] != (tile_h, tile_w):
+                tile = cv2.copyMakeBorder(tile, 0, tile_h - tile.shape[0], 0, tile_w - tile.shape[1],
+                                          cv2.BORDER_CONSTANT, value=0)
+            tiles.append(self._input(tile))
+            bounds.append((y0, y1, x0, x1))
+        return tiles, {"shape": img.shape[:2], "tiles": bounds}
+
+    def stitch(self, layout, predictions):
+        """Binary mask (0/255) of an image from the predictions of its tiles."""
+        height, width = layout["shape"]
+        if layout["tiles"] is None:
+            probability = cv2.resize(predictions[0], (width, height), interpolation=cv2.INTER_LINEAR)
+        else:
+            probability = np.zeros((height, width), np.float32)
+            for (y0, y1, x0, x1), prediction in zip(layout["tiles"], predictions):
+                probability[y0:y1, x0:x1] = prediction[self.halo:self.halo + y1 - y0, self.halo:self.halo + x1 - x0]
+        return np.where(probability > self.threshold, 255, 0).astype(np.uint8)
+
+    def predict(self, batch):
+        """Foreground probability of every tile of a batch (last output channel)."""
+        output = np.asarray(self.model.predict_on_batch(np.stack(batch)))
+        return output[..., -1] if output.ndim == 4 else output
+
+
+def _load(path, predictor):
+    img = load_image(path)
+    tiles, layout = predictor.prepare(img)
+    return img, tiles, layout
+
+
+def _write(mask, img, name, output_dir, segmented_inner_dir, suffix, refine):
+    if refine:
+        mask = refine_specimen_mask(mask)
+    cv2.imwrite(os.path.join(output_dir, f"{name}{suffix}.png"), mask)
+    if segmented_inner_dir:
+        segmented_inner = extract_segmented_inner_shape(img, mask)
+        cv2.imwrite(os.path.join(segmented_inner_dir, f"{name}{SEGMENTED_INNER_SUFFIX}.png"), segmented_inner)
+
+
+def infer_masks(input_dir, output_dir, model, segmented_inner_dir=None, suffix=MASK_SUFFIX, refine=True,
+                batch_size=8, workers=2, prefetch=4, **predictor_kwargs):
+    """
+    Writes a model mask for every `.png` of a folder.
+
+    Args:
+        input_dir (str): Folder of square-cropped images.
+        output_dir (str): Folder for the `<name><suffix>.png` masks.
+        model: Model path or loaded model (or a MaskPredictor).
+        segmented_inner_dir (str): Also write `<name>_segmented_inner.png` here.
+        suffix (str): Mask file suffix (e.g. "_internal_mask" for the
+            internal model).
+        refine (bool): Apply the largest-contour / circle refinement.
+        batch_size (int): Tiles per predict call.
+        workers (int): Threads decoding, tiling and writing.
+        prefetch (int): Images decoded ahead of the model.
+        **predictor_kwargs: MaskPredictor options (tile_size, overlap,
+            threshold, fit).
+
+    Returns:
+        dict: "done" and "failed" lists, total "seconds" and "throughput"
+        (images/s, megapixels/s, tiles/s and the time spent predicting and
+        waiting for decoded images).
+    """
+    predictor = model if isinstance(model, MaskPredictor) else MaskPredictor(model, **predictor_kwargs)
+    os.makedirs(output_dir, exist_ok=True)
+    if segmented_inner_dir:
+        os.makedirs(segmented_inner_dir, exist_ok=True)
+
+    filenames = list_inputs(input_dir)
+    report = {"done": [], "failed": []}
+    stats = {"tiles": 0, "pixels": 0, "predict_seconds": 0.0, "wait_seconds": 0.0}
+    start = time.perf_counter()
+
+    images = {}        # name -> [img, layout, predictions, tiles still to predict]
+    batch, owners = [], []
+    writes = []
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        def finish(name):
+            img, layout, predictions, _ = images.pop(name)
+            mask = predictor.stitch(layout, predictions)
+            writes.append((name, pool.submit(_write, mask, img, name, output_dir, segmented_inner_dir, suffix, refine)))
+
+        def run_batch():
+            tick = time.perf_counter()
+            predictions = predictor.predict(batch)
+            stats["predict_seconds"] += time.perf_counter() - tick
+            stats["tiles"] += len(batch)
+            for name, prediction in zip(owners, predictions):
+                state = images[name]
+                state[2].append(prediction)
+                state[3] -= 1
+                if state[3] == 0:
+                    finish(name)
+            batch.clear()
+            owners.clear()
+
+        queue = deque(filenames)
+        loading = deque()
+        while queue or loading:
+            while queue and len(loading) < max(prefetch, 1):
+                filename = queue.popleft()
+                loading.append((filename, pool.submit(_load, os.path.join(input_dir, filename), predictor)))
+
+            filename, future = loading.popleft()
+            name = os.path.splitext(filename)[0]
+            tick = time.perf_counter()
+            try:
+                img, tiles, layout = future.result()
+            except Exception as error:
+                print(f"❌ {filename}: {error}")
+                report["failed"].append({"file": filename, "message": str(error)})
+                continue
+            finally:
+                stats["wait_seconds"] += time.perf_counter() - tick
+
+            stats["pixels"] += img.shape[0] * img.shape[1]
+            images[name] = [img, layout, [], len(tiles)]
+            for tile in tiles:
+                batch.append(tile)
+                owners.append(name)
+                if len(batch) == batch_size:
+                    run_batch()
+        if batch:
+            run_batch()
+
+        for name, future in writes:
+            try:
+                future.result()
+                report["done"].append({"file": name})
+            except Exception as error:
+                print(f"❌ {name}: {error}")
+                report["failed"].append({"file": name, "message": str(error)})
+
+    seconds = time.perf_counter() - start
+    report["seconds"] = round(seconds, 3)
+    report["throughput"] = {
+        "images_per_second": round(len(report["done"]) / seconds, 3) if seconds else None,
+        "megapixels_per_second": round(stats["pixels"] / 1e6 / seconds, 3) if seconds else None,
+        "tiles_per_second": round(stats["tiles"] / stats["predict_seconds"], 3) if stats["predict_seconds"] else None,
+        "tiles": stats["tiles"],
+        "predict_seconds": round(stats["predict_seconds"], 3),
+        "wait_seconds": round(stats["wait_seconds"], 3),
+    }
+    throughput = report["throughput"]
+    print(f"✅ {len(report['done'])} masks, {len(report['failed'])} failed in {report['seconds']} s: "
+          f"{throughput['images_per_second']} images/s, {throughput['megapixels_per_second']} MP/s, "
+          f"{throughput['tiles_per_second']} tiles/s while predicting "
+          f"(predict {throughput['predict_seconds']} s, waiting for decode {throughput['wait_seconds']} s)")
+    return report
+
+
+# === Command Line ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write UNet masks for a folder of images (CPU only).")
+    parser.add_argument("model", help="Keras model file (.h5)")
+    parser.add_argument("input", help="Input directory")
+    parser.add_argument("output", help="Mask output directory")
+    parser.add_argument("--segmented-inner", help="Also write segmented inner shapes to this directory")
+    parser.add_argument("--suffix", default=MASK_SUFFIX, help="Mask file suffix")
+    parser.add_argument("--no-refine", action="store_true", help="Keep the raw thresholded prediction")
+    parser.add_argument("--batch-size", type=int, default=8, help="Tiles per predict call")
+    parser.add_argument("--tile-size", type=int, default=512, help="Tile side for models without a fixed input size")
+    parser.add_argument("--overlap", type=int, default=64, help="Pixels shared by neighbouring tiles")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Mask probability threshold")
+    parser.add_argument("--fit", action="store_true", help="Resize whole images to the model input instead of tiling")
+    parser.add_argument("--workers", type=int, default=2, help="Decode/write threads")
+    parser.add_argument("--prefetch", type=int, default=4, help="Images decoded ahead of the model")
+    parser.add_argument("--threads", type=int, default=None, help="TensorFlow intra-op threads")
+    args = parser.parse_args(argv)
+
+    predictor = MaskPredictor(load_mask_model(args.model, args.threads), args.tile_size, args.overlap,
+                              args.threshold, args.fit)
+    report = infer_masks(args.input, args.output, predictor, args.segmented_inner, args.suffix, not args.no_refine,
+                         args.batch_size, args.workers, args.prefetch)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import os
+import cv2
+import numpy as np
+
+from PipelineCore.Archive import ArchiveReader, write_archive
+
+"""
+Description:
+Compact storage of the phase masks of a specimen: one `<specimen>.masks` file
+holding all five phases instead of five full-frame PNGs.
+
+Each phase is cropped to its bounding box and run-length encoded row by row:
+a (start, end) pair per run of set pixels plus the offset of every row's
+first run. The phase masks are filled, mostly convex shapes, so that is a few
+bytes per row - about the size of the PNG - but the arrays are stored raw and
+can be memory-mapped, and decoding is a scatter and a cumulative sum instead
+of a PNG inflate. The pixel area (cv2.countNonZero of the mask) and the
+bounding box are kept in the file index, so MaskStore.areas() answers
+Area-Colors.py's question without reading a single mask pixel.
+
+Converters to and from the PNG layout of the phase scripts are at the end.
+"""
+
+MASK_STORE_SUFFIX = ".masks"
+
+
+def encode_runs(mask):
+    """
+    Run-length encodes the bounding box of a binary mask.
+
+    Returns:
+        tuple: (runs uint16 (N, 2) of [start, end) columns, row_offsets
+        uint32 (h + 1,) indexing the runs of each row, metadata with "bbox"
+        [x, y, w, h] and "area" in pixels). The arrays are None for an empty mask.
+    """
+    area = cv2.countNonZero(mask)
+    if area == 0:
+        return None, None, {"bbox": [0, 0, 0, 0], "area": 0}
+    x, y, w, h = cv2.boundingRect(mask)
+
+    padded = np.zeros((h, w + 2), np.int8)
+    padded[:, 1:-1] = mask[y:y + h, x:x + w] > 0
+    edges = np.diff(padded, axis=1)
+    start_rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+
+    runs = np.stack([starts, ends], axis=1).astype(np.uint16)
+    row_offsets = np.zeros(h + 1, np.uint32)
+    np.cumsum(np.bincount(start_rows, minlength=h), out=row_offsets[1:])
+    return runs, row_offsets, {"bbox": [x, y, w, h], "area": area}
+
+
+def decode_runs(runs, row_offsets, w, h):
+    """Binary mask (0/255) of size h x w from encode_runs output."""
+    if runs is None:
+        return np.zeros((h, w), np.uint8)
+    rows = np.repeat(np.arange(h), np.diff(row_offsets.astype(np.int64)))
+    edges = np.zeros((h, w + 1), np.int8)
+    edges[rows, runs[:, 0]] = 1
+    edges[rows, runs[:, 1]] = -1
+    return np.cumsum(edges[:, :w], axis=1, dtype=np.int8).view(np.uint8) * np.uint8(255)
+
+
+def write_mask_store(path, masks, meta=None):
+    """
+    Writes the masks of one specimen.
+
+    Args:
+        path (str): Output `.masks` file.
+        masks (dict): phase -> binary mask (0/255), all of the same shape.
+        meta (dict): Extra specimen metadata (e.g. the source image name).
+    """
+    shapes = {mask.shape[:2] for mask in masks.values()}
+    if len(shapes) > 1:
+        raise ValueError(f"All masks of a specimen must have the same shape, got {sorted(shapes)}")
+    shape = shapes.pop() if shapes else (0, 0)
+
+    blocks, phases = {}, {}
+    for phase, mask in masks.items():
+        runs, row_offsets, phases[phase] = encode_runs(mask)
+        blocks[f"{phase}.runs"] = (runs, None)
+        blocks[f"{phase}.rows"] = (row_offsets, None)
+    write_archive(path, blocks, {"shape": list(shape), "phases": phases, **(meta or {})})
+
+
+class MaskStore:
+    """
+    Reads a `.masks` file. Opening it only reads the index; masks are
+    memory-mapped and unpacked on request.
+    """
+
+    def __init__(self, path):
+        self.archive = ArchiveReader(path)
+        self.shape = tuple(self.archive.meta["shape"])
+
+    @property
+    def phases(self):
+        return list(self.archive.meta["phases"])
+
+    @property
+    def meta(self):
+        return self.archive.meta
+
+    def area(self, phase):
+        """Pixel area of a phase, from the index."""
+        return self.archive.meta["phases"][phase]["area"]
+
+    def areas(self):
+        """phase -> pixel area for every stored phase, from the index."""
+        return {phase: self.area(phase) for phase in self.phases}
+
+    def bbox(self, phase):
+        """[x, y, w, h] bounding box of a phase."""
+        return self.archive.meta["phases"][phase]["bbox"]
+
+    def cropped_mask(self, phase):
+        """Binary mask (0/255) of the phase's bounding box only."""
+        x, y, w, h = self.bbox(phase)
+        return decode_runs(self.archive.array(f"{phase}.runs"), self.archive.array(f"{phase}.rows"), w, h)
+
+    def mask(self, phase):
+        """Full-frame binary mask (0/255) of a phase."""
+        mask = np.zeros(self.shape, np.uint8)
+        x, y, w, h = self.bbox(phase)
+        if w and h:
+            mask[y:y + h, x:x + w] = self.cropped_mask(phase)
+        return mask
+
+
+# === Converters ===
+def png_to_store(mask_paths, path, meta=None):
+    """
+    Packs existing PNG phase masks into one `.masks` file.
+
+    Args:
+        mask_paths (dict): phase -> PNG mask path; missing files are skipped.
+        path (str): Output `.masks` file.
+    """
+    masks = {}
+    for phase, mask_path in mask_paths.items():
+        if os.path.exists(mask_path):
+            mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+            if mask is not None:
+                masks[phase] = mask
+    write_mask_store(path, masks, meta)
+    return list(masks)
+
+
+def store_to_png(path, mask_paths):
+    """
+    Writes the phases of a `.masks` file back as full-frame PNG masks.
+
+    Args:
+        mask_paths (dict): phase -> PNG path to write; phases not in the
+            store are skipped.
+    """
+    store = MaskStore(path)
+    for phase, mask_path in mask_paths.items():
+        if phase in store.phases:
+            os.makedirs(os.path.dirname(mask_path) or ".", exist_ok=True)
+            cv2.imwrite(mask_path, store.mask(phase))
+
+
+def convert_png_folders(input_folders, mask_suffixes, output_folder):
+    """
+    Converts the per-phase PNG folders read by Area-Colors.py into one
+    `.masks` file per specimen.
+
+    Args:
+        input_folders (dict): phase -> folder of `<specimen><suffix>` PNG masks.
+        mask_suffixes (dict): phase -> mask file suffix.
+        output_folder (str): Folder for the `<specimen>.masks` files.
+
+    Returns:
+        list: Specimens written.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    specimens = set()
+    for phase, folder in input_folders.items():
+        for fname in os.listdir(folder):
+            if fname.endswith(mask_suffixes[phase]):
+                specimens.add(fname[:-len(mask_suffixes[phase])])
+
+    for specimen in sorted(specimens):
+        mask_paths = {phase: os.path.join(folder, specimen + mask_suffixes[phase])
+                      for phase, folder in input_folders.items()}
+        png_to_store(mask_paths, os.path.join(output_folder, specimen + MASK_STORE_SUFFIX), {"specimen": specimen})
+    return sorted(specimens)
@@ -0,0 +1,164 @@
+import math
+import cv2
+import numpy as np
+
+from PipelineCore.TiledImage import DEFAULT_TILE_SIZE, downsample
+
+"""
+Description:
+External specimen mask of an SEM fractograph (the SLM / EBM6 variant of the
+notebook's masking cell). The fracture surface is found from Canny edges, the
+largest contour is filled and then constrained to a centred circle.
+"""
+
+RADIUS_MARGIN = 10
+
+# Edge detection of extract_mask_from_array (also part of the StageGraph cache key)
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (8, 8)
+EDGE_BLUR_KERNEL = (5, 5)
+CANNY_THRESHOLDS = (50, 150)
+EDGE_KERNEL_SIZE = 2
+
+# Largest side the mask is computed at; larger frames are downsampled first
+MASK_MAX_SIDE = 4096
+
+
+def get_contour(mask: np.ndarray):
+    """
+    Extracts the largest contour from the given binary mask.
+    """
+    ret, thresh = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        largest_contour = max(contours, key=cv2.contourArea)
+        return largest_contour
+    return None
+
+
+def refine_mask(mask: np.ndarray, contour: np.ndarray, center: tuple, radius: int):
+    """
+    Refines the mask by keeping only the region inside the largest contour
+    and applying a circular constraint.
+    """
+    refined_mask = np.zeros_like(mask)
+    if contour is not None:
+        # Draw the largest contour
+        cv2.drawContours(refined_mask, [contour], -1, 255, thickness=-1)
+        # Create a circular mask to constrain the region
+        circular_mask = np.zeros_like(mask)
+        cv2.circle(circular_mask, center, radius, 255, thickness=-1)
+        # Combine the two masks
+        refined_mask = cv2.bitwise_and(refined_mask, circular_mask)
+    return refined_mask
+
+
+def extract_mask_from_array(image_array):
+    """
+    Extracts the mask for the external contour from an image array using a CV-based approach.
+    """
+    if len(image_array.shape) == 3:
+        image = cv2.cvtColor(image_array, cv2.COLOR_BGR2GRAY)
+    else:
+        image = image_array
+
+    # Step 1: Enhance contrast using CLAHE
+    clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+    enhanced_image = clahe.apply(image)
+
+    # Step 2: Smooth the image
+    smoothed_image = cv2.GaussianBlur(enhanced_image, EDGE_BLUR_KERNEL, 0)
+
+    # Step 3: Detect edges using Canny
+    edges = cv2.Canny(smoothed_image, *CANNY_THRESHOLDS)
+
+    # Step 4: Dilate edges with smaller kernel and more iterations
+    kernel = np.ones((EDGE_KERNEL_SIZE, EDGE_KERNEL_SIZE), np.uint8)  # smaller kernel size
+    dilated_edges = cv2.dilate(edges, kernel, iterations=1)  # increase iterations
+
+    # Step 5: Fill gaps using morphological closing
+    closed_edges = cv2.morphologyEx(dilated_edges, cv2.MORPH_CLOSE, kernel)
+
+    # Step 6: Find the largest contour
+    mask = np.zeros_like(image)
+    contours, _ = cv2.findContours(closed_edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        largest_contour = max(contours, key=cv2.contourArea)
+        cv2.drawContours(mask, [largest_contour], -1, 255, thickness=-1)
+
+    return mask
+
+
+def extract_segmented_inner_shape(image, mask):
+    """
+    Extracts the segmented inner shape by applying the mask to the original image.
+    """
+    # Perform morphological operations to further refine the mask
+    kernel = np.ones((2, 2), np.uint8)
+    refined_mask = cv2.erode(mask, kernel, iterations=1)  # Increased erosion to remove more unwanted areas
+    refined_mask = cv2.dilate(refined_mask, kernel, iterations=3)  # Dilation to strengthen the relevant area
+
+    # Apply the refined mask to the image
+    segmented_inner = np.zeros_like(image)
+    segmented_inner[refined_mask == 255] = image[refined_mask == 255]
+
+    # Optional: Apply Gaussian blur to smooth the boundaries of the segmented region
+    segmented_inner = cv2.GaussianBlur(segmented_inner, (5, 5), 0)
+
+    return segmented_inner
+
+
+def specimen_mask(img, radius_margin=RADIUS_MARGIN):
+    """
+    Refined external mask of one specimen, as saved by the notebook's
+    masking cell (`*_mask.png`).
+
+    Args:
+        img (ndarray): BGR SEM image (square-cropped).
+        radius_margin (int): How far inside the image border the circular
+            constraint lies.
+
+    Returns:
+        ndarray: Binary mask (0/255).
+    """
+    return refine_specimen_mask(extract_mask_from_array(img), radius_margin)
+
+
+def refine_specimen_mask(mask, radius_margin=RADIUS_MARGIN):
+    """
+    Largest contour of a raw mask constrained to a centred circle `radius_margin`
+    inside the image border (also applied to the UNet masks of MaskInference.py).
+    """
+    largest_contour = get_contour(mask)
+
+    # Determine the center and radius for the circular region
+    center = (mask.shape[1] // 2, mask.shape[0] // 2)
+    radius = min(center[0], center[1]) - radius_margin
+
+    return refine_mask(mask, largest_contour, center, radius)
+
+
+def stream_specimen_contour(source, max_side=MASK_MAX_SIDE, radius_margin=RADIUS_MARGIN, tile_size=DEFAULT_TILE_SIZE):
+    """
+    External contour of the specimen in a tiled image (see TiledImage.py).
+
+    CLAHE, Canny and the largest-contour search look at the whole frame, so
+    they do not split into tiles; instead the frame is area-downsampled
+    tile by tile until its longer side fits in `max_side` (the resolution the
+    method was tuned on), masked there and the contour scaled back up.
+    Frames up to `max_side` give exactly get_contour(specimen_mask(img)).
+
+    Returns:
+        ndarray: Contour in full-resolution coordinates, or None.
+    """
+    factor = max(math.ceil(max(source.shape[:2]) / max_side), 1)
+    if factor == 1:
+        small = source.read(0, source.shape[0], 0, source.shape[1])
+    else:
+        small = downsample(source, factor, tile_size)
+
+    contour = get_contour(specimen_mask(small, radius_margin))
+    if contour is None or factor == 1:
+        return contour
+    # Small pixel i covers full-resolution pixels i*factor .. (i+1)*factor - 1
+    return np.round(contour * factor + (factor - 1) / 2).astype(np.int32)
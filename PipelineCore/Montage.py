@@ -0,0 +1,131 @@
+import os
+from functools import lru_cache
+import cv2
+import numpy as np
+
+"""
+Description:
+Thumbnails and title bars for the summary montages (CombiningColorsResults.py
+and the notebook's combining cells).
+
+A montage shows up to eight stage outputs of a specimen at 512x512, and the
+builders decoded every 4096^2 PNG in full only to shrink it. load_thumbnail
+keeps the shrunk image in a `.thumbnails` folder next to the source, so every
+later montage of that image decodes a 512^2 PNG instead (about ten times
+faster); a thumbnail older than its source is rebuilt. The thumbnail is the
+same cv2.resize of the full decode the builders did, so the montages do not
+change. (OpenCV's IMREAD_REDUCED_* modes only decode faster for JPEG; for the
+PNGs the stages write they decode in full and resize.)
+
+Title bars are rendered once per text and style: the stage titles repeat on
+every montage of a campaign.
+"""
+
+THUMBNAIL_SIZE = (512, 512)
+THUMBNAIL_DIR = ".thumbnails"
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def thumbnail_path(path, size=THUMBNAIL_SIZE, grayscale=False):
+    """Cache file of a thumbnail: `<folder>/.thumbnails/<name>.<w>x<h>[.gray].png`."""
+    folder, filename = os.path.split(path)
+    mode = ".gray" if grayscale else ""
+    return os.path.join(folder, THUMBNAIL_DIR, f"{os.path.splitext(filename)[0]}.{size[0]}x{size[1]}{mode}.png")
+
+
+def _write_thumbnail(path, thumbnail):
+    """Writes through a temporary file; a read-only folder just means no cache."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        ok, encoded = cv2.imencode(".png", thumbnail)
+        if ok:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(encoded.tobytes())
+            os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def load_thumbnail(path, size=THUMBNAIL_SIZE, grayscale=False, cache=True):
+    """
+    Loads an image resized to `size`, from the thumbnail cache when it is
+    up to date.
+
+    Args:
+        path (str): Source image.
+        size (tuple): (width, height) of the thumbnail.
+        grayscale (bool): Read as single-channel (cv2.IMREAD_GRAYSCALE).
+        cache (bool): Read and write the `.thumbnails` cache.
+
+    Returns:
+        ndarray: The thumbnail, or None if the source cannot be read.
+    """
+    flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+    cached = thumbnail_path(path, size, grayscale)
+    if cache and os.path.exists(cached) and os.stat(cached).st_mtime_ns >= os.stat(path).st_mtime_ns:
+        thumbnail = cv2.imread(cached, flags)
+        if thumbnail is not None and thumbnail.shape[1::-1] == tuple(size):
+            return thumbnail
+
+    img = cv2.imread(path, flags)
+    if img is None:
+        return None
+    thumbnail = cv2.resize(img, tuple(size))
+    if cache:
+        _write_thumbnail(cached, thumbnail)
+    return thumbnail
+
+
+@lru_cache(maxsize=256)
+def title_bar(text, width, height, org=None, font_scale=1.0, thickness=2, color=(0, 0, 0), background=255):
+    """
+    A `height` x `width` bar with `text` drawn on it, rendered once per
+    argument set. The result is shared, so it is read-only - stack it, do not
+    draw on it.
+
+    Args:
+        org (tuple): Text origin; None centres the text.
+        color (tuple): BGR text colour.
+        background (int): Bar grey level (255 white, 0 black).
+    """
+    bar = np.full((height, width, 3), background, dtype=np.uint8)
+    if org is None:
+        text_size = cv2.getTextSize(text, FONT, font_scale, thickness)[0]
+        org = ((width - text_size[0]) // 2, (height + text_size[1]) // 2)
+    cv2.putText(bar, text, org, FONT, font_scale, color, thickness, cv2.LINE_AA)
+    bar.flags.writeable = False
+    return bar
+
+
+def montage(images, titles, per_row=None, bar=None, header=None, header_bar=None):
+    """
+    Titled grid of equally sized images: a title bar above each image,
+    `per_row` images per row (short rows padded with white) and an optional
+    header bar across the top.
+
+    Args:
+        images (list): BGR images of the same size.
+        titles (list): One title per image.
+        per_row (int): Images per row; None puts them all in one row.
+        bar (dict): title_bar keyword arguments of the image titles
+            (height, org, font_scale, ...).
+        header (str): Text of the header bar, if any.
+        header_bar (dict): title_bar keyword arguments of the header.
+
+    Returns:
+        ndarray: The montage.
+    """
+    bar = {"height": 40, **(bar or {})}
+    per_row = per_row or len(images)
+    tiles = [np.vstack((title_bar(title, img.shape[1], **bar), img)) for img, title in zip(images, titles)]
+
+    rows = [np.hstack(tiles[i:i + per_row]) for i in range(0, len(tiles), per_row)]
+    width = max(row.shape[1] for row in rows)
+    rows = [np.hstack((row, np.full((row.shape[0], width - row.shape[1], 3), 255, np.uint8)))
+            if row.shape[1] < width else row for row in rows]
+    combined = np.vstack(rows)
+
+    if header is not None:
+        combined = np.vstack((title_bar(header, width, **{"height": 70, **(header_bar or {})}), combined))
+    return combined
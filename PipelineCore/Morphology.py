@@ -0,0 +1,131 @@
+import functools
+import cv2
+import numpy as np
+
+from PipelineCore import Instrument
+
+"""
+Description:
+Rectangular morphology on binary (0/255) masks for the extraction stages.
+
+cv2.dilate/cv2.erode cost grows with the kernel side, and the phase extractors
+use 100-200 px squares on every image. For a binary mask a rectangular
+dilation is simply "is any pixel of the window set", i.e. a window sum > 0,
+and a box sum is a running sum whose cost does not depend on the kernel size.
+Erosion is the same test on the complement. Windows, anchors and borders
+follow OpenCV exactly (pixels outside the image never change the result), so
+the output is pixel-identical to cv2.dilate / cv2.morphologyEx; check_parity()
+verifies that on any mask. Small kernels are left to OpenCV, which is faster
+there.
+
+Kernels are cached, so no np.ones is allocated per image.
+"""
+
+# Kernel side from which the box-sum path beats cv2.dilate (measured on
+# 2048^2 and 4096^2 masks: equal around 60-100 px, ~2x faster at 200 px).
+LARGE_KERNEL = 100
+
+
+@functools.lru_cache(maxsize=None)
+def rect_kernel(width, height=None):
+    """Shared, read-only width x height structuring element of ones."""
+    kernel = np.ones((height or width, width), np.uint8)
+    kernel.setflags(write=False)
+    return kernel
+
+
+def _kernel_shape(size, anchor):
+    width, height = (size, size) if np.isscalar(size) else size
+    if anchor is None:
+        anchor = (width // 2, height // 2)
+    return int(width), int(height), anchor
+
+
+def _any_in_window(ones, width, height, anchor):
+    """255 where the width x height window anchored at each pixel holds a 1."""
+    depth = cv2.CV_16U if width * height <= 65535 else cv2.CV_32S
+    sums = cv2.boxFilter(ones, depth, (width, height), anchor=anchor,
+                         normalize=False, borderType=cv2.BORDER_CONSTANT)
+    return cv2.compare(sums, 0, cv2.CMP_GT)
+
+
+def dilate(mask, size, anchor=None):
+    """
+    Dilates a binary mask with a rectangular kernel, as cv2.dilate does.
+
+    Args:
+        mask (ndarray): uint8 mask, 0 or 255.
+        size (int or tuple): Kernel side, or (width, height).
+        anchor (tuple): Kernel anchor (x, y); defaults to the kernel centre.
+
+    Returns:
+        ndarray: Dilated 0/255 mask.
+    """
+    width, height, anchor = _kernel_shape(size, anchor)
+    with Instrument.fine_span("morphology", op="dilate", kernel=[width, height]):
+        if max(width, height) < LARGE_KERNEL:
+            return cv2.dilate(mask, rect_kernel(width, height), anchor=anchor)
+
+        ones = cv2.threshold(mask, 0, 1, cv2.THRESH_BINARY)[1]
+        return _any_in_window(ones, width, height, anchor)
+
+
+def erode(mask, size, anchor=None):
+    """Erodes a binary mask with a rectangular kernel, as cv2.erode does."""
+    width, height, anchor = _kernel_shape(size, anchor)
+    with Instrument.fine_span("morphology", op="erode", kernel=[width, height]):
+        if max(width, height) < LARGE_KERNEL:
+            return cv2.erode(mask, rect_kernel(width, height), anchor=anchor)
+
+        # Outside the image counts as set for erosion, i.e. as unset in the complement
+        holes = cv2.threshold(mask, 0, 1, cv2.THRESH_BINARY_INV)[1]
+        return cv2.bitwise_not(_any_in_window(holes, width, height, anchor))
+
+
+def closing(mask, size, anchor=None):
+    """cv2.morphologyEx(mask, cv2.MORPH_CLOSE, ...) with a rectangular kernel."""
+    return erode(dilate(mask, size, anchor), size, anchor)
+
+
+def opening(mask, size, anchor=None):
+    """cv2.morphologyEx(mask, cv2.MORPH_OPEN, ...) with a rectangular kernel."""
+    return dilate(erode(mask, size, anchor), size, anchor)
+
+
+def dilate_chain(mask, sizes):
+    """
+    Successive square dilations (e.g. the blue phase's [180, 60] expansion)
+    done as one: centred k1 and k2 squares compose into a single
+    (k1 + k2 - 1) square anchored at k1 // 2 + k2 // 2.
+    """
+    if not sizes:
+        return mask
+    side = sum(sizes) - (len(sizes) - 1)
+    offset = sum(size // 2 for size in sizes)
+    return dilate(mask, side, (offset, offset))
+
+
+def check_parity(mask, sizes=(3, 5, 25, 35, 60, 100, 180, 200)):
+    """
+    Compares every operation of this module with OpenCV on `mask`.
+
+    Returns:
+        dict: operation name -> number of differing pixels (all 0 when exact).
+    """
+    report = {}
+    for size in sizes:
+        kernel = np.ones((size, size), np.uint8)
+        pairs = {
+            "dilate": (dilate(mask, size), cv2.dilate(mask, kernel)),
+            "erode": (erode(mask, size), cv2.erode(mask, kernel)),
+            "close": (closing(mask, size), cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)),
+            "open": (opening(mask, size), cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)),
+        }
+        for name, (ours, reference) in pairs.items():
+            report[f"{name}_{size}"] = int(np.count_nonzero(ours != reference))
+
+    reference = mask
+    for size in sizes[-2:]:
+        reference = cv2.dilate(reference, np.ones((size, size), np.uint8))
+    report["dilate_chain"] = int(np.count_nonzero(dilate_chain(mask, list(sizes[-2:])) != reference))
+    return report
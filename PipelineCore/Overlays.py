@@ -0,0 +1,84 @@
+import os
+import cv2
+
+from PipelineCore import Instrument
+from PipelineCore.Areas import load_geometry
+from PipelineCore.BatchRunner import FileSkipped
+from PipelineCore.PhaseExtractor import GEOMETRY_SUFFIX, overlay_path, phase_folders, render_overlay, render_preview, save_overlay
+
+"""
+Description:
+Phase overlays rendered on request from the geometry files, instead of ten
+full-resolution PNG encodes per specimen during the batch.
+
+The phase stage always writes `<name>.geometry.json` (PhaseExtractor.save_geometry)
+and, by default in BatchRunner, no overlay at all (--overlays none). This
+module draws the overlays afterwards from the geometry and the highlighted
+heatmap, only for the specimens and phases asked for:
+
+    - "preview": JPEG of at most 1024 px (PhaseExtractor.PREVIEW_SIZE), the
+      geometry drawn on the shrunk heatmap - a fraction of a full PNG encode;
+    - "full": the full-resolution PNG overlays of the phase scripts, with the
+      same names and folders, pixel-identical to what the batch used to write.
+
+Overlays newer than their geometry file are kept, so asking again is free:
+
+    python -m PipelineCore.BatchRunner overlays <highlighted> <overlays> --geometry <phases>/geometry --overlays preview
+
+render_overlays() returns the images without writing anything (notebooks).
+"""
+
+
+def render_overlays(geometry_path, image_path, phases=None, tier="preview"):
+    """
+    Overlays of one specimen drawn from its geometry file.
+
+    Args:
+        geometry_path (str): `<name>.geometry.json`.
+        image_path (str): The highlighted heatmap the geometry came from.
+        phases (tuple): Phases to draw (all phases in the file by default).
+        tier (str): "preview" or "full".
+
+    Returns:
+        dict: phase -> BGR overlay.
+    """
+    geometry = load_geometry(geometry_path)
+    img = cv2.imread(image_path)
+    if img is None:
+        raise FileNotFoundError(image_path)
+    render = render_preview if tier == "preview" else render_overlay
+    return {phase: render(img, result) for phase, result in geometry["phases"].items()
+            if phases is None or phase in phases}
+
+
+def overlays_file(filename, input_folder, output_folder, geometry_folder, tier="preview", phases=None):
+    """
+    Per-file stage for BatchRunner.py: writes the overlays of one highlighted
+    heatmap from its geometry, in the per-phase folders of phases_file.
+    Overlays at least as new as the geometry file are not redrawn.
+
+    Returns:
+        str: What was written.
+    """
+    name = filename[:-4]
+    geometry_path = os.path.join(geometry_folder, name + GEOMETRY_SUFFIX)
+    if not os.path.exists(geometry_path):
+        raise FileSkipped(f"⚠ No geometry for {filename}")
+    geometry = load_geometry(geometry_path)
+    wanted = [phase for phase in geometry["phases"] if phases is None or phase in phases]
+    folders = phase_folders(output_folder, wanted)
+
+    geometry_mtime = os.stat(geometry_path).st_mtime_ns
+    pending = [phase for phase in wanted
+               if not os.path.exists(overlay_path(folders[phase], name, phase, tier))
+               or os.stat(overlay_path(folders[phase], name, phase, tier)).st_mtime_ns < geometry_mtime]
+    if not pending:
+        return f"{len(wanted)} {tier} overlays up to date"
+
+    img = cv2.imread(os.path.join(input_folder, filename))
+    if img is None:
+        raise FileSkipped(f"⚠ Cannot read {filename}")
+    Instrument.note_frame(img)
+    for phase in pending:
+        save_overlay(img, geometry["phases"][phase], folders[phase], name, tier)
+    return f"{len(pending)} {tier} overlays written ({', '.join(pending)})"
@@ -0,0 +1,641 @@
+import os
+import csv
+import json
+import cv2
+import numpy as np
+from scipy.ndimage import binary_fill_holes
+
+from PipelineCore import Instrument
+from PipelineCore.ColorClassifier import HSVLookupClassifier, ranges_key
+from PipelineCore.ContourSmoothing import DEFAULT_MAX_DEVIATION, DEFAULT_SIGMA, smooth_contour, spline_contour
+from PipelineCore.MaskStore import MASK_STORE_SUFFIX, write_mask_store
+from PipelineCore.Morphology import dilate, dilate_chain, closing, opening
+
+"""
+Description:
+Phase extraction for the five crack-growth color bands of a highlighted heatmap
+(dark red -> red -> yellow -> cyan -> blue), shared by the CorlorsContours scripts.
+
+Every phase starts from the same inputs: the decoded `*_heatmap_highlighted.png`,
+its HSV color classes and the pink crack-zone ellipse drawn by ExtractCrackArea.py.
+A context (build_context) labels the image once with every HSV range set in use
+(see ColorClassifier.py) and caches everything the phases have in common
+(ellipse fits, allowed areas, color masks), so extract_all_phases() decodes,
+classifies and fits the ellipse once for all five phases while each phase still
+produces exactly what its script used to.
+
+All morphology runs on the padded bounding box of the crack-zone ellipse rather
+than the full frame (see crack_zone). Each phase returns its geometry (ellipse
+or polygon) in full-frame coordinates rather than a raster; render_mask /
+render_overlay draw it at full resolution only when writing.
+
+Overlays come in tiers (OVERLAY_TIERS): "full" is the full-resolution PNG the
+scripts always wrote, "preview" a JPEG of at most PREVIEW_SIZE px with the
+geometry drawn on the shrunk image, "none" no overlay at all. Either can be
+rendered later from the geometry files (Overlays.py).
+"""
+
+# === HSV Ranges ===
+PINK_RANGE = ((140, 50, 50), (170, 255, 255))
+
+DARK_RED_RANGES = [
+    ([0, 200, 100], [10, 255, 180]),
+    ([160, 200, 100], [180, 255, 180])
+]
+
+RED_RANGES = [
+    ([0, 50, 50], [10, 255, 255]),     # Low red
+    ([160, 50, 50], [180, 255, 255])   # High red (wrap-around)
+]
+
+CRACK_ZONE_RANGES = [
+    ([0, 50, 50], [10, 255, 255]),     # Red low
+    ([160, 50, 50], [180, 255, 255]),  # Red high
+    ([11, 80, 80], [22, 255, 255]),    # Orange
+    ([23, 90, 90], [38, 255, 255]),    # Yellow
+    ([85, 50, 80], [105, 255, 255])    # Cyan
+]
+
+BLUE_RANGE = ([105, 50, 50], [125, 255, 255])
+
+# === Phase Parameters (kernel sizes are square side lengths in pixels) ===
+PHASES = ("dark_red", "red", "yellow", "cyan", "blue")
+
+PHASE_PARAMS = {
+    # DarkRedContour.py: convex hull of the dark red pixels inside the ellipse
+    "dark_red": {
+        "method": "hull", "ranges": DARK_RED_RANGES, "pink_close": 5,
+        "open": 5, "close": 5, "thickness": 10,
+    },
+    # RedContour: largest red contour inside the ellipse
+    "red": {
+        "ranges": RED_RANGES, "pink_close": 3,
+        "open": 3, "close": 3, "min_area": 150, "thickness": 15,
+    },
+    # YellowContour.py: largest warm-color envelope inside the ellipse
+    "yellow": {
+        "ranges": CRACK_ZONE_RANGES, "pink_close": 3,
+        "open": 3, "close": 3, "min_area": 150, "thickness": 10,
+    },
+    # CyanContour.py: smoothed periodic spline around the crack zone
+    # ("smoothing": "decimated" for the fixed-cost engine, see ContourSmoothing.py)
+    "cyan": {
+        "ranges": CRACK_ZONE_RANGES, "pink_close": 5, "dilation": 200,
+        "dilate": 25, "close": 35, "open": 5,
+        "smoothness": 0.001, "num_points": 600, "thickness": 15,
+        "smoothing": "spline", "max_deviation": DEFAULT_MAX_DEVIATION, "sigma": DEFAULT_SIGMA,
+    },
+    # BlueContours.py: ellipse fitted to the hull of the expanded crack zone
+    "blue": {
+        "ranges": CRACK_ZONE_RANGES + [BLUE_RANGE], "pink_close": 5, "dilation": 200,
+        "dilate": 25, "close": 30, "open": 5, "expand": [180, 60],
+        "min_area": 5000, "thickness": 20,
+    },
+}
+
+# DrakRedContour-2.py: ellipse fitted to the expanded dark red zone
+DARK_RED_ELLIPSE_PARAMS = {
+    "method": "ellipse", "ranges": DARK_RED_RANGES, "pink_close": 5, "dilation": 200,
+    "dilate": 25, "close": 30, "open": 5, "expand": [100],
+    "min_area": 5000, "thickness": 15,
+}
+
+# === Output Layout (file suffixes used by Area-Colors.py and the montage) ===
+PHASE_OUTPUTS = {
+    "dark_red": {"overlay": "_darkred_overlay.png", "mask_folder": "contour_masks", "mask": "_darkred_mask.png"},
+    "red": {"overlay": "_red_overlay.png", "mask_folder": "contour_masks", "mask": "_red_mask.png"},
+    "yellow": {"overlay": "_envelope_overlay.png", "mask_folder": "contour_masks", "mask": "_envelope_mask.png"},
+    "cyan": {"overlay": "_crackzone_contour_overlay.png", "mask_folder": "contour_masks", "mask": "_crackzone_mask.png"},
+    "blue": {"overlay": "_ellipse_overlay.png", "mask_folder": "ellipse_masks", "mask": "_ellipse_mask.png"},
+}
+GEOMETRY_SUFFIX = ".geometry.json"
+
+OVERLAY_TIERS = ("none", "preview", "full")
+PREVIEW_SIZE = 1024          # long side of a preview overlay, pixels
+PREVIEW_SUFFIX = ".preview.jpg"
+PREVIEW_QUALITY = 85
+
+
+class PhaseSkipped(Exception):
+    """Raised when a phase cannot be extracted from an image; the message says why."""
+
+
+# === Shared Per-Image Context ===
+def roi_margin(params):
+    """
+    Padding around the crack-zone ellipse that contains everything a phase
+    can touch: the summed extents of its dilations and closings. Beyond it
+    every intermediate mask is zero, so working on the padded box gives the
+    same result as working on the full frame.
+    """
+    sizes = [params.get(key, 0) for key in ("dilation", "dilate", "close", "open")]
+    return sum(sizes) + sum(params.get("expand", [])) + 2
+
+
+def build_context(img, params_list=None):
+    """
+    Labels the image once with every HSV range set the given phases use
+    (plus the pink ellipse) and holds the caches for the masks several
+    phases share.
+
+    Args:
+        img (ndarray): BGR highlighted heatmap.
+        params_list (list): Parameter dicts of the phases that will be
+            extracted; defaults to every phase in PHASE_PARAMS.
+    """
+    if params_list is None:
+        params_list = list(PHASE_PARAMS.values()) + [DARK_RED_ELLIPSE_PARAMS]
+
+    classes = {ranges_key([PINK_RANGE]): [PINK_RANGE]}
+    for params in params_list:
+        classes[ranges_key(params["ranges"])] = params["ranges"]
+    classifier = HSVLookupClassifier(classes)
+    with Instrument.fine_span("hsv_classify"):
+        labels = classifier.classify(img)
+
+    return {
+        "img": img,
+        "shape": img.shape[:2],
+        "classifier": classifier,
+        "labels": labels,
+        "hsv": None,
+        "roi_margin": max(roi_margin(params) for params in params_list),
+        "range_masks": {},
+        "ellipses": {},
+        "zones": {},
+        "allowed_areas": {},
+    }
+
+
+def color_mask(ctx, ranges, roi=None):
+    """
+    Pixels inside any of `ranges` (0/255), equal to OR-ing cv2.inRange over
+    them, for the whole frame or a (y0, y1, x0, x1) region of it. The mask
+    is cached and shared: do not modify it in place.
+    """
+    key = (ranges_key(ranges), roi)
+    if key not in ctx["range_masks"]:
+        y0, y1, x0, x1 = roi or (0, ctx["shape"][0], 0, ctx["shape"][1])
+        if key[0] in ctx["classifier"].bits:
+            mask = ctx["classifier"].mask(ctx["labels"][y0:y1, x0:x1], key[0])
+        else:
+            # Ranges nobody registered in build_context: plain inRange chain
+            if ctx["hsv"] is None:
+                with Instrument.fine_span("hsv_convert"):
+                    ctx["hsv"] = cv2.cvtColor(ctx["img"], cv2.COLOR_BGR2HSV)
+            hsv = ctx["hsv"][y0:y1, x0:x1]
+            mask = np.zeros(hsv.shape[:2], np.uint8)
+            for lower, upper in ranges:
+                mask |= cv2.inRange(hsv, np.array(lower), np.array(upper))
+        ctx["range_masks"][key] = mask
+    return ctx["range_masks"][key]
+
+
+def crack_ellipse(ctx, pink_close):
+    """
+    Fits the pink crack-zone ellipse (full-frame coordinates) after closing
+    the pink mask with a pink_close x pink_close kernel.
+    """
+    if pink_close not in ctx["ellipses"]:
+        pink_mask = color_mask(ctx, [PINK_RANGE])
+        pink_mask = closing(pink_mask, pink_close)
+        contours_pink, _ = cv2.findContours(pink_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours_pink:
+            ctx["ellipses"][pink_close] = PhaseSkipped("⚠ No pink ellipse found")
+        else:
+            largest = max(contours_pink, key=cv2.contourArea)
+            if len(largest) < 5:
+                ctx["ellipses"][pink_close] = PhaseSkipped("⚠ Not enough points for ellipse")
+            else:
+                ctx["ellipses"][pink_close] = cv2.fitEllipse(largest)
+
+    found = ctx["ellipses"][pink_close]
+    if isinstance(found, PhaseSkipped):
+        raise found
+    return found
+
+
+def crack_zone(ctx, params):
+    """
+    The crack-zone ellipse of a phase and the region of interest it works in:
+    the bounding box of the ellipse padded by roi_margin() and clipped to the
+    frame. Everything downstream runs on that box only.
+
+    Returns:
+        dict: "ellipse" (full-frame RotatedRect), "roi" (y0, y1, x0, x1) and
+        "ellipse_mask" (filled ellipse in ROI coordinates).
+    """
+    ellipse = crack_ellipse(ctx, params["pink_close"])
+    margin = max(ctx["roi_margin"], roi_margin(params))
+    key = (params["pink_close"], margin)
+
+    if key not in ctx["zones"]:
+        height, width = ctx["shape"]
+        corners = cv2.boxPoints(ellipse)
+        x0 = max(int(np.floor(corners[:, 0].min())) - margin, 0)
+        x1 = min(int(np.ceil(corners[:, 0].max())) + margin + 1, width)
+        y0 = max(int(np.floor(corners[:, 1].min())) - margin, 0)
+        y1 = min(int(np.ceil(corners[:, 1].max())) + margin + 1, height)
+
+        # Integer shifts of the centre are exact, so this rasterises the same
+        # pixels as drawing the ellipse on the full frame.
+        (cx, cy), axes, angle = ellipse
+        ellipse_mask = np.zeros((max(y1 - y0, 0), max(x1 - x0, 0)), np.uint8)
+        cv2.ellipse(ellipse_mask, ((cx - x0, cy - y0), axes, angle), 255, -1)
+
+        ctx["zones"][key] = {"ellipse": ellipse, "roi": (y0, y1, x0, x1), "ellipse_mask": ellipse_mask}
+    return ctx["zones"][key]
+
+
+def allowed_area(ctx, zone, dilation):
+    """The crack-zone ellipse dilated by a dilation x dilation kernel (ROI coordinates)."""
+    key = (zone["roi"], dilation)
+    if key not in ctx["allowed_areas"]:
+        ctx["allowed_areas"][key] = dilate(zone["ellipse_mask"], dilation)
+    return ctx["allowed_areas"][key]
+
+
+def largest_component(mask, min_area):
+    """Keeps the largest 8-connected component, or raises if it is below min_area."""
+    with Instrument.fine_span("connected_components"):
+        num_labels, labels_im, stats, _ = cv2.connectedComponentsWithStats(mask)
+    if num_labels < 2:
+        raise PhaseSkipped("⚠ No significant crack zone found")
+    largest_label = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    if stats[largest_label, cv2.CC_STAT_AREA] < min_area:
+        raise PhaseSkipped("⚠ No significant crack zone found")
+    return (labels_im == largest_label).astype(np.uint8) * 255
+
+
+def _roi_offset(zone):
+    """(x, y) offset that maps ROI contours back to full-frame coordinates."""
+    y0, _, x0, _ = zone["roi"]
+    return (x0, y0)
+
+
+def _grown_zone_mask(ctx, zone, params):
+    """
+    Color mask inside the allowed area, dilated, closed, opened and hole-filled:
+    the common first half of the cyan, blue and dark red ellipse phases.
+    """
+    mask = color_mask(ctx, params["ranges"], zone["roi"])
+    mask = cv2.bitwise_and(mask, allowed_area(ctx, zone, params["dilation"]))
+    mask = dilate(mask, params["dilate"])
+    mask = closing(mask, params["close"])
+    mask = opening(mask, params["open"])
+    return binary_fill_holes(mask > 0).astype(np.uint8) * 255
+
+
+def _largest_contour_inside_ellipse(ctx, params):
+    """Largest contour of the opened/closed color mask clipped to the ellipse (red, yellow)."""
+    zone = crack_zone(ctx, params)
+    mask = color_mask(ctx, params["ranges"], zone["roi"])
+    mask = cv2.bitwise_and(mask, zone["ellipse_mask"])
+    mask = opening(mask, params["open"])
+    mask = closing(mask, params["close"])
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=_roi_offset(zone))
+    if not contours:
+        raise PhaseSkipped("❌ No contour found")
+
+    largest = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(largest) < params["min_area"]:
+        raise PhaseSkipped("⚠ Contour too small")
+    return largest
+
+
+# === Phase Extractors ===
+# Masks are processed inside the crack-zone ROI; the returned geometry is in
+# full-frame coordinates.
+def extract_dark_red(ctx, params):
+    if params["method"] == "ellipse":
+        return _extract_dark_red_ellipse(ctx, params)
+
+    zone = crack_zone(ctx, params)
+    ellipse_mask = zone["ellipse_mask"]
+    dark_red_mask = color_mask(ctx, params["ranges"], zone["roi"])
+    dark_red_mask = cv2.bitwise_and(dark_red_mask, ellipse_mask)
+    dark_red_mask = opening(dark_red_mask, params["open"])
+    dark_red_mask = closing(dark_red_mask, params["close"])
+
+    contours, _ = cv2.findContours(dark_red_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        raise PhaseSkipped("❌ No dark red contour")
+
+    # All contours filled into one buffer and clipped to the ellipse once. The
+    # hull of the clipped pixels is the hull of their outlines' vertices, taken
+    # in raster order like the pixel list it replaces (same hull, same vertex order)
+    clipped = np.zeros_like(ellipse_mask)
+    cv2.drawContours(clipped, contours, -1, 255, cv2.FILLED)
+    clipped = cv2.bitwise_and(clipped, ellipse_mask)
+    outlines, _ = cv2.findContours(clipped, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=_roi_offset(zone))
+    if not outlines:
+        raise PhaseSkipped("⚠ No valid points inside ellipse")
+
+    points = np.vstack(outlines).reshape(-1, 2)
+    hull = cv2.convexHull(points[np.lexsort((points[:, 0], points[:, 1]))])
+    return {"kind": "contour", "points": hull, "thickness": params["thickness"]}
+
+
+def _extract_dark_red_ellipse(ctx, params):
+    zone = crack_zone(ctx, params)
+    dark_red_mask = _grown_zone_mask(ctx, zone, params)
+    dark_red_mask = dilate_chain(dark_red_mask, params["expand"])
+
+    final_mask = largest_component(dark_red_mask, params["min_area"])
+
+    contours, _ = cv2.findContours(final_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=_roi_offset(zone))
+    if not contours or len(max(contours, key=cv2.contourArea)) < 5:
+        raise PhaseSkipped("⚠ Not enough points to fit ellipse")
+
+    fitted_ellipse = cv2.fitEllipse(max(contours, key=cv2.contourArea))
+    return {"kind": "ellipse", "ellipse": fitted_ellipse, "thickness": params["thickness"]}
+
+
+def extract_red(ctx, params):
+    largest = _largest_contour_inside_ellipse(ctx, params)
+    return {"kind": "contour", "points": largest, "thickness": params["thickness"]}
+
+
+def extract_yellow(ctx, params):
+    largest = _largest_contour_inside_ellipse(ctx, params)
+    return {"kind": "contour", "points": largest, "thickness": params["thickness"]}
+
+
+def cyan_front(ctx, params):
+    """Largest contour of the grown crack zone, (N, 2) full-frame points: the cyan front before smoothing."""
+    zone = crack_zone(ctx, params)
+    combined_mask = _grown_zone_mask(ctx, zone, params)
+
+    contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=_roi_offset(zone))
+    if not contours:
+        raise PhaseSkipped("❌ No contour found")
+
+    largest_contour = max(contours, key=cv2.contourArea).squeeze()
+    if len(largest_contour.shape) != 2 or largest_contour.shape[0] < 10:
+        raise PhaseSkipped("⚠ Contour too small or broken")
+    return largest_contour
+
+
+def extract_cyan(ctx, params):
+    largest_contour = cyan_front(ctx, params)
+
+    # Fit a periodic spline and resample it, or decimate and smooth at a fixed cost
+    if params.get("smoothing", "spline") == "decimated":
+        with Instrument.fine_span("contour_smoothing", points=len(largest_contour)):
+            smoothed = smooth_contour(largest_contour, params["num_points"], params["max_deviation"], params["sigma"])
+    else:
+        with Instrument.fine_span("spline_fit", points=len(largest_contour)):
+            smoothed = spline_contour(largest_contour, params["num_points"], params["smoothness"])
+
+    return {"kind": "polyline", "points": smoothed, "thickness": params["thickness"]}
+
+
+def extract_blue(ctx, params):
+    zone = crack_zone(ctx, params)
+    combined_mask = _grown_zone_mask(ctx, zone, params)
+    expanded_mask = dilate_chain(combined_mask, params["expand"])
+
+    final_mask = largest_component(expanded_mask, params["min_area"])
+
+    contours, _ = cv2.findContours(final_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=_roi_offset(zone))
+    if not contours:
+        raise PhaseSkipped("❌ No contour found")
+
+    largest_contour = max(contours, key=cv2.contourArea)
+    if len(largest_contour) < 5:
+        raise PhaseSkipped("⚠ Contour too small to fit ellipse")
+
+    hull = cv2.convexHull(largest_contour)
+    fitted_ellipse = cv2.fitEllipse(hull)
+    return {"kind": "ellipse", "ellipse": fitted_ellipse, "thickness": params["thickness"]}
+
+
+PHASE_EXTRACTORS = {
+    "dark_red": extract_dark_red,
+    "red": extract_red,
+    "yellow": extract_yellow,
+    "cyan": extract_cyan,
+    "blue": extract_blue,
+}
+
+
+def extract_phase(ctx, phase, params=None):
+    """
+    Extracts a single phase from a context built with build_context().
+
+    Returns:
+        dict: geometry of the phase ("kind" plus "ellipse" or "points").
+
+    Raises:
+        PhaseSkipped: when the phase is not present in the image.
+    """
+    result = PHASE_EXTRACTORS[phase](ctx, params or PHASE_PARAMS[phase])
+    result["phase"] = phase
+    return result
+
+
+def extract_all_phases(img, phases=PHASES, phase_params=None):
+    """
+    Extracts every requested phase from one highlighted heatmap in a single
+    pass: one color classification, one ellipse fit per pink closing size.
+
+    Args:
+        img (ndarray): BGR `*_heatmap_highlighted.png` image.
+        phases (tuple): Phases to extract.
+        phase_params (dict): Optional per-phase parameter overrides.
+
+    Returns:
+        tuple: (results, skipped) - phase -> geometry for the phases found and
+        phase -> reason for the ones that were skipped.
+    """
+    phase_params = {phase: (phase_params or {}).get(phase) or PHASE_PARAMS[phase] for phase in phases}
+    ctx = build_context(img, list(phase_params.values()))
+    results, skipped = {}, {}
+    for phase in phases:
+        try:
+            results[phase] = extract_phase(ctx, phase, phase_params[phase])
+        except PhaseSkipped as reason:
+            skipped[phase] = str(reason)
+    return results, skipped
+
+
+# === Rendering ===
+def render_mask(result, shape):
+    """Filled binary mask (0/255) of a phase geometry."""
+    mask_img = np.zeros(shape, np.uint8)
+    if result["kind"] == "ellipse":
+        cv2.ellipse(mask_img, result["ellipse"], 255, thickness=-1)
+    elif result["kind"] == "polyline":
+        cv2.fillPoly(mask_img, [result["points"]], 255)
+    else:
+        cv2.drawContours(mask_img, [result["points"]], -1, 255, thickness=cv2.FILLED)
+    return mask_img
+
+
+def render_overlay(img, result):
+    """Copy of `img` with the phase boundary drawn in black."""
+    overlay = img.copy()
+    if result["kind"] == "ellipse":
+        cv2.ellipse(overlay, result["ellipse"], (0, 0, 0), thickness=result["thickness"])
+    elif result["kind"] == "polyline":
+        cv2.polylines(overlay, [result["points"]], isClosed=True, color=(0, 0, 0), thickness=result["thickness"])
+    else:
+        cv2.drawContours(overlay, [result["points"]], -1, (0, 0, 0), thickness=result["thickness"])
+    return overlay
+
+
+def scale_geometry(result, scale):
+    """Copy of a phase geometry (and its line thickness) scaled by `scale`."""
+    scaled = dict(result, thickness=max(1, round(result["thickness"] * scale)))
+    if result["kind"] == "ellipse":
+        (cx, cy), (w, h), angle = result["ellipse"]
+        scaled["ellipse"] = ((cx * scale, cy * scale), (w * scale, h * scale), angle)
+    else:
+        scaled["points"] = np.round(result["points"] * scale).astype(np.int32)
+    return scaled
+
+
+def render_preview(img, result, size=PREVIEW_SIZE):
+    """
+    render_overlay on a copy of `img` shrunk to at most `size` px on its long
+    side; the geometry is scaled instead of the full-resolution overlay.
+    """
+    h, w = img.shape[:2]
+    scale = min(1.0, size / max(h, w))
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    return render_overlay(img, scale_geometry(result, scale))
+
+
+def overlay_path(output_folder, name, phase, tier="full"):
+    """Overlay file of a phase: the scripts' PNG name, or its `.preview.jpg` variant."""
+    overlay = PHASE_OUTPUTS[phase]["overlay"]
+    if tier == "preview":
+        overlay = os.path.splitext(overlay)[0] + PREVIEW_SUFFIX
+    return os.path.join(output_folder, f"{name}{overlay}")
+
+
+def save_overlay(img, result, output_folder, name, tier="full"):
+    """Writes the overlay of one phase in the given tier (see OVERLAY_TIERS); returns its path."""
+    if tier not in OVERLAY_TIERS:
+        raise ValueError(f"Unknown overlay tier {tier!r}, expected one of {OVERLAY_TIERS}")
+    if tier == "none":
+        return None
+    path = overlay_path(output_folder, name, result["phase"], tier)
+    if tier == "full":
+        Instrument.imwrite(path, render_overlay(img, result))
+    else:
+        Instrument.imwrite(path, render_preview(img, result), [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_QUALITY])
+    return path
+
+
+def save_phase(img, result, output_folder, name, write_overlay=True, write_mask=True):
+    """
+    Writes the overlay and binary mask of one phase using the file layout of
+    the phase scripts (see PHASE_OUTPUTS). write_overlay is True/False or an
+    overlay tier ("none", "preview", "full").
+    """
+    outputs = PHASE_OUTPUTS[result["phase"]]
+    tier = {True: "full", False: "none"}.get(write_overlay, write_overlay)
+    if tier != "none":
+        save_overlay(img, result, output_folder, name, tier)
+    if write_mask:
+        mask_folder = os.path.join(output_folder, outputs["mask_folder"])
+        os.makedirs(mask_folder, exist_ok=True)
+        Instrument.imwrite(os.path.join(mask_folder, f"{name}{outputs['mask']}"), render_mask(result, img.shape[:2]))
+
+
+def save_mask_store(results, shape, output_folder, name):
+    """
+    Writes the masks of all phases of one image into a single
+    `<name>.masks` file (see MaskStore.py) instead of one PNG per phase.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    masks = {phase: render_mask(result, shape) for phase, result in results.items()}
+    write_mask_store(os.path.join(output_folder, name + MASK_STORE_SUFFIX), masks, {"specimen": name})
+
+
+def geometry_record(result):
+    """JSON-serialisable form of a phase geometry (see save_geometry)."""
+    record = {"kind": result["kind"], "thickness": result["thickness"]}
+    if result["kind"] == "ellipse":
+        (cx, cy), (w, h), angle = result["ellipse"]
+        record["ellipse"] = [[float(cx), float(cy)], [float(w), float(h)], float(angle)]
+    else:
+        record["points"] = result["points"].reshape(-1, 2).tolist()
+    return record
+
+
+def save_geometry(results, shape, output_folder, name):
+    """
+    Writes the geometry of every phase of one image (ellipse parameters or
+    polygon vertices, full-frame pixel coordinates) to
+    `<name>.geometry.json`. A few kB per specimen; Areas.geometry_areas()
+    computes the phase areas from it without any image data.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    geometry = {"specimen": name, "shape": list(shape[:2]),
+                "phases": {phase: geometry_record(result) for phase, result in results.items()}}
+    with open(os.path.join(output_folder, name + GEOMETRY_SUFFIX), "w") as f:
+        json.dump(geometry, f)
+
+
+def save_contour_csv(result, csv_path):
+    """
+    Writes the boundary points of a contour phase as an x,y CSV. A batch of
+    contours is better kept in one ContourArchive.py file.
+    """
+    with open(csv_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["x", "y"])
+        writer.writerows(result["points"].reshape(-1, 2).tolist())
+
+
+# === Per-File Phase Stage ===
+def phase_folders(output_folder, phases=PHASES, contour_csv=False):
+    """Creates and returns the per-phase output folders (plus the yellow CSV folder with contour_csv)."""
+    folders = {}
+    for phase in phases:
+        folders[phase] = os.path.join(output_folder, phase)
+        os.makedirs(folders[phase], exist_ok=True)
+    if contour_csv and "yellow" in phases:
+        os.makedirs(os.path.join(folders["yellow"], "contours_csv"), exist_ok=True)
+    return folders
+
+
+def phases_file(filename, input_folder, output_folder, phases=PHASES, phase_params=None, mask_format="png",
+                overlays="none", contour_csv=False):
+    """
+    Extracts and saves every phase of one highlighted heatmap, with one
+    sub-folder per phase under output_folder (see phase_folders).
+    With mask_format="store" the masks of all phases go into one
+    `output_folder/masks/<name>.masks` file instead of per-phase PNGs.
+    `overlays` is the overlay tier (see OVERLAY_TIERS); none by default,
+    "full" for the overlay PNGs of the individual phase scripts.
+    The phase geometry always goes to `output_folder/geometry/` (see save_geometry);
+    the yellow contour points are written as `yellow/contours_csv/<name>_contour.csv`
+    only with contour_csv (BatchRunner archives them all in one file, see ContourArchive).
+
+    Returns:
+        str: Summary of the saved phases and the reasons for skipped ones.
+    """
+    folders = phase_folders(output_folder, phases, contour_csv)
+    img = cv2.imread(os.path.join(input_folder, filename))
+    Instrument.note_frame(img)
+    name = filename[:-4]
+
+    results, skipped = extract_all_phases(img, phases, phase_params)
+
+    for phase, result in results.items():
+        save_phase(img, result, folders[phase], name, write_overlay=overlays, write_mask=(mask_format == "png"))
+    if mask_format == "store":
+        save_mask_store(results, img.shape[:2], os.path.join(output_folder, "masks"), name)
+    save_geometry(results, img.shape[:2], os.path.join(output_folder, "geometry"), name)
+    if contour_csv and "yellow" in results:
+        save_contour_csv(results["yellow"], os.path.join(folders["yellow"], "contours_csv", f"{name}_contour.csv"))
+
+    lines = [f"{reason} in {filename} ({phase})" for phase, reason in skipped.items()]
+    saved = "masks and overlays" if overlays != "none" else "masks"
+    lines.append(f"✅ Saved {len(results)}/{len(phases)} phase {saved} for {filename}")
+    return "\n".join(lines)
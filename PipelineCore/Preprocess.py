@@ -0,0 +1,27 @@
+import cv2
+
+"""
+Description:
+Loading and square cropping of raw SEM images (the notebook's conversion and
+cropping cells). OpenCV decodes the .tif files directly, so no intermediate
+.png has to be written before the next stage.
+"""
+
+IMAGE_EXTENSIONS = (".tif", ".tiff", ".png")
+
+
+def load_image(image_path):
+    """Reads an SEM image as BGR; raises ValueError if it cannot be decoded."""
+    img = cv2.imread(image_path)
+    if img is None:
+        raise ValueError(f"Could not read image {image_path}")
+    return img
+
+
+def crop_square(img):
+    """
+    Crops the image to a square (width x width), dropping the SEM info bar
+    below the fracture surface.
+    """
+    width = img.shape[1]
+    return img[0:width, 0:width]
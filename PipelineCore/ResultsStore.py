@@ -0,0 +1,255 @@
+import os
+import sys
+import time
+import uuid
+import argparse
+import pandas as pd
+
+from PipelineCore.Areas import AREA_PHASES, MICRON_AREA_FACTOR, SCALE_VALUE, areas_table, record_area
+
+"""
+Description:
+Appendable store of the phase areas: a Parquet dataset partitioned by alloy
+category and run,
+
+    <store>/category=SLM/run=P1/part-<time>-<pid>-<id>.parquet
+
+with one row per specimen x phase (specimen, phase, area_px, area_um2, scale,
+source, recorded_ns). Area-Colors.py used to keep every result in memory and
+rewrite Internal_Contour_Areas_FromMasks_Structured.csv from scratch at the
+end; here each specimen (or batch of specimens) is appended as one new file
+as soon as it is done, written to a temporary name and renamed into place,
+so parallel workers can append to the same run and a crash loses nothing
+that was appended.
+
+query() reads with pyarrow.dataset: filters on category/run only open the
+matching partition folders, filters on the other columns are checked against
+the Parquet row-group statistics before any data is read. A specimen
+appended again (a re-run) supersedes its older rows: latest=True (the
+default) keeps the most recent area of each specimen x phase. compact()
+rewrites a partition into one file once the appends are done, and
+export_csv() writes the legacy three-level MultiIndex CSV (Areas.areas_table)
+of any selection on demand:
+
+    python -m PipelineCore.ResultsStore export <store> areas.csv --category SLM --run P1
+    python -m PipelineCore.ResultsStore compact <store>
+
+Needs pyarrow (pip install pyarrow), imported when a store is opened.
+"""
+
+PARTITIONS = ("category", "run")
+KEY_COLUMNS = ("category", "run", "specimen", "phase")
+
+
+def _arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError as error:
+        raise ImportError("ResultsStore needs pyarrow (pip install pyarrow)") from error
+    return pa, ds, pq
+
+
+class ResultsStore:
+    """
+    Phase areas of any number of specimens, categories and runs.
+
+    Args:
+        root (str): Dataset folder (created on the first append).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.pa, self.ds, self.pq = _arrow()
+        self.schema = self.pa.schema([
+            ("specimen", self.pa.string()), ("phase", self.pa.string()), ("area_px", self.pa.int64()),
+            ("area_um2", self.pa.float64()), ("scale", self.pa.float64()), ("source", self.pa.string()),
+            ("recorded_ns", self.pa.int64()),
+        ])
+        # Partition values stay strings ("1" is a run name, not a number)
+        self.partitioning = self.ds.partitioning(
+            self.pa.schema([(name, self.pa.string()) for name in PARTITIONS]), flavor="hive")
+
+    def partition_folder(self, category, run):
+        return os.path.join(self.root, f"category={category}", f"run={run}")
+
+    # === Appending ===
+    def append(self, specimen_areas, category, run, source=""):
+        """
+        Appends the areas of finished specimens as one new file.
+
+        Args:
+            specimen_areas (dict): specimen -> {phase: pixel area}.
+            category (str): Alloy category (SLM, EBM, Al, ...).
+            run (str): Run / batch name.
+            source (str): Where the areas come from ("masks", "geometry", ...).
+
+        Returns:
+            str: The file written, or None if there was nothing to append.
+        """
+        recorded_ns = time.time_ns()
+        rows = [(specimen, phase, int(area)) for specimen, areas in specimen_areas.items()
+                for phase, area in areas.items()]
+        if not rows:
+            return None
+        specimens, phases, pixels = zip(*rows)
+        table = self.pa.table({
+            "specimen": list(specimens), "phase": list(phases), "area_px": list(pixels),
+            "area_um2": [area * MICRON_AREA_FACTOR for area in pixels], "scale": [SCALE_VALUE] * len(rows),
+            "source": [source] * len(rows), "recorded_ns": [recorded_ns] * len(rows),
+        }, schema=self.schema)
+
+        folder = self.partition_folder(category, run)
+        os.makedirs(folder, exist_ok=True)
+        return self._write_file(table, folder, recorded_ns)
+
+    def _write_file(self, table, folder, recorded_ns):
+        """Writes `table` to a new part file of `folder`: complete or absent, never partial."""
+        name = f"part-{recorded_ns}-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet"
+        path = os.path.join(folder, name)
+        # Files starting with "." are ignored by the dataset reader
+        temporary = os.path.join(folder, f".{name}.tmp")
+        self.pq.write_table(table, temporary)
+        os.replace(temporary, path)
+        return path
+
+    # === Queries ===
+    def _dataset(self):
+        return self.ds.dataset(self.root, format="parquet", partitioning=self.partitioning, schema=self._full_schema())
+
+    def _full_schema(self):
+        return self.pa.schema(list(self.schema) + [self.pa.field(name, self.pa.string()) for name in PARTITIONS])
+
+    def _filter(self, filters, category, run, specimens, phases):
+        """pyarrow expression from DNF filters ([("area_px", ">", 1000), ...]) and the shortcuts."""
+        field = self.ds.field
+        expression = self.pq.filters_to_expression(filters) if filters else None
+        for name, values in (("category", category), ("run", run), ("specimen", specimens), ("phase", phases)):
+            if values is None:
+                continue
+            values = [values] if isinstance(values, str) else list(values)
+            condition = field(name).isin(values)
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def query(self, filters=None, columns=None, category=None, run=None, specimens=None, phases=None, latest=True):
+        """
+        Rows of the store matching the filters.
+
+        Args:
+            filters (list): pyarrow DNF filters, e.g. [("area_px", ">", 1000)]
+                or [[(...)], [(...)]] for OR.
+            columns (list): Columns to return (all by default).
+            category, run, specimens, phases: One value or a list each;
+                shortcuts for the equivalent filters.
+            latest (bool): Keep only the most recent row of every
+                category x run x specimen x phase.
+
+        Returns:
+            DataFrame: The matching rows, oldest append first.
+        """
+        if not os.path.isdir(self.root):
+            return pd.DataFrame(columns=columns or self._full_schema().names)
+        read_columns = None
+        if columns is not None:
+            read_columns = list(dict.fromkeys(list(columns) + (list(KEY_COLUMNS) + ["recorded_ns"] if latest else [])))
+        table = self._dataset().to_table(columns=read_columns,
+                                         filter=self._filter(filters, category, run, specimens, phases))
+        frame = table.to_pandas()
+        frame = frame.sort_values("recorded_ns", kind="stable") if "recorded_ns" in frame else frame
+        if latest:
+            frame = frame.drop_duplicates(list(KEY_COLUMNS), keep="last")
+        frame = frame.reset_index(drop=True)
+        return frame[list(columns)] if columns is not None else frame
+
+    def partitions(self):
+        """(category, run) of every partition folder, sorted."""
+        found = []
+        if os.path.isdir(self.root):
+            for category_dir in sorted(os.listdir(self.root)):
+                if not category_dir.startswith("category="):
+                    continue
+                for run_dir in sorted(os.listdir(os.path.join(self.root, category_dir))):
+                    if run_dir.startswith("run="):
+                        found.append((category_dir.split("=", 1)[1], run_dir.split("=", 1)[1]))
+        return found
+
+    # === Maintenance and Export ===
+    def compact(self, category=None, run=None):
+        """
+        Rewrites every matching partition into one file with only the latest
+        row of each specimen x phase. Files appended while this runs are kept.
+
+        Returns:
+            int: Partitions compacted.
+        """
+        compacted = 0
+        for part_category, part_run in self.partitions():
+            if category not in (None, part_category) or run not in (None, part_run):
+                continue
+            folder = self.partition_folder(part_category, part_run)
+            files = sorted(f for f in os.listdir(folder) if f.endswith(".parquet"))
+            if len(files) < 2:
+                continue
+            table = self.pa.concat_tables([self.pq.read_table(os.path.join(folder, f), schema=self.schema)
+                                           for f in files])
+            frame = table.to_pandas().sort_values("recorded_ns", kind="stable")
+            frame = frame.drop_duplicates(["specimen", "phase"], keep="last")
+            merged = self.pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False)
+            self._write_file(merged, folder, int(frame["recorded_ns"].max()))
+            for f in files:
+                os.remove(os.path.join(folder, f))
+            compacted += 1
+        return compacted
+
+    def results(self, **query):
+        """The selected rows as Area-Colors.py's `results` dict (see Areas.record_area)."""
+        results = {}
+        rows = self.query(columns=["specimen", "phase", "area_px"], **query)
+        for specimen, phase, area in rows.itertuples(index=False):
+            record_area(results, specimen, phase, int(area))
+        return results
+
+    def export_csv(self, path, **query):
+        """
+        Writes the selected rows in the legacy layout of
+        Internal_Contour_Areas_FromMasks_Structured.csv (one row per specimen).
+
+        Returns:
+            int: Specimens written.
+        """
+        results = self.results(**query)
+        areas_table(results).to_csv(path, index=False)
+        return len(results)
+
+
+# === Command Line ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query, export or compact a phase area results store.")
+    parser.add_argument("command", choices=["export", "compact", "summary"])
+    parser.add_argument("store", help="Results store folder")
+    parser.add_argument("output", nargs="?", help="CSV to write (export)")
+    parser.add_argument("--category", help="Alloy category, e.g. SLM")
+    parser.add_argument("--run", help="Run name")
+    parser.add_argument("--phase", action="append", choices=AREA_PHASES, help="Only this phase (repeatable)")
+    args = parser.parse_args(argv)
+
+    store = ResultsStore(args.store)
+    if args.command == "export":
+        if not args.output:
+            raise SystemExit("export needs an output CSV")
+        count = store.export_csv(args.output, category=args.category, run=args.run, phases=args.phase)
+        print(f"✅ {count} specimens written to {args.output}")
+    elif args.command == "compact":
+        print(f"✅ {store.compact(args.category, args.run)} partitions compacted")
+    else:
+        rows = store.query(category=args.category, run=args.run, phases=args.phase)
+        counts = rows.groupby(["category", "run"])["specimen"].nunique() if len(rows) else {}
+        for (category, run), count in dict(counts).items():
+            print(f"📊 {category}/{run}: {count} specimens")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import os
+import json
+import zlib
+import pickle
+import hashlib
+import numpy as np
+
+"""
+Description:
+Content-addressed cache of stage outputs for StageGraph.
+
+Every stage output is stored under a key that hashes:
+    - the stage name and CACHE_VERSION,
+    - the exact stage parameters (HSV ranges, kernel sizes, dilation,
+      window_size / window_step, ...) and the module settings a stage reads
+      itself (Stage.constants: the crack-zone HSV ranges, the Canny
+      thresholds, ...),
+    - the keys of the stages it reads from, down to a hash of the input
+      file's bytes.
+
+Changing one parameter therefore changes the key of that stage and of every
+stage downstream of it, and nothing else: a re-run recomputes only those
+stages and loads the rest (or skips them entirely when a later stage is
+already cached). Entries are zlib-compressed pickles written atomically, so
+several BatchRunner workers can share one cache directory. The directory is
+kept under `max_bytes` by evicting the least recently used entries.
+
+The directory is scanned when a cache is opened and again after every
+max_bytes * RESCAN_FRACTION bytes this process stores, so a worker sees the
+other workers' entries without walking the cache for every file; shared_cache()
+keeps one instance per process for the per-file batch stages.
+
+Bump CACHE_VERSION when a stage's code changes its output for the same
+parameters; `force=True` recomputes and overwrites regardless.
+"""
+
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+ENTRY_SUFFIX = ".pkl.z"
+# Share of max_bytes stored by this process between two scans of the directory
+RESCAN_FRACTION = 1 / 16
+
+# Source hashes of this process, keyed by (path, size, mtime)
+_source_hashes = {}
+# Caches of this process, keyed by (directory, max_bytes, force)
+_shared_caches = {}
+
+
+def _canonical(value):
+    """JSON-serialisable, order-independent form of stage parameters."""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def file_hash(path, chunk_size=1 << 22):
+    """sha256 of a file's content (memoised per process while the file is unchanged)."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _source_hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        _source_hashes[memo_key] = digest.hexdigest()
+    return _source_hashes[memo_key]
+
+
+class StageCache:
+    """
+    Size-bounded, content-addressed store of stage outputs.
+
+    Args:
+        cache_dir (str): Cache directory (created if missing).
+        max_bytes (int): Size bound; least recently used entries are evicted.
+        force (bool): Ignore existing entries (recompute and overwrite).
+        compress_level (int): zlib level of the stored entries (0 stores them uncompressed).
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, force=False, compress_level=1):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.force = force
+        self.compress_level = compress_level
+        self.hits = {}
+        self.misses = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.evict()
+
+    # === Keys ===
+    def source_key(self, path):
+        return file_hash(path)
+
+    def stage_key(self, stage_name, params, upstream_keys):
+        payload = json.dumps([CACHE_VERSION, stage_name, _canonical(params), list(upstream_keys)],
+                             sort_keys=True, default=repr)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # === Entries ===
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ENTRY_SUFFIX)
+
+    def _entries(self):
+        """(last_used, path, size) of every entry in the cache."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for f in files:
+                if f.endswith(ENTRY_SUFFIX):
+                    path = os.path.join(root, f)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def load(self, stage_name, key):
+        """
+        Returns:
+            tuple: (found, value). Always (False, None) when forcing.
+        """
+        path = self._path(key)
+        if self.force or not os.path.exists(path):
+            self.misses[stage_name] = self.misses.get(stage_name, 0) + 1
+            return False, None
+        try:
+            with open(path, "rb") as f:
+                value = pickle.loads(zlib.decompress(f.read()))
+        except (FileNotFoundError, zlib.error, pickle.UnpicklingError, EOFError):
+            # Evicted meanwhile or truncated: treat as a miss
+            self.misses[stage_name] = self.misses.get(stage_name, 0) + 1
+            return False, None
+
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits[stage_name] = self.hits.get(stage_name, 0) + 1
+        return True, value
+
+    def store(self, key, value):
+        """Writes an entry atomically, then evicts if the cache is over its bound."""
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), self.compress_level)
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._size += len(data)
+        self._stored_since_scan += len(data)
+        if self._size > self.max_bytes or self._stored_since_scan > self.max_bytes * RESCAN_FRACTION:
+            self.evict()
+
+    def evict(self):
+        """
+        Scans the directory (entries of every process) and removes least
+        recently used entries until the cache fits in max_bytes.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        self._stored_since_scan = 0
+        if total <= self.max_bytes:
+            self._size = total
+            return
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def reset_counts(self):
+        """Starts new hit/miss counts (one file of a batch)."""
+        self.hits, self.misses = {}, {}
+
+    def summary(self):
+        """Hits and misses per stage, e.g. 'heatmap 1/0, phases 0/1' (hits/misses)."""
+        stages = list(dict.fromkeys(list(self.hits) + list(self.misses)))
+        return ", ".join(f"{s} {self.hits.get(s, 0)}/{self.misses.get(s, 0)}" for s in stages)
+
+
+def shared_cache(cache_dir, max_bytes=DEFAULT_MAX_BYTES, force=False):
+    """
+    The StageCache of this process for `cache_dir`, opened (and its directory
+    scanned) on the first call only; per-file stages run in long-lived pool
+    workers, so each worker opens the cache once per batch.
+    """
+    key = (os.path.abspath(cache_dir), max_bytes, force)
+    if key not in _shared_caches:
+        _shared_caches[key] = StageCache(cache_dir, max_bytes, force)
+    return _shared_caches[key]
@@ -0,0 +1,330 @@
+import os
+
+from PipelineCore import CrackZone, Instrument, Masking, PhaseExtractor
+
+from PipelineCore.Areas import phase_areas, record_area, areas_table
+from PipelineCore.BatchRunner import FileSkipped
+from PipelineCore.CrackZone import find_crack_zone, highlight_crack_zone
+from PipelineCore.Heatmap import WINDOW_SIZE, WINDOW_STEP, get_heatmap
+from PipelineCore.Masking import RADIUS_MARGIN, get_contour, specimen_mask
+from PipelineCore.PhaseExtractor import PHASES, PHASE_PARAMS, extract_all_phases, phase_folders, save_phase, save_geometry, save_contour_csv
+from PipelineCore.Preprocess import load_image, crop_square
+from PipelineCore.StageCache import DEFAULT_MAX_BYTES, shared_cache
+
+"""
+Description:
+In-memory pipeline for one specimen:
+
+    preprocess -> mask -> heatmap -> crack zone -> phases -> areas
+
+The scripts hand data to each other through PNG files (mask, heatmap,
+highlighted heatmap, phase masks), which costs a lossless encode and decode of
+the full frame at every hop. Here every stage receives its inputs as arrays
+from the stages it depends on, and writing a stage's output is optional: pass
+a folder for the stages whose files you want. Written files use the same
+names and layout as the scripts, and because PNG is lossless the in-memory
+chain gives exactly the results of the file-based one.
+
+Usage:
+    graph = StageGraph()
+    outputs = graph.run("S1.tif", write={"heatmap": heatmap_dir, "phases": phases_dir})
+    outputs["areas"]   # {"dark_red": pixels, ...}
+
+The phases stage writes masks and geometry but no overlays; use
+StageGraph(default_stages(overlays="full")) for the scripts' overlay PNGs, or
+draw them later from the geometry (Overlays.py).
+
+With StageGraph(cache=StageCache(cache_dir)) stage outputs are reused across
+runs; only the stages whose input or parameters changed are recomputed.
+"""
+
+
+class Stage:
+    """
+    One node of the stage graph.
+
+    Args:
+        name (str): Stage name; also the key of its output.
+        inputs (tuple): Stages (or "source", the input path) whose outputs
+            are passed to `run`, in order.
+        run (callable): run(*inputs, **params) -> output.
+        write (callable): write(outputs, folder, name) saves this stage's
+            output given all outputs computed so far.
+        params (dict): Default parameters passed to `run`.
+        write_needs (tuple): Other stages whose outputs `write` reads.
+        constants (dict): Module settings `run` reads itself (HSV bounds,
+            thresholds); not passed to it, but part of the cache key.
+    """
+
+    def __init__(self, name, inputs, run, write=None, params=None, write_needs=(), constants=None):
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.run = run
+        self.write = write
+        self.params = dict(params or {})
+        self.write_needs = tuple(write_needs)
+        self.constants = dict(constants or {})
+
+
+# === Stage Functions ===
+def _preprocess(image_path, square=True):
+    img = load_image(image_path)
+    img = crop_square(img) if square else img
+    Instrument.note_frame(img)
+    return img
+
+
+def _mask(img, radius_margin=RADIUS_MARGIN):
+    return specimen_mask(img, radius_margin)
+
+
+def _heatmap(img, mask, window_size=WINDOW_SIZE, window_step=WINDOW_STEP, mode="compat"):
+    ext_contour = get_contour(mask)
+    if ext_contour is None:
+        raise FileSkipped("No valid contour found, skipping.")
+    return get_heatmap(img, ext_contour, window_size, window_step, mode)
+
+
+def _crack_zone(heatmap):
+    largest_contour = find_crack_zone(heatmap)
+    if largest_contour is None:
+        raise FileSkipped("⚠ No crack zone found")
+    return highlight_crack_zone(heatmap, largest_contour)
+
+
+def _phases(highlighted, phases=PHASES, phase_params=None):
+    results, skipped = extract_all_phases(highlighted, phases, phase_params)
+    return {"results": results, "skipped": skipped}
+
+
+def _areas(phases, highlighted):
+    return phase_areas(phases["results"], highlighted.shape[:2])
+
+
+# === Stage Writers (script file layout) ===
+def _frame_pixels(outputs):
+    """Pixels of the specimen frame, once the preprocess stage has run."""
+    img = outputs.get("preprocess")
+    return None if img is None else img.shape[0] * img.shape[1]
+
+
+def _write_image(stage, suffix):
+    def write(outputs, folder, name):
+        Instrument.imwrite(os.path.join(folder, f"{name}{suffix}.png"), outputs[stage])
+    return write
+
+
+def _write_phases(overlays="none", contour_csv=False):
+    def write(outputs, folder, name):
+        highlighted = outputs["crack_zone"]
+        results = outputs["phases"]["results"]
+        folders = phase_folders(folder, contour_csv=contour_csv)
+        for phase, result in results.items():
+            save_phase(highlighted, result, folders[phase], f"{name}_heatmap_highlighted", write_overlay=overlays)
+        save_geometry(results, highlighted.shape[:2], os.path.join(folder, "geometry"), f"{name}_heatmap_highlighted")
+        if contour_csv and "yellow" in results:
+            csv_path = os.path.join(folders["yellow"], "contours_csv", f"{name}_heatmap_highlighted_contour.csv")
+            save_contour_csv(results["yellow"], csv_path)
+    return write
+
+
+def _write_areas(outputs, folder, name):
+    results = {}
+    for phase, area_pixels in outputs["areas"].items():
+        record_area(results, name, phase, area_pixels)
+    areas_table(results).to_csv(os.path.join(folder, f"{name}_areas.csv"), index=False)
+
+
+def _module_constants(module, names):
+    """Current values of module settings (read when the stages are built, so edits count)."""
+    return {f"{module.__name__}.{name}": getattr(module, name) for name in names}
+
+
+def default_stages(overlays="none", contour_csv=False):
+    """
+    The six pipeline stages, in dependency order; `overlays` is the phase
+    overlay tier (none by default, "full" for the scripts' overlay PNGs),
+    `contour_csv` also writes the yellow contour CSV files.
+    """
+    return [
+        Stage("preprocess", ["source"], _preprocess, _write_image("preprocess", ""), {"square": True}),
+        Stage("mask", ["preprocess"], _mask, _write_image("mask", "_mask"), {"radius_margin": RADIUS_MARGIN},
+              constants=_module_constants(Masking, ["CLAHE_CLIP_LIMIT", "CLAHE_TILE_GRID", "EDGE_BLUR_KERNEL",
+                                                    "CANNY_THRESHOLDS", "EDGE_KERNEL_SIZE"])),
+        Stage("heatmap", ["preprocess", "mask"], _heatmap, _write_image("heatmap", "_heatmap"),
+              {"window_size": WINDOW_SIZE, "window_step": WINDOW_STEP, "mode": "compat"}),
+        Stage("crack_zone", ["heatmap"], _crack_zone, _write_image("crack_zone", "_heatmap_highlighted"),
+              constants=_module_constants(CrackZone, ["COLOR_RANGES", "KERNEL_SIZE", "MIN_ORANGE_AREA"])),
+        Stage("phases", ["crack_zone"], _phases, _write_phases(overlays, contour_csv),
+              {"phases": PHASES, "phase_params": PHASE_PARAMS}, write_needs=["crack_zone"],
+              constants=_module_constants(PhaseExtractor, ["PINK_RANGE"])),
+        Stage("areas", ["phases", "crack_zone"], _areas, _write_areas),
+    ]
+
+
+class StageGraph:
+    """
+    Runs the stages a requested output depends on, keeping every
+    intermediate array in memory.
+
+    Args:
+        stages (list): Stage nodes; defaults to default_stages().
+        params (dict): stage name -> parameter overrides.
+        cache (StageCache): Optional content-addressed cache of stage
+            outputs; cached stages are loaded instead of run, and stages
+            upstream of a cached one are not run at all.
+    """
+
+    def __init__(self, stages=None, params=None, cache=None):
+        self.cache = cache
+        self.stages = {stage.name: stage for stage in (stages or default_stages())}
+        params = params or {}
+        unknown = set(params) - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown stages in params: {sorted(unknown)}")
+        self.params = {name: {**stage.params, **params.get(name, {})} for name, stage in self.stages.items()}
+
+    def upstream(self, name):
+        """All stages `name` depends on (including itself), in run order."""
+        order = []
+
+        def visit(stage_name):
+            if stage_name == "source" or stage_name in order:
+                return
+            for dependency in self.stages[stage_name].inputs:
+                visit(dependency)
+            order.append(stage_name)
+
+        visit(name)
+        return order
+
+    def order(self):
+        """Every stage, dependencies first."""
+        order = []
+        for stage_name in self.stages:
+            order += [s for s in self.upstream(stage_name) if s not in order]
+        return order
+
+    def stage_keys(self, image_path):
+        """Cache key of every stage for this input file."""
+        keys = {"source": self.cache.source_key(image_path)}
+        for stage_name in self.order():
+            stage = self.stages[stage_name]
+            params = dict(self.params[stage_name])
+            if stage.constants:
+                params["constants"] = stage.constants
+            keys[stage_name] = self.cache.stage_key(stage_name, params,
+                                                    [keys[dependency] for dependency in stage.inputs])
+        del keys["source"]
+        return keys
+
+    def run(self, image_path, write=None, targets=("areas",), provided=None, name=None):
+        """
+        Runs one specimen through the graph.
+
+        Args:
+            image_path (str): Raw SEM image (.tif or .png).
+            write (dict): stage name -> output folder for the stages to save.
+            targets (tuple): Stages whose outputs are needed; only they and
+                the upstream stages they need run.
+            provided (dict): Already available stage outputs (e.g. a heatmap
+                loaded from disk); those stages and their inputs are not run.
+                The cache is not used in that case, since the provided
+                outputs are not derived from the keys.
+            name (str): Specimen name for written files; defaults to the
+                image file name without extension.
+
+        Returns:
+            dict: stage name -> output of every stage that ran, was loaded
+            from the cache or was provided.
+
+        Raises:
+            FileSkipped: If a stage finds nothing to work on (no specimen
+                contour, no crack zone).
+        """
+        write = write or {}
+        unknown = set(write) - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown stages in write: {sorted(unknown)}")
+        name = name or os.path.splitext(os.path.basename(image_path))[0]
+        outputs = {"source": image_path}
+        outputs.update(provided or {})
+
+        keys = self.stage_keys(image_path) if self.cache is not None and not provided else {}
+        pending = set()
+
+        def need(stage_name):
+            """Marks a stage to run unless its output is available or cached."""
+            if stage_name in outputs or stage_name in pending:
+                return
+            if stage_name in keys:
+                found, value = self.cache.load(stage_name, keys[stage_name])
+                if found:
+                    if isinstance(value, FileSkipped):
+                        raise value
+                    outputs[stage_name] = value
+                    return
+            pending.add(stage_name)
+            for dependency in self.stages[stage_name].inputs:
+                need(dependency)
+
+        # Written stages are targets too
+        for target in list(targets) + list(write):
+            need(target)
+        for stage_name in write:
+            for dependency in self.stages[stage_name].write_needs:
+                need(dependency)
+
+        for stage_name in self.order():
+            if stage_name in pending:
+                stage = self.stages[stage_name]
+                try:
+                    with Instrument.span(stage_name, specimen=name, pixels=_frame_pixels(outputs)):
+                        outputs[stage_name] = stage.run(*[outputs[dependency] for dependency in stage.inputs],
+                                                        **self.params[stage_name])
+                except FileSkipped as reason:
+                    if stage_name in keys:
+                        self.cache.store(keys[stage_name], reason)
+                    raise
+                if stage_name in keys:
+                    self.cache.store(keys[stage_name], outputs[stage_name])
+            if stage_name in write and stage_name in outputs and self.stages[stage_name].write is not None:
+                os.makedirs(write[stage_name], exist_ok=True)
+                with Instrument.span(f"write_{stage_name}", specimen=name):
+                    self.stages[stage_name].write(outputs, write[stage_name], name)
+
+        del outputs["source"]
+        return outputs
+
+
+def run_specimen(image_path, write=None, params=None, cache=None):
+    """Runs the whole chain for one specimen and returns every stage output."""
+    return StageGraph(params=params, cache=cache).run(image_path, write)
+
+
+def specimen_file(filename, input_dir, output_dir, write_stages=("crack_zone", "phases", "areas"), params=None,
+                  cache_dir=None, cache_bytes=DEFAULT_MAX_BYTES, force=False, results_store=None, category=None,
+                  run=None, overlays="none", contour_csv=False):
+    """
+    Per-file entry point for BatchRunner.py: runs the whole chain for one raw
+    image and writes the requested stages to `output_dir/<stage>/`, reusing
+    the outputs cached in `cache_dir` when given. With `results_store` (a
+    ResultsStore folder) the areas are also appended under category/run.
+    `overlays` is the tier of the written phase overlays (see OVERLAY_TIERS);
+    `contour_csv` also writes the per-specimen yellow contour CSV files.
+
+    Returns:
+        str: The phase pixel areas of the specimen (and cache hits/misses).
+    """
+    cache = shared_cache(cache_dir, cache_bytes, force) if cache_dir else None
+    if cache is not None:
+        cache.reset_counts()
+    write = {stage: os.path.join(output_dir, stage) for stage in write_stages}
+    outputs = StageGraph(default_stages(overlays, contour_csv), params=params, cache=cache).run(os.path.join(input_dir, filename), write)
+    if results_store is not None:
+        from PipelineCore.ResultsStore import ResultsStore
+        ResultsStore(results_store).append({os.path.splitext(filename)[0]: outputs["areas"]}, category, run, "pipeline")
+    message = ", ".join(f"{phase} {area}" for phase, area in outputs["areas"].items())
+    if cache is not None:
+        message += f" [cache hits/misses: {cache.summary()}]"
+    return message
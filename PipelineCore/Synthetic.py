@@ -0,0 +1,147 @@
+import os
+import cv2
+import numpy as np
+
+from PipelineCore.CrackZone import find_crack_zone, highlight_crack_zone
+
+"""
+Description:
+Deterministic synthetic fractographs for benchmarks and checks, so no SEM
+data is needed to run a stage at any resolution.
+
+    - synthetic_specimen: a square-cropped SEM-like frame - a bright circular
+      specimen on a dark background with a radial gradient, coarse relief and
+      fine texture for the gradient heatmap to respond to;
+    - synthetic_heatmap: a heatmap of nested warm-to-cold bands (JET colours
+      from dark red in the hottest core out to blue), black outside the
+      specimen, and the same heatmap highlighted the way ExtractCrackArea.py
+      highlights it (crack zone found and circled in pink);
+    - scatter_fragments: small warm specks over a heatmap, the noise that
+      leaves the crack-zone masks with thousands of fragments.
+
+The same seed gives the same picture at every size: the random fields are
+drawn on a fixed coarse grid and resized, so a 1024^2 and a 4096^2 specimen
+differ only in resolution.
+"""
+
+SPECIMEN_RADIUS = 0.46  # Fraction of the frame side
+FIELD_GRID = 64         # Side of the coarse random grids
+HEATMAP_BANDS = 9       # Colour bands of the synthetic heatmap
+FRAGMENT_COLORS = [(0, 0, 255), (0, 0, 160), (0, 140, 255), (0, 200, 255)]  # Red, dark red, orange (BGR)
+
+
+def _coarse_field(rng, size, grid=FIELD_GRID):
+    """Smooth random field in [0, 1), drawn on a grid x grid lattice and resized."""
+    field = cv2.resize(rng.random((grid, grid), dtype=np.float32), (size, size), interpolation=cv2.INTER_CUBIC)
+    return np.clip(field, 0, 1)
+
+
+def specimen_disc(size):
+    """Binary (0/255) disc of the synthetic specimen."""
+    disc = np.zeros((size, size), np.uint8)
+    cv2.circle(disc, (size // 2, size // 2), int(size * SPECIMEN_RADIUS), 255, -1)
+    return disc
+
+
+def synthetic_specimen(size, seed=0):
+    """
+    SEM-like BGR frame of a circular specimen.
+
+    Args:
+        size (int): Frame side in pixels.
+        seed (int): Random seed.
+
+    Returns:
+        ndarray: (size, size, 3) uint8 image.
+    """
+    rng = np.random.default_rng(seed)
+    coords = (np.arange(size, dtype=np.float32) + 0.5) / size - 0.5
+    radius = np.sqrt(coords[None, :] ** 2 + coords[:, None] ** 2) / SPECIMEN_RADIUS
+
+    relief = _coarse_field(rng, size)
+    fine = cv2.GaussianBlur(rng.random((size, size), dtype=np.float32), (0, 0), max(size / 2048, 0.8))
+    surface = 0.55 - 0.25 * radius + 0.25 * relief + 0.35 * (fine - 0.5)
+
+    img = np.where(specimen_disc(size) > 0, surface, 0.05 * fine)
+    img = np.clip(img * 255, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+
+def synthetic_heatmap(size, seed=0):
+    """
+    Banded JET heatmap of a circular specimen and its highlighted version.
+
+    The hot core is placed off-centre with a few warm lobes around it, and
+    the value field is quantised into HEATMAP_BANDS nested bands, so every
+    phase colour (dark red, red, orange/yellow, cyan, blue) forms a region
+    for the crack-zone and phase stages to find.
+
+    Returns:
+        tuple: (heatmap, highlighted) BGR images; highlighted is None if the
+        crack-zone detection finds nothing.
+    """
+    rng = np.random.default_rng(seed)
+    coords = (np.arange(size, dtype=np.float32) + 0.5) / size
+    x, y = coords[None, :], coords[:, None]
+
+    centre = 0.5 + rng.uniform(-0.12, 0.12, 2)
+    field = np.exp(-((x - centre[0]) ** 2 + (y - centre[1]) ** 2) / (2 * 0.16 ** 2))
+    for _ in range(3):
+        lobe = centre + rng.uniform(-0.15, 0.15, 2)
+        field += rng.uniform(0.15, 0.3) * np.exp(-((x - lobe[0]) ** 2 + (y - lobe[1]) ** 2) / (2 * 0.07 ** 2))
+    field = field / field.max() + 0.08 * (_coarse_field(rng, size, FIELD_GRID // 4) - 0.5)
+
+    bands = np.floor(np.clip(field, 0, 0.999) * HEATMAP_BANDS) / (HEATMAP_BANDS - 1)
+    heatmap = cv2.applyColorMap(np.uint8(np.clip(bands, 0, 1) * 255), cv2.COLORMAP_JET)
+    heatmap[specimen_disc(size) == 0] = 0
+
+    contour = find_crack_zone(heatmap)
+    highlighted = None if contour is None else highlight_crack_zone(heatmap, contour)
+    return heatmap, highlighted
+
+
+def scatter_fragments(heatmap, count, seed=0):
+    """
+    Noisy heatmap: `count` red and orange specks (filled squares and discs,
+    large enough to survive the crack-zone opening) scattered over the
+    specimen of a copy of `heatmap`.
+
+    Returns:
+        ndarray: The noisy BGR heatmap.
+    """
+    rng = np.random.default_rng(seed)
+    noisy = heatmap.copy()
+    size = heatmap.shape[0]
+    scale = max(size / 2048, 0.5)
+    centre, radius = size / 2, size * SPECIMEN_RADIUS
+    for _ in range(count):
+        angle, distance = rng.uniform(0, 2 * np.pi), radius * np.sqrt(rng.random())
+        x, y = int(centre + distance * np.cos(angle)), int(centre + distance * np.sin(angle))
+        extent = int(rng.integers(6, 20) * scale)
+        color = FRAGMENT_COLORS[rng.integers(len(FRAGMENT_COLORS))]
+        if rng.random() < 0.5:
+            cv2.rectangle(noisy, (x, y), (x + extent, y + extent), color, -1)
+        else:
+            cv2.circle(noisy, (x, y), extent // 2, color, -1)
+    return noisy
+
+
+def write_synthetic_set(output_dir, size, count=1, seed=0):
+    """
+    Writes `count` synthetic specimens with the file names of the pipeline
+    folders: `<name>.png`, `<name>_heatmap.png` and `<name>_heatmap_highlighted.png`.
+
+    Returns:
+        list: Specimen names written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    names = []
+    for index in range(count):
+        name = f"synthetic_{size}_{seed + index}"
+        heatmap, highlighted = synthetic_heatmap(size, seed + index)
+        cv2.imwrite(os.path.join(output_dir, f"{name}.png"), synthetic_specimen(size, seed + index))
+        cv2.imwrite(os.path.join(output_dir, f"{name}_heatmap.png"), heatmap)
+        if highlighted is not None:
+            cv2.imwrite(os.path.join(output_dir, f"{name}_heatmap_highlighted.png"), highlighted)
+        names.append(name)
+    return names
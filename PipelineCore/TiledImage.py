@@ -0,0 +1,287 @@
+import os
+import struct
+import cv2
+import numpy as np
+
+"""
+Description:
+Tiled, memory-mapped access to large SEM TIFFs.
+
+load_image() decodes a whole frame, and every stage then adds HSV, grey and
+float copies of it; stitched or high-magnification frames far above 4096^2
+do not fit in a worker that way. TiffImage reads the TIFF directory itself
+and memory-maps the pixel data of uncompressed files, striped (the usual
+SEM export) or tiled, plain or BigTIFF, so any region can be read without
+touching the rest of the file. Compressed files cannot be mapped; they are
+decoded whole with OpenCV as before (with a warning).
+
+iter_tiles() walks an image in tiles and read_padded() returns a tile grown
+by a halo on every side (image borders padded the way OpenCV pads them), so
+a filter with a support of up to `halo` pixels gives exactly its
+full-frame result on the tile core. Heatmap.stream_heatmap uses it for the
+heatmap stage with a halo of half the 201-pixel window.
+
+Regions are returned as BGR uint8, like cv2.imread: RGB is swapped, grey is
+replicated to three channels and 16-bit samples are scaled down by 256.
+create_tiff() writes the matching uncompressed RGB TIFF through a memory map,
+so tiled results never have to be assembled in memory either.
+"""
+
+DEFAULT_TILE_SIZE = 2048
+
+# === TIFF Tags ===
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+PHOTOMETRIC = 262
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+ROWS_PER_STRIP = 278
+STRIP_BYTE_COUNTS = 279
+PLANAR_CONFIG = 284
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+TILE_BYTE_COUNTS = 325
+
+# TIFF field type -> (struct code, size)
+FIELD_TYPES = {1: ("B", 1), 2: ("c", 1), 3: ("H", 2), 4: ("I", 4), 6: ("b", 1), 7: ("B", 1),
+               8: ("h", 2), 9: ("i", 4), 16: ("Q", 8), 17: ("q", 8)}
+
+
+def _read_ifd(f, byte_order, bigtiff):
+    """Tag -> tuple of values of the first image file directory."""
+    f.seek(4 if not bigtiff else 8)
+    offset = struct.unpack(byte_order + ("Q" if bigtiff else "I"), f.read(8 if bigtiff else 4))[0]
+    f.seek(offset)
+    count_format, entry_size, inline_size = ("Q", 20, 8) if bigtiff else ("H", 12, 4)
+    (count,) = struct.unpack(byte_order + count_format, f.read(struct.calcsize(count_format)))
+
+    entries = f.read(count * entry_size)
+    tags = {}
+    for i in range(count):
+        entry = entries[i * entry_size:(i + 1) * entry_size]
+        if bigtiff:
+            tag, field_type, n = struct.unpack(byte_order + "HHQ", entry[:12])
+            value = entry[12:]
+        else:
+            tag, field_type, n = struct.unpack(byte_order + "HHI", entry[:8])
+            value = entry[8:]
+        if field_type not in FIELD_TYPES:
+            continue
+        code, size = FIELD_TYPES[field_type]
+        if n * size > inline_size:
+            (value_offset,) = struct.unpack(byte_order + ("Q" if bigtiff else "I"), value)
+            position = f.tell()
+            f.seek(value_offset)
+            value = f.read(n * size)
+            f.seek(position)
+        tags[tag] = struct.unpack(byte_order + code * n, value[:n * size])
+    return tags
+
+
+class TiffImage:
+    """
+    Region reader for a TIFF file (first page).
+
+    Args:
+        path (str): TIFF file.
+        max_height (int): Only expose the top `max_height` rows, e.g. the
+            square fracture surface above the SEM info bar (see crop_square).
+
+    Attributes:
+        shape (tuple): (height, width) of the exposed image.
+        mapped (bool): False when the file was compressed and decoded whole.
+    """
+
+    def __init__(self, path, max_height=None):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(4)
+            if header[:2] not in (b"II", b"MM"):
+                raise ValueError(f"{path} is not a TIFF file")
+            byte_order = "<" if header[:2] == b"II" else ">"
+            (version,) = struct.unpack(byte_order + "H", header[2:])
+            tags = _read_ifd(f, byte_order, bigtiff=(version == 43))
+
+        width, height = tags[IMAGE_WIDTH][0], tags[IMAGE_LENGTH][0]
+        self.samples = tags.get(SAMPLES_PER_PIXEL, (1,))[0]
+        bits = tags.get(BITS_PER_SAMPLE, (8,))[0]
+        self.photometric = tags.get(PHOTOMETRIC, (1,))[0]
+        compression = tags.get(COMPRESSION, (1,))[0]
+        planar = tags.get(PLANAR_CONFIG, (1,))[0]
+
+        self.full_shape = (height, width)
+        self.shape = (min(height, max_height or height), width)
+        self.mapped = compression == 1 and planar == 1 and bits in (8, 16)
+        if not self.mapped:
+            print(f"⚠ {os.path.basename(path)} is compressed or planar; decoding it whole")
+            self._decoded = cv2.imread(path)
+            if self._decoded is None:
+                raise ValueError(f"Could not read image {path}")
+            return
+
+        self.dtype = np.dtype(byte_order + ("u1" if bits == 8 else "u2"))
+        self.tiled = TILE_OFFSETS in tags
+        if self.tiled:
+            self.block = (tags[TILE_LENGTH][0], tags[TILE_WIDTH][0])
+            offsets = tags[TILE_OFFSETS]
+        else:
+            self.block = (min(tags.get(ROWS_PER_STRIP, (height,))[0], height), width)
+            offsets = tags[STRIP_OFFSETS]
+        self.blocks_across = -(-width // self.block[1])
+        self.offsets = offsets
+
+        # Strips written back to back (the usual case) map as one array
+        block_bytes = self.block[0] * self.block[1] * self.samples * self.dtype.itemsize
+        self._contiguous = None
+        if not self.tiled and all(b - a == block_bytes for a, b in zip(offsets, offsets[1:])):
+            self._contiguous = np.memmap(path, self.dtype, "r", offsets[0], (height, width, self.samples))
+
+    def _block(self, index):
+        """Memory map of one strip or tile (strips at the bottom may be short)."""
+        rows, cols = self.block
+        if not self.tiled:
+            rows = min(rows, self.full_shape[0] - index * rows)
+        return np.memmap(self.path, self.dtype, "r", self.offsets[index], (rows, cols, self.samples))
+
+    def _raw(self, y0, y1, x0, x1):
+        if self._contiguous is not None:
+            return self._contiguous[y0:y1, x0:x1]
+        out = np.empty((y1 - y0, x1 - x0, self.samples), self.dtype)
+        block_rows, block_cols = self.block
+        for by in range(y0 // block_rows, (y1 - 1) // block_rows + 1):
+            for bx in range(x0 // block_cols, (x1 - 1) // block_cols + 1):
+                block = self._block(by * self.blocks_across + bx)
+                top, left = by * block_rows, bx * block_cols
+                ys, ye = max(y0, top), min(y1, top + block.shape[0])
+                xs, xe = max(x0, left), min(x1, left + block_cols)
+                out[ys - y0:ye - y0, xs - x0:xe - x0] = block[ys - top:ye - top, xs - left:xe - left]
+        return out
+
+    def read(self, y0, y1, x0, x1):
+        """BGR uint8 copy of rows y0:y1, columns x0:x1."""
+        if not self.mapped:
+            return self._decoded[y0:y1, x0:x1].copy()
+        region = self._raw(y0, y1, x0, x1)
+        if self.dtype.itemsize == 2:
+            region = (region >> 8).astype(np.uint8)
+        if self.samples == 1:
+            region = region[..., 0]
+            if self.photometric == 0:
+                region = 255 - region
+            return cv2.cvtColor(np.ascontiguousarray(region, np.uint8), cv2.COLOR_GRAY2BGR)
+        return np.ascontiguousarray(region[..., 2::-1], np.uint8)
+
+
+class ArrayImage:
+    """The TiffImage reading interface over an in-memory or memory-mapped array."""
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape[:2]
+
+    def read(self, y0, y1, x0, x1):
+        return np.array(self.array[y0:y1, x0:x1])
+
+
+def iter_tiles(shape, tile_size=DEFAULT_TILE_SIZE):
+    """(y0, y1, x0, x1) of every tile of an image, row by row."""
+    height, width = shape[:2]
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            yield y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width)
+
+
+def padded_bounds(shape, y0, y1, x0, x1, halo):
+    """
+    Bounds of a tile grown by `halo` and clipped to the image.
+
+    Returns:
+        tuple: ((ry0, ry1, rx0, rx1) inside the image, (top, bottom, left,
+        right) padding that completes the halo outside it).
+    """
+    height, width = shape[:2]
+    ry0, ry1 = max(y0 - halo, 0), min(y1 + halo, height)
+    rx0, rx1 = max(x0 - halo, 0), min(x1 + halo, width)
+    return (ry0, ry1, rx0, rx1), (ry0 - (y0 - halo), (y1 + halo) - ry1, rx0 - (x0 - halo), (x1 + halo) - rx1)
+
+
+def pad(region, pads, border=cv2.BORDER_CONSTANT):
+    """Adds the (top, bottom, left, right) padding from padded_bounds."""
+    return cv2.copyMakeBorder(region, *pads, border, value=0) if any(pads) else region
+
+
+def read_padded(source, y0, y1, x0, x1, halo, border=cv2.BORDER_CONSTANT):
+    """
+    Reads a tile grown by `halo` pixels on every side. The part of the halo
+    outside the image is filled like OpenCV's `border` mode (zeros for
+    BORDER_CONSTANT, mirrored for BORDER_REFLECT_101), so filters run on the
+    padded tile match their full-frame result on the tile core.
+    """
+    bounds, pads = padded_bounds(source.shape, y0, y1, x0, x1, halo)
+    return pad(source.read(*bounds), pads, border)
+
+
+def downsample(source, factor, tile_size=DEFAULT_TILE_SIZE):
+    """
+    Area-averaged copy of a whole image, `factor` times smaller on each
+    side, read tile by tile.
+    """
+    height, width = source.shape[:2]
+    tile_size = max(tile_size // factor, 1) * factor
+    small = np.zeros((-(-height // factor), -(-width // factor), 3), np.uint8)
+    for y0, y1, x0, x1 in iter_tiles(source.shape, tile_size):
+        size = (-(-(x1 - x0) // factor), -(-(y1 - y0) // factor))
+        tile = cv2.resize(source.read(y0, y1, x0, x1), size, interpolation=cv2.INTER_AREA)
+        small[y0 // factor:y0 // factor + size[1], x0 // factor:x0 // factor + size[0]] = tile
+    return small
+
+
+def create_tiff(path, height, width, bigtiff=None):
+    """
+    Writes the header of an uncompressed 8-bit RGB TIFF (one strip; BigTIFF
+    when over 4 GB unless `bigtiff` says otherwise) and returns a writable
+    memory map of its pixels.
+
+    Returns:
+        np.memmap: (height, width, 3) RGB array; assign [..., ::-1] of BGR data.
+    """
+    data_bytes = height * width * 3
+    if bigtiff is None:
+        bigtiff = data_bytes > 0xFFFFFFFF - 4096
+    byte_order = "<"
+    entries = [(IMAGE_WIDTH, 4, [width]), (IMAGE_LENGTH, 4, [height]), (BITS_PER_SAMPLE, 3, [8, 8, 8]),
+               (COMPRESSION, 3, [1]), (PHOTOMETRIC, 3, [2]), (STRIP_OFFSETS, 16 if bigtiff else 4, [0]),
+               (SAMPLES_PER_PIXEL, 3, [3]), (ROWS_PER_STRIP, 4, [height]),
+               (STRIP_BYTE_COUNTS, 16 if bigtiff else 4, [data_bytes]), (PLANAR_CONFIG, 3, [1])]
+
+    offset_format, count_format, entry_format = ("Q", "Q", "HHQ") if bigtiff else ("I", "H", "HHI")
+    inline_size = 8 if bigtiff else 4
+    header_size = 16 if bigtiff else 8
+    ifd_size = struct.calcsize(count_format) + len(entries) * (4 + 2 * inline_size) + inline_size
+    extra_offset = header_size + ifd_size
+    data_offset = extra_offset + 16 + (-(extra_offset + 16) % 64)
+    entries[5] = (STRIP_OFFSETS, entries[5][1], [data_offset])
+
+    with open(path, "wb") as f:
+        if bigtiff:
+            f.write(b"II" + struct.pack("<HHHQ", 43, 8, 0, header_size))
+        else:
+            f.write(b"II" + struct.pack("<HI", 42, header_size))
+        f.write(struct.pack(byte_order + count_format, len(entries)))
+        extra = b""
+        for tag, field_type, values in entries:
+            code, size = FIELD_TYPES[field_type]
+            payload = struct.pack(byte_order + code * len(values), *values)
+            if len(payload) > inline_size:
+                value = struct.pack(byte_order + offset_format, extra_offset + len(extra))
+                extra += payload
+            else:
+                value = payload.ljust(inline_size, b"\0")
+            f.write(struct.pack(byte_order + entry_format, tag, field_type, len(values)) + value)
+        f.write(struct.pack(byte_order + offset_format, 0))
+        f.write(extra.ljust(data_offset - extra_offset, b"\0"))
+        f.truncate(data_offset + data_bytes)
+    return np.memmap(path, np.uint8, "r+", data_offset, (height, width, 3))
@@ -0,0 +1,423 @@
+import os
+import sys
+import json
+import time
+import signal
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from PipelineCore import Instrument
+from PipelineCore.BatchRunner import _init_worker, _print_outcome, _run_one
+from PipelineCore.Preprocess import IMAGE_EXTENSIONS
+
+"""
+Description:
+Watch-folder mode: keeps processing the SEM images that land in the data
+layout of the README,
+
+    data/SLM_Ti64/<run>/*.tif    -> category SLM
+    data/EBM_Ti64/<run>/*.tif    -> category EBM
+    data/Aluminum/<run>/*.tif    -> category Al
+
+(images directly in a category folder get that folder's name as run),
+through the whole chain - the StageGraph equivalent of ingest, masking,
+heatmap, crack zone, phases and Area-Colors.py - one specimen per worker
+(StageGraph.specimen_file, as `BatchRunner pipeline`).
+
+    - The folders are scanned every `interval` seconds. A new or changed
+      image is queued once it is settled: the same size and modification
+      time on every scan for `settle` seconds, so a file still being copied
+      from the microscope is left alone. The clock starts when the watcher
+      first sees that size/mtime version, not at the mtime, which copies
+      that keep the source times (robocopy, SMB, cp -p) set in the past.
+    - The queue lives in `<results>/watch_queue.sqlite`: every image with
+      its size/mtime, status (queued, running, done, skipped, failed),
+      attempts and timings. A restart resumes it - images that were running
+      are queued again, finished ones are not redone unless they change.
+    - At most `workers` processes and `max_in_flight` images at a time. A
+      worker that dies breaks the pool for every image in flight: they are
+      queued again without counting the attempt and run one at a time, so
+      only the image that kills a worker on its own is charged one attempt.
+    - Outputs go to `<results>/<category folder>/<run>/<stage>/`; with a
+      results store (ResultsStore.py) every specimen's area row is appended
+      as it finishes, and the legacy Area-Colors CSV of each run is exported
+      to `<results>/<category folder>/<run>/` whenever the queue drains.
+
+Latency is measured from the arrival of an image (the scan that first saw
+its final size/mtime version) to its area row being written. It is stored per image and summarised
+(count, mean, p50, p95, max, images/hour) in `<results>/watch_metrics.json`,
+rewritten after every scan, and by the status command:
+
+    python -m PipelineCore.Watcher watch data results --results-store results/store --workers 4
+    python -m PipelineCore.Watcher status results
+"""
+
+CATEGORY_FOLDERS = {"SLM_Ti64": "SLM", "EBM_Ti64": "EBM", "Aluminum": "Al"}
+QUEUE_NAME = "watch_queue.sqlite"
+METRICS_NAME = "watch_metrics.json"
+AREAS_CSV = "Internal_Contour_Areas_FromMasks_Structured.csv"
+
+DEFAULT_INTERVAL = 5.0   # seconds between scans
+DEFAULT_SETTLE = 10.0    # seconds without a write before an image is queued
+MAX_ATTEMPTS = 2         # runs per image version before it is marked failed
+LATENCY_WINDOW = 1000    # most recent images in the latency summary
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    category_folder TEXT, run TEXT,
+    size INTEGER, mtime_ns INTEGER,
+    status TEXT, attempts INTEGER DEFAULT 0, message TEXT,
+    arrived_at REAL, queued_at REAL, started_at REAL, finished_at REAL,
+    seconds REAL, latency_s REAL
+)
+"""
+
+
+def scan(data_root, extensions=IMAGE_EXTENSIONS):
+    """
+    Images under the category folders of `data_root`.
+
+    Yields:
+        tuple: (path, category folder, run, size, mtime_ns).
+    """
+    for category_folder in CATEGORY_FOLDERS:
+        category_dir = os.path.join(data_root, category_folder)
+        if not os.path.isdir(category_dir):
+            continue
+        for dirpath, dirnames, filenames in os.walk(category_dir):
+            # Hidden folders (thumbnails, temporary copies) are never inputs
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            relative = os.path.relpath(dirpath, category_dir)
+            run = category_folder if relative == "." else relative.replace(os.sep, "_")
+            for filename in sorted(filenames):
+                if filename.startswith(".") or not filename.lower().endswith(extensions):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # removed between listing and stat
+                yield path, category_folder, run, stat.st_size, stat.st_mtime_ns
+
+
+class WatchQueue:
+    """
+    Persistent image queue (SQLite). Only the watcher process touches it.
+
+    Args:
+        path (str): Database file.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute(_SCHEMA)
+        self.db.commit()
+
+    def resume(self):
+        """Queues again the images that were running when the watcher stopped; returns how many."""
+        count = self.db.execute("UPDATE images SET status = 'queued' WHERE status = 'running'").rowcount
+        self.db.commit()
+        return count
+
+    def observe(self, path, category_folder, run, size, mtime_ns, arrived_at, now):
+        """
+        Queues a settled image unless this version of it is already known.
+        `arrived_at` is when the watcher first saw this version.
+
+        Returns:
+            bool: True if the image was (re)queued.
+        """
+        row = self.db.execute("SELECT size, mtime_ns, status FROM images WHERE path = ?", (path,)).fetchone()
+        # A version being processed finishes first; the new one is queued on a later scan
+        if row is not None and (tuple(row[:2]) == (size, mtime_ns) or row[2] == "running"):
+            return False
+        self.db.execute(
+            "INSERT OR REPLACE INTO images (path, category_folder, run, size, mtime_ns, status, attempts, "
+            "arrived_at, queued_at) VALUES (?, ?, ?, ?, ?, 'queued', 0, ?, ?)",
+            (path, category_folder, run, size, mtime_ns, arrived_at, now))
+        self.db.commit()
+        return True
+
+    def queued(self, limit, paths=None):
+        """Up to `limit` queued images (of `paths` if given), oldest arrival first: (path, category folder, run)."""
+        if paths is None:
+            return self.db.execute("SELECT path, category_folder, run FROM images WHERE status = 'queued' "
+                                   "ORDER BY arrived_at LIMIT ?", (limit,)).fetchall()
+        paths = list(paths)
+        return self.db.execute("SELECT path, category_folder, run FROM images WHERE status = 'queued' "
+                               f"AND path IN ({', '.join('?' * len(paths))}) ORDER BY arrived_at LIMIT ?",
+                               (*paths, limit)).fetchall()
+
+    def start(self, path, now):
+        self.db.execute("UPDATE images SET status = 'running', started_at = ?, attempts = attempts + 1 "
+                        "WHERE path = ?", (now, path))
+        self.db.commit()
+
+    def requeue(self, path):
+        """Puts a running image back in the queue without counting the attempt."""
+        self.db.execute("UPDATE images SET status = 'queued', attempts = attempts - 1 WHERE path = ?", (path,))
+        self.db.commit()
+
+    def finish(self, path, status, message, seconds, now):
+        """Records an outcome; a failure with attempts left goes back to the queue."""
+        attempts = self.db.execute("SELECT attempts FROM images WHERE path = ?", (path,)).fetchone()[0]
+        if status == "failed" and attempts < MAX_ATTEMPTS:
+            status = "queued"
+        self.db.execute("UPDATE images SET status = ?, message = ?, seconds = ?, finished_at = ?, "
+                        "latency_s = CASE WHEN ? = 'done' THEN ? - arrived_at END WHERE path = ?",
+                        (status, message, seconds, now, status, now, path))
+        self.db.commit()
+        return status
+
+    def metrics(self):
+        """
+        Queue counts and the latency summary of the last LATENCY_WINDOW
+        finished images.
+
+        Returns:
+            dict: "status" counts, "latency_s" (count, mean, p50, p95, max)
+            and "images_per_hour" over the last hour.
+        """
+        counts = dict(self.db.execute("SELECT status, COUNT(*) FROM images GROUP BY status").fetchall())
+        latencies = sorted(value for (value,) in self.db.execute(
+            "SELECT latency_s FROM images WHERE status = 'done' ORDER BY finished_at DESC LIMIT ?",
+            (LATENCY_WINDOW,)))
+        summary = {"count": len(latencies)}
+        if latencies:
+            summary.update({
+                "mean": round(sum(latencies) / len(latencies), 3),
+                "p50": round(latencies[len(latencies) // 2], 3),
+                "p95": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3),
+                "max": round(latencies[-1], 3),
+            })
+        last_hour = self.db.execute("SELECT COUNT(*) FROM images WHERE status = 'done' AND finished_at >= ?",
+                                    (time.time() - 3600,)).fetchone()[0]
+        return {"status": counts, "latency_s": summary, "images_per_hour": last_hour}
+
+    def close(self):
+        self.db.close()
+
+
+def _write_metrics(path, metrics):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(metrics, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _export_areas(results_store, results_root, runs):
+    """Legacy Area-Colors CSV of every (category folder, run) that got new rows."""
+    from PipelineCore.ResultsStore import ResultsStore
+
+    store = ResultsStore(results_store)
+    for category_folder, run in sorted(runs):
+        folder = os.path.join(results_root, category_folder, run)
+        os.makedirs(folder, exist_ok=True)
+        count = store.export_csv(os.path.join(folder, AREAS_CSV), category=CATEGORY_FOLDERS[category_folder], run=run)
+        print(f"📊 {category_folder}/{run}: {count} specimens in {AREAS_CSV}")
+
+
+# === Watch Loop ===
+def _init_watch_worker(cv2_threads):
+    # Ctrl-C is the watcher's to handle: it lets the images in flight finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker(cv2_threads)
+
+
+def watch(data_root, results_root, results_store=None, workers=None, max_in_flight=None, interval=DEFAULT_INTERVAL,
+          settle=DEFAULT_SETTLE, cv2_threads=1, once=False, write_stages=("crack_zone", "phases", "areas")):
+    """
+    Watches `data_root` and processes every settled new or changed image.
+
+    Args:
+        data_root (str): Folder holding SLM_Ti64/, EBM_Ti64/ and Aluminum/.
+        results_root (str): Outputs, queue database and metrics file.
+        results_store (str): ResultsStore folder for the area rows (optional).
+        workers (int): Worker processes; defaults to the CPU count.
+        max_in_flight (int): Most images submitted at once; defaults to `workers`.
+        interval (float): Seconds between scans.
+        settle (float): Seconds an image must stay unchanged before it is queued.
+        cv2_threads (int): OpenCV threads per worker.
+        once (bool): Exit once nothing is queued or running (a catch-up run).
+        write_stages (tuple): Stages whose files are written (see StageGraph).
+
+    Returns:
+        dict: The final metrics.
+    """
+    from PipelineCore.StageGraph import specimen_file
+
+    os.makedirs(results_root, exist_ok=True)
+    if results_store is not None:
+        from PipelineCore.ResultsStore import ResultsStore
+        ResultsStore(results_store)  # fails now, not in every worker, without pyarrow
+        results_store = os.path.abspath(results_store)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max(max_in_flight or workers, 1)
+
+    queue = WatchQueue(os.path.join(results_root, QUEUE_NAME))
+    resumed = queue.resume()
+    if resumed:
+        print(f"↩ {resumed} images that were running when the watcher stopped are queued again")
+    metrics_path = os.path.join(results_root, METRICS_NAME)
+
+    seen = {}           # path -> (size, mtime_ns, first seen) on the previous scan
+    suspects = set()    # images in flight when a worker died, retried one at a time
+    touched_runs = set()
+    pool, pending = None, {}
+    next_scan = 0.0
+
+    def collect(finished):
+        """Records the outcome of finished futures; True if the pool broke."""
+        alone = len(pending) == 1
+        broken = False
+        for future in finished:
+            path, category_folder, run = pending.pop(future)
+            try:
+                outcome = future.result()
+            except BrokenProcessPool:
+                broken = True
+                if not alone:
+                    # Any image in flight may have killed the worker: no attempt is charged
+                    queue.requeue(path)
+                    suspects.add(path)
+                    continue
+                outcome = {"file": os.path.basename(path), "status": "failed", "seconds": None,
+                           "message": "Worker process died while processing this file"}
+            suspects.discard(path)
+            status = queue.finish(path, outcome["status"], outcome["message"], outcome["seconds"], time.time())
+            _print_outcome(outcome)
+            if status == "done":
+                touched_runs.add((category_folder, run))
+            elif status == "queued":
+                print(f"↻ {outcome['file']} queued again")
+        return broken
+
+    try:
+        while True:
+            now = time.time()
+            if now >= next_scan:
+                # Settled: the same version on every scan for `settle` s. With --once
+                # there is no later scan, so only the modification time can tell.
+                for path, category_folder, run, size, mtime_ns in scan(data_root):
+                    previous = seen.get(path)
+                    unchanged = previous is not None and previous[:2] == (size, mtime_ns)
+                    first_seen = previous[2] if unchanged else now
+                    seen[path] = (size, mtime_ns, first_seen)
+                    settled = now - mtime_ns / 1e9 >= settle if once else unchanged and now - first_seen >= settle
+                    if settled:
+                        if queue.observe(path, category_folder, run, size, mtime_ns, first_seen, now):
+                            print(f"📥 Queued {os.path.relpath(path, data_root)}")
+                next_scan = now + interval
+
+            if pool is None:
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_watch_worker, initargs=(cv2_threads,))
+            if suspects and not pending:
+                # Suspects no longer queued (removed, or failed for other reasons) are not waited for
+                suspects &= {path for path, _, _ in queue.queued(len(suspects), suspects)}
+            if suspects:
+                # After a worker died, the images that were in flight run alone until the culprit is found
+                batch = [] if pending else queue.queued(1, suspects)
+            else:
+                batch = queue.queued(max_in_flight - len(pending))
+            for path, category_folder, run in batch:
+                kwargs = {"input_dir": os.path.dirname(path),
+                          "output_dir": os.path.join(results_root, category_folder, run),
+                          "write_stages": write_stages, "overlays": "none", "results_store": results_store,
+                          "category": CATEGORY_FOLDERS[category_folder], "run": run}
+                queue.start(path, time.time())
+                pending[pool.submit(_run_one, specimen_file, os.path.basename(path), kwargs)] = (path, category_folder, run)
+
+            finished = set()
+            if pending:
+                finished, _ = wait(pending, timeout=max(next_scan - time.time(), 0), return_when=FIRST_COMPLETED)
+            if collect(finished):
+                # A dead worker breaks the pool: the other running images go back to the queue
+                for path, _, _ in pending.values():
+                    queue.requeue(path)
+                    suspects.add(path)
+                pending = {}
+                pool.shutdown(cancel_futures=True)
+                pool = None
+
+            idle = not pending and not queue.queued(1)
+            if idle and touched_runs:
+                if results_store is not None:
+                    _export_areas(results_store, results_root, touched_runs)
+                touched_runs = set()
+            metrics = queue.metrics()
+            metrics.update({"in_flight": len(pending), "updated_at": time.time()})
+            _write_metrics(metrics_path, metrics)
+
+            if idle and once:
+                return metrics
+            if not pending:
+                time.sleep(max(next_scan - time.time(), 0))
+    except KeyboardInterrupt:
+        if pending:
+            print(f"⏹ Stopping after the {len(pending)} images in flight (Ctrl-C again to leave them for the next start)")
+            try:
+                collect(wait(pending)[0])
+            except KeyboardInterrupt:
+                pass
+        # Images still marked running are queued again on the next start
+        print("⏹ Stopped; the queue resumes on the next start")
+        return queue.metrics()
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        queue.close()
+
+
+def print_status(results_root):
+    path = os.path.join(results_root, QUEUE_NAME)
+    if not os.path.exists(path):
+        raise SystemExit(f"No watch queue in {results_root}")
+    queue = WatchQueue(path)
+    metrics = queue.metrics()
+    queue.close()
+    print("📋 " + ", ".join(f"{status} {count}" for status, count in sorted(metrics["status"].items())))
+    latency = metrics["latency_s"]
+    if latency["count"]:
+        print(f"⏱ Arrival -> area row over the last {latency['count']} images: mean {latency['mean']:.1f} s, "
+              f"p50 {latency['p50']:.1f} s, p95 {latency['p95']:.1f} s, max {latency['max']:.1f} s; "
+              f"{metrics['images_per_hour']} images in the last hour")
+    return metrics
+
+
+# === Command Line ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process SEM images continuously as they arrive.")
+    parser.add_argument("command", choices=["watch", "status"])
+    parser.add_argument("paths", nargs="+", help="watch: <data_root> <results_root>; status: <results_root>")
+    parser.add_argument("--results-store", help="Append the area rows to this results store (needs pyarrow)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Images submitted at once (default: workers)")
+    parser.add_argument("--cv2-threads", type=int, default=1, help="OpenCV threads per worker")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between scans")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE,
+                        help="Seconds an image must stay unchanged before it is queued")
+    parser.add_argument("--once", action="store_true", help="Process what is there and exit")
+    parser.add_argument("--trace", help="Append per-image timing records to this JSON-lines file")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        print_status(args.paths[0])
+        return 0
+    if len(args.paths) != 2:
+        raise SystemExit("watch needs <data_root> <results_root>")
+    if args.trace:
+        Instrument.enable(args.trace)
+    watch(args.paths[0], args.paths[1], args.results_store, args.workers, args.max_in_flight, args.interval,
+          args.settle, args.cv2_threads, args.once)
+    Instrument.finish()
+    print_status(args.paths[1])
+    return 0
+
+
+if __name__ == "__main__":
+    # Run through the package module so workers and stages share one FileSkipped class
+    from PipelineCore.Watcher import main as package_main
+    sys.exit(package_main())
@@ -0,0 +1,6 @@
+"""
+Shared building blocks for the fractographic pipeline.
+
+The notebook and the scripts under ExtractionPhase/ and CorlorsContours/
+import their heavy lifting from here so every stage runs the same code.
+"""
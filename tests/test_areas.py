@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+import pytest
+
+from PipelineCore.Areas import geometry_area
+from PipelineCore.PhaseExtractor import render_mask
+
+"""
+Description:
+The pixel-equivalent area of a phase geometry (Areas.geometry_area) must
+match the pixel count of its filled mask (PhaseExtractor.render_mask), the
+value Area-Colors.py used to read from the mask PNGs.
+"""
+
+SHAPE = (1024, 1280)
+# Rasterisation tolerance of the pixel-equivalent estimate (~0.1% on ellipses)
+TOLERANCE = 0.005
+
+
+def ellipse_phase(centre, axes, angle):
+    return {"kind": "ellipse", "ellipse": (centre, axes, angle), "thickness": 10, "phase": "blue"}
+
+
+@pytest.mark.parametrize("centre, axes, angle", [
+    ((640.0, 512.0), (700.0, 500.0), 0.0),
+    ((600.5, 480.25), (820.0, 610.0), 37.5),
+    ((300.0, 700.0), (151.0, 389.0), 112.0),
+    ((200.0, 150.0), (600.0, 420.0), 20.0),     # clipped by the top-left corner
+    ((1200.0, 512.0), (400.0, 900.0), 90.0),   # clipped by the right edge
+])
+def test_ellipse_area_matches_mask(centre, axes, angle):
+    result = ellipse_phase(centre, axes, angle)
+    pixels = cv2.countNonZero(render_mask(result, SHAPE))
+    _, pixel_equivalent = geometry_area(result, SHAPE)
+    assert abs(pixel_equivalent - pixels) <= TOLERANCE * pixels
+
+
+def test_polygon_area_matches_mask():
+    t = np.linspace(0, 2 * np.pi, 400, endpoint=False)
+    radius = 300 + 40 * np.sin(5 * t)
+    points = np.stack([640 + radius * np.cos(t), 512 + radius * np.sin(t)], axis=1)
+    result = {"kind": "contour", "points": points.astype(np.int32).reshape(-1, 1, 2), "thickness": 10}
+    pixels = cv2.countNonZero(render_mask(result, SHAPE))
+    _, pixel_equivalent = geometry_area(result, SHAPE)
+    assert abs(pixel_equivalent - pixels) <= TOLERANCE * pixels
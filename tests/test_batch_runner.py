@@ -0,0 +1,40 @@
+import os
+import time
+
+from PipelineCore.BatchRunner import FileSkipped, run_batch
+
+"""
+Description:
+A worker that dies breaks the pool for every file in flight with it; only
+the file that kills its worker must be reported as failed.
+"""
+
+CRASHING_FILE = "crash.png"
+
+
+def crashing_task(filename):
+    """Per-file stage whose worker dies on CRASHING_FILE; the others take a while, so they share the pool with it."""
+    if filename == CRASHING_FILE:
+        time.sleep(0.05)
+        os._exit(1)
+    if filename == "empty.png":
+        raise FileSkipped("nothing to do")
+    time.sleep(0.2)
+    return f"processed {filename}"
+
+
+def test_crash_fails_only_its_own_file():
+    filenames = [f"s{i}.png" for i in range(6)] + [CRASHING_FILE, "empty.png"]
+    report = run_batch(crashing_task, filenames, workers=4, verbose=False)
+
+    assert [outcome["file"] for outcome in report["failed"]] == [CRASHING_FILE]
+    assert "Worker process died" in report["failed"][0]["message"]
+    assert sorted(outcome["file"] for outcome in report["done"]) == sorted(filenames[:6])
+    assert [outcome["file"] for outcome in report["skipped"]] == ["empty.png"]
+
+
+def test_crash_with_one_worker():
+    report = run_batch(crashing_task, [CRASHING_FILE, "s0.png"], workers=1, verbose=False)
+
+    assert [outcome["file"] for outcome in report["failed"]] == [CRASHING_FILE]
+    assert [outcome["file"] for outcome in report["done"]] == ["s0.png"]
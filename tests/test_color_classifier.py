@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+import pytest
+
+from PipelineCore.ColorClassifier import HSVLookupClassifier
+from PipelineCore.CrackZone import COLOR_RANGES
+from PipelineCore.PhaseExtractor import PHASE_PARAMS, PINK_RANGE
+
+"""
+Description:
+HSVLookupClassifier masks must be bit-identical to the cv2.inRange OR chains
+they replace, on random frames and on every color whose HSV value lies on,
+or one step either side of, a range bound.
+"""
+
+CLASSES = {
+    **{phase: params["ranges"] for phase, params in PHASE_PARAMS.items()},
+    "pink": [PINK_RANGE],
+    "crack_zone_red": COLOR_RANGES["dark_red"] + COLOR_RANGES["red"],
+    "crack_zone_orange": COLOR_RANGES["orange"],
+}
+
+
+def in_range_chain(img, ranges):
+    """The masks as the scripts built them: OR of cv2.inRange over the HSV image."""
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    mask = np.zeros(img.shape[:2], np.uint8)
+    for lower, upper in ranges:
+        mask = cv2.bitwise_or(mask, cv2.inRange(hsv, np.array(lower), np.array(upper)))
+    return mask
+
+
+@pytest.fixture(scope="module")
+def all_colors():
+    """Every 24-bit BGR color (one per row) and its HSV value."""
+    index = np.arange(1 << 24, dtype=np.uint32)
+    colors = np.stack([index & 255, (index >> 8) & 255, index >> 16], axis=1).astype(np.uint8)
+    hsv = cv2.cvtColor(colors.reshape(-1, 1, 3), cv2.COLOR_BGR2HSV).reshape(-1, 3)
+    return colors, hsv
+
+
+def boundary_frame(all_colors, ranges):
+    """N x 1 BGR frame of the colors whose H, S or V is within one step of a bound."""
+    colors, hsv = all_colors
+    near = np.zeros(len(colors), bool)
+    for lower, upper in ranges:
+        for channel in range(3):
+            for bound in (lower[channel], upper[channel]):
+                near |= np.abs(hsv[:, channel].astype(np.int16) - bound) <= 1
+    return colors[near].reshape(-1, 1, 3)
+
+
+@pytest.mark.parametrize("name", CLASSES)
+def test_masks_match_in_range(name, all_colors):
+    ranges = CLASSES[name]
+    classifier = HSVLookupClassifier({name: ranges, "other": CLASSES["blue"]})
+    rng = np.random.default_rng(0)
+    frames = [
+        rng.integers(0, 256, (257, 311, 3), dtype=np.uint8),
+        boundary_frame(all_colors, ranges),
+    ]
+    for frame in frames:
+        expected = in_range_chain(frame, ranges)
+        assert np.array_equal(classifier.masks(frame)[name], expected)
+        assert np.array_equal(classifier.mask(classifier.classify(frame), name), expected)
@@ -0,0 +1,36 @@
+import cv2
+import numpy as np
+import pytest
+
+from PipelineCore.Heatmap import WINDOW_SIZE, WINDOW_STEP, compare_with_reference
+
+"""
+Description:
+The compat heatmap engine (get_heatmap(mode="compat")) must reproduce the
+original per-window loop (get_heatmap_reference) pixel for pixel.
+"""
+
+
+def synthetic_specimen(height, width, seed=0):
+    """Noisy SEM-like frame with a few bright features and an elliptical specimen contour."""
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    img = cv2.GaussianBlur(img, (7, 7), 0)
+    for _ in range(8):
+        centre = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(img, centre, int(rng.integers(5, min(height, width) // 6)), (255, 255, 255), -1)
+    contour = cv2.ellipse2Poly((width // 2, height // 2), (width * 2 // 5, height * 2 // 5), 0, 0, 360, 2)
+    return img, contour.reshape(-1, 1, 2).astype(np.int32)
+
+
+@pytest.mark.parametrize("height, width, window_size, window_step", [
+    (400, 400, WINDOW_SIZE, WINDOW_STEP),
+    (333, 517, WINDOW_SIZE, WINDOW_STEP),
+    (517, 333, WINDOW_SIZE, WINDOW_STEP),
+    (300, 300, 51, 7),
+    (257, 311, 64, 5),
+])
+def test_compat_matches_reference(height, width, window_size, window_step):
+    img, contour = synthetic_specimen(height, width)
+    report = compare_with_reference(img, contour, window_size, window_step)
+    assert report == {"mismatched_pixels": 0, "max_abs_diff": 0}
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from PipelineCore.Morphology import LARGE_KERNEL, check_parity
+
+"""
+Description:
+Morphology.py must be pixel-identical to cv2.dilate / cv2.erode /
+cv2.morphologyEx for kernels on both sides of LARGE_KERNEL, and dilate_chain
+to successive cv2.dilate calls.
+"""
+
+SIZES = (3, 5, 25, LARGE_KERNEL - 1, LARGE_KERNEL, LARGE_KERNEL + 1, 180, 200)
+SHAPE = (241, 317)
+
+
+def random_mask(density, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.where(rng.random(SHAPE) < density, 255, 0).astype(np.uint8)
+
+
+def border_mask():
+    """Blobs touching every edge and corner of the frame."""
+    mask = np.zeros(SHAPE, np.uint8)
+    mask[:30, :] = 255
+    mask[:, -12:] = 255
+    mask[-1, :50] = 255
+    mask[100:140, 0] = 255
+    mask[-20:, -20:] = 255
+    return mask
+
+
+MASKS = {
+    "sparse": random_mask(0.001),
+    "dense": random_mask(0.3, seed=1),
+    "empty": np.zeros(SHAPE, np.uint8),
+    "full": np.full(SHAPE, 255, np.uint8),
+    "border": border_mask(),
+    "single_corner_pixel": np.pad(np.full((1, 1), 255, np.uint8), ((0, SHAPE[0] - 1), (0, SHAPE[1] - 1))),
+}
+
+
+@pytest.mark.parametrize("name", MASKS)
+def test_parity_with_opencv(name):
+    report = check_parity(MASKS[name], SIZES)
+    assert "dilate_chain" in report
+    assert {operation: count for operation, count in report.items() if count} == {}
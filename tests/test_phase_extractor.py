@@ -0,0 +1,84 @@
+from functools import lru_cache
+
+import cv2
+import numpy as np
+import pytest
+
+from PipelineCore.PhaseExtractor import (
+    DARK_RED_ELLIPSE_PARAMS, PHASE_PARAMS, PhaseSkipped, build_context, crack_zone, extract_phase, render_mask,
+)
+
+"""
+Description:
+Phases extracted inside the crack-zone ROI must render the same masks as the
+same extraction run over the whole frame, including crack zones whose padded
+box is clipped by the frame edge.
+"""
+
+# Large enough that even blue's padded box (roi_margin ~500 px) is a real crop
+SIZE = 1400
+RADIUS = 120
+
+# name -> (phase, params); the dark red ellipse method has its own margins
+PARAMS = {phase: (phase, params) for phase, params in PHASE_PARAMS.items()}
+PARAMS["dark_red_ellipse"] = ("dark_red", DARK_RED_ELLIPSE_PARAMS)
+
+# Crack-zone centres: frame centre, near each edge, near a corner, cut by the edge
+CENTRES = {
+    "centre": (700, 700),
+    "left": (150, 700),
+    "top": (700, 130),
+    "right": (1260, 650),
+    "bottom_right": (1270, 1280),
+    "cut_by_edge": (30, 500),
+}
+
+
+@lru_cache(maxsize=None)
+def highlighted_heatmap(where, seed=0):
+    """Jet-coloured heat field hottest at CENTRES[where], circled in pink like ExtractCrackArea."""
+    rng = np.random.default_rng(seed)
+    centre = CENTRES[where]
+    yy, xx = np.mgrid[0:SIZE, 0:SIZE].astype(np.float32)
+    cx, cy = centre
+    field = np.exp(-((xx - cx) ** 2 + (yy - cy) ** 2) / (2 * (RADIUS * 0.8) ** 2))
+    noise = cv2.GaussianBlur(rng.random((SIZE, SIZE)).astype(np.float32), (0, 0), 8)
+    heat = np.uint8(np.clip(field * 0.85 + noise * 0.3, 0, 1) * 255)
+    img = cv2.applyColorMap(heat, cv2.COLORMAP_JET)
+    cv2.circle(img, centre, RADIUS, (255, 0, 255), 6)
+    return img
+
+
+def extract(img, name, full_frame):
+    phase, params = PARAMS[name]
+    ctx = build_context(img, [params])
+    if full_frame:
+        # A margin larger than the frame clips the ROI to the whole image
+        ctx["roi_margin"] = 2 * SIZE
+    try:
+        return render_mask(extract_phase(ctx, phase, params), img.shape[:2])
+    except PhaseSkipped as reason:
+        return str(reason)
+
+
+@pytest.mark.parametrize("name", PARAMS)
+@pytest.mark.parametrize("where", CENTRES)
+def test_roi_matches_full_frame(where, name):
+    img = highlighted_heatmap(where)
+    cropped = extract(img, name, full_frame=False)
+    full = extract(img, name, full_frame=True)
+    if isinstance(full, str):
+        assert cropped == full
+    else:
+        assert isinstance(cropped, np.ndarray), cropped
+        assert np.array_equal(cropped, full)
+
+
+@pytest.mark.parametrize("name", PARAMS)
+def test_roi_is_clipped_at_frame_edge(name):
+    """The edge case above really crops: the box starts at the frame edge and ends inside it."""
+    _, params = PARAMS[name]
+    ctx = build_context(highlighted_heatmap("cut_by_edge"), [params])
+    y0, y1, x0, x1 = crack_zone(ctx, params)["roi"]
+    assert x0 == 0
+    assert x1 < SIZE
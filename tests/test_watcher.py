@@ -0,0 +1,43 @@
+import os
+import time
+import sqlite3
+
+import PipelineCore.StageGraph
+from PipelineCore.Watcher import MAX_ATTEMPTS, QUEUE_NAME, watch
+
+"""
+Description:
+A worker that dies breaks the watcher's pool for every image in flight;
+only the image that kills its worker on its own may be charged attempts.
+"""
+
+CRASHING_FILE = "crash.tif"
+
+
+def crashing_specimen_file(filename, input_dir, output_dir, **kwargs):
+    """Stands in for StageGraph.specimen_file; the worker dies on CRASHING_FILE."""
+    if filename == CRASHING_FILE:
+        time.sleep(0.05)
+        os._exit(1)
+    time.sleep(0.2)
+    return f"processed {filename}"
+
+
+def test_crash_charges_only_its_own_image(tmp_path, monkeypatch):
+    # Workers are forked, so they run the patched function too
+    monkeypatch.setattr(PipelineCore.StageGraph, "specimen_file", crashing_specimen_file)
+    run_dir = tmp_path / "data" / "SLM_Ti64" / "P1"
+    run_dir.mkdir(parents=True)
+    names = [f"S{i}.tif" for i in range(5)] + [CRASHING_FILE]
+    for name in names:
+        (run_dir / name).write_bytes(b"tif")
+
+    results = tmp_path / "results"
+    metrics = watch(str(tmp_path / "data"), str(results), workers=3, interval=0.1, settle=0, once=True)
+
+    db = sqlite3.connect(results / QUEUE_NAME)
+    rows = {os.path.basename(path): (status, attempts)
+            for path, status, attempts in db.execute("SELECT path, status, attempts FROM images")}
+    assert rows.pop(CRASHING_FILE) == ("failed", MAX_ATTEMPTS)
+    assert rows == {name: ("done", 1) for name in names if name != CRASHING_FILE}
+    assert metrics["status"] == {"done": 5, "failed": 1}